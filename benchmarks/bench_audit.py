@@ -0,0 +1,149 @@
+"""
+監査用まとめブック（inspection.audit）のベンチマーク
+
+合成した検査履歴（検査ごとに別々の写真）から、検査件数を変えてまとめブックを作り、
+通常モードの openpyxl で全シート・全画像をメモリに載せて保存する方法（従来の作り方）と
+write_only モードの inspection.audit を比べる。件数を増やしても audit のピーク RSS が
+ほぼ変わらないことを確認する
+
+各ケースは別プロセスで実行し、所要時間・ピーク RSS・出力サイズを表示する
+
+    python benchmarks/bench_audit.py
+    python benchmarks/bench_audit.py --inspections 50 200 800 --photos 5
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+MODES = ("naive", "combined", "sheets")
+
+
+# ========== 合成データ ==========
+
+def populate(directory, inspections, photos):
+    """検査履歴と写真ストアを作る（写真は検査・項目ごとに内容を変える）"""
+    from PIL import Image, ImageDraw
+
+    from inspection import report
+    from inspection.history import InspectionHistory
+    from inspection.photo_store import PhotoStore
+
+    template = report.load_manual_template(str(ROOT / "manual.xlsx"))
+    items = template['items']
+    history = InspectionHistory(Path(directory) / "history.sqlite3")
+    store = PhotoStore(Path(directory) / "photos", max_bytes=10 * 1024 ** 3)
+    base = Image.effect_noise((1600, 1200), 40).convert("RGB")
+
+    for index in range(inspections):
+        photo_refs = {}
+        for position in range(photos):
+            img = base.copy()
+            ImageDraw.Draw(img).rectangle((0, 0, 400, 300), fill=(index * 37 % 256, position * 53 % 256, 128))
+            buffer = BytesIO()
+            img.save(buffer, format="JPEG", quality=85)
+            photo_refs[items[position]['id']] = store.put(buffer.getvalue())
+        history.save_inspection(
+            {'serial': f"SN{index:05d}", 'in_no': f"IN{index:05d}", 'lot_no': f"LOT{index // 20:03d}",
+             'writer': "山田", 'reviewer': "佐藤", 'inspection_date': f"2026-06-{index % 28 + 1:02d}"},
+            {item['id']: (index + position) % 9 != 0 for position, item in enumerate(items)},
+            photo_refs, items, template['version']
+        )
+
+
+# ========== 計測対象（子プロセスで実行） ==========
+
+def build_naive(history, store, out_path):
+    """従来の作り方：通常モードのブックに検査ごとのシートとサムネイル（メモリ上の PNG）を追加して保存"""
+    import openpyxl
+    from openpyxl.drawing.image import Image as XLImage
+
+    from inspection.audit import sheet_title
+    from inspection.photos import make_thumbnails
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    count = 0
+    for inspection in history.iter_inspections():
+        ws = wb.create_sheet(sheet_title(inspection))
+        ws.append(("IN.NO", inspection['in_no']))
+        ws.append(("本体S/N", inspection['serial']))
+        photo_items = [item for item in inspection['items'] if item['photo_ref']]
+        thumbnails = make_thumbnails(store.path(item['photo_ref']) for item in photo_items)
+        photo_rows = {item['item_id']: thumbnail for item, thumbnail in zip(photo_items, thumbnails)}
+        for number, item in enumerate(inspection['items'], 1):
+            row = ws.max_row + 1
+            ws.append((number, item['category'], item['description'], "可" if item['passed'] else "否"))
+            thumbnail = photo_rows.get(item['item_id'])
+            if thumbnail is not None:
+                png_data, height = thumbnail
+                ws.add_image(XLImage(BytesIO(png_data)), f"E{row}")
+                ws.row_dimensions[row].height = height * 0.75 + 4
+        count += 1
+    wb.save(out_path)
+    return count
+
+def run_child(mode, directory, out_path):
+    from inspection import audit
+    from inspection.history import InspectionHistory
+    from inspection.photo_store import PhotoStore
+
+    history = InspectionHistory(Path(directory) / "history.sqlite3")
+    store = PhotoStore(Path(directory) / "photos", max_bytes=10 * 1024 ** 3)
+    started = time.perf_counter()
+    if mode == "naive":
+        build_naive(history, store, out_path)
+    else:
+        audit.write_audit_workbook(history.iter_inspections(), out_path, mode, store.path)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': (peak if sys.platform == "darwin" else peak * 1024) / 1024 ** 2,
+        'output_mb': Path(out_path).stat().st_size / 1024 ** 2,
+    }))
+
+def measure(mode, directory):
+    out_path = Path(directory) / f"audit_{mode}.xlsx"
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", mode, str(directory), str(out_path)],
+        capture_output=True, text=True, check=True
+    )
+    out_path.unlink()
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="監査用まとめブックのピーク RSS を検査件数ごとに比較する")
+    parser.add_argument('--inspections', type=int, nargs='+', default=[25, 100, 400], help="検査の件数（複数指定可）")
+    parser.add_argument('--photos', type=int, default=5, help="1 件あたりの写真の枚数")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help="比較する作り方")
+    parser.add_argument('--child', nargs=3, metavar=("MODE", "DIR", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child(*args.child)
+        return 0
+
+    print(f"{'件数':>6}  {'作り方':<10}{'時間(s)':>10}{'ピークRSS(MB)':>15}{'出力(MB)':>10}")
+    for count in args.inspections:
+        with tempfile.TemporaryDirectory() as tmp:
+            populate(tmp, count, args.photos)
+            for mode in args.modes:
+                result = measure(mode, tmp)
+                print(f"{count:>6}  {mode:<10}{result['seconds']:>10.2f}"
+                      f"{result['peak_rss_mb']:>15.1f}{result['output_mb']:>10.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+"""
+まとめ送信（ダイジェスト）のベンチマーク
+
+ローカルの偽 SMTP サーバーを立て、N 件の検査結果を
+1 件ずつ送る場合とまとめ送信（zip / まとめブック）で送る場合の
+SMTP 接続数・メール数・送信バイト数・所要時間を比較する
+受信したまとめメールは添付を開いて、全検査の分が入っているかを確認する
+
+    python benchmarks/bench_digest.py [--inspections 20] [--photos 3] [--max-mb 15]
+"""
+
+import argparse
+import email
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from inspection import mail, report  # noqa: E402
+from inspection.outbox import XLSX_MIME, Outbox  # noqa: E402
+
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """EHLO / MAIL / RCPT / DATA / QUIT だけに応答する SMTP サーバー（STARTTLS・認証なし）"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 fake ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            with server.lock:
+                server.bytes += len(line)
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply("250-fake")
+                self.reply("250 SIZE 104857600")
+            elif command in (b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                self.reply("250 OK")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                chunks = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line == b".\r\n":
+                        break
+                    chunks.append(data_line)
+                data = b"".join(chunks)
+                with server.lock:
+                    server.bytes += len(data)
+                    server.messages.append(data)
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                break
+            else:
+                self.reply("502 Not implemented")
+
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.connections = 0
+        self.bytes = 0
+        self.messages = []
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+
+def make_photo(seed):
+    from PIL import Image
+
+    img = Image.effect_noise((800, 600), 40 + seed).convert("RGB")
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+def make_inspections(count, photos):
+    """検査 count 件分のレポート（S/N・判定・写真を少しずつ変える）と送信内容"""
+    template = report.load_manual_template(str(ROOT / "manual.xlsx"))
+    items = template['items']
+    photo_data = [make_photo(seed) for seed in range(photos)]
+    inspections = []
+    for index in range(count):
+        inspection_data = {
+            item['id']: {
+                'pass': (index + position) % 9 != 0,
+                'category': item['category'],
+                'description': item['description'],
+            }
+            for position, item in enumerate(items)
+        }
+        serial, lot_no, in_no = f"SN{index:04d}", f"LOT{index // 5:03d}", f"IN{index:04d}"
+        xlsx = report.create_excel_report(
+            inspection_data, {items[i]['id']: photo_data[i] for i in range(photos)}, items,
+            "山田", "佐藤", serial, lot_no, in_no, "2026-01-31",
+            manual_path=str(ROOT / "manual.xlsx")
+        ).getvalue()
+        attachments = [(f"inspection_{serial}.xlsx", xlsx, XLSX_MIME)]
+        summary = mail.report_summary(serial, in_no, lot_no, "山田", "佐藤", "2026-01-31", inspection_data)
+        subject, body = mail.report_email(
+            serial, in_no, lot_no, "山田", "佐藤", "2026-01-31",
+            summary['passed'], summary['failed'], attachments
+        )
+        inspections.append((subject, body, attachments, summary))
+    return inspections
+
+def run_scenario(name, inspections, server, digest_mode=None, max_bytes=15 * 1024 ** 2):
+    server.reset()
+    with tempfile.TemporaryDirectory() as tmp:
+        outbox = Outbox(
+            Path(tmp) / "outbox.sqlite3",
+            {'server': "127.0.0.1", 'port': server.port, 'email': "bench@example.com",
+             'password': "", 'starttls': False},
+            digest_mode=digest_mode or "zip", digest_max_bytes=max_bytes
+        )
+        recipients = ["qa@example.com", "lead@example.com"]
+        started = time.perf_counter()
+        for subject, body, attachments, summary in inspections:
+            if digest_mode is None:
+                # 検査ごとに送る（シフト中にばらばらに完了する想定で 1 件ごとに接続）
+                outbox.enqueue(recipients, subject, body, attachments)
+                outbox.drain_once()
+            else:
+                outbox.enqueue_digest(recipients, subject, body, attachments, summary)
+        if digest_mode is not None:
+            outbox.flush_digests(force=True)
+            while outbox.drain_once():
+                pass
+        elapsed = time.perf_counter() - started
+
+    return {
+        'name': name,
+        'connections': server.connections,
+        'messages': len(server.messages),
+        'bytes': server.bytes,
+        'seconds': elapsed,
+    }
+
+def check_digest(server, expected, digest_mode):
+    """受信したまとめメールの添付に全検査の分が入っているか"""
+    found = 0
+    for raw in server.messages:
+        message = email.message_from_bytes(raw)
+        for part in message.walk():
+            filename = part.get_filename()
+            if not filename:
+                continue
+            payload = part.get_payload(decode=True)
+            if digest_mode == "zip":
+                with zipfile.ZipFile(BytesIO(payload)) as archive:
+                    found += len(archive.namelist())
+            else:
+                import openpyxl
+                wb = openpyxl.load_workbook(BytesIO(payload), read_only=True)
+                found += sum(1 for _ in wb["一覧"].iter_rows(min_row=2))
+    return found == expected, found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="まとめ送信と 1 件ずつの送信を偽 SMTP サーバーで比較する")
+    parser.add_argument('--inspections', type=int, default=20, help="検査の件数")
+    parser.add_argument('--photos', type=int, default=3, help="1 件あたりの写真の枚数")
+    parser.add_argument('--max-mb', type=float, default=15.0, help="まとめたメール 1 通の上限（MB）")
+    args = parser.parse_args(argv)
+
+    inspections = make_inspections(args.inspections, args.photos)
+    total = sum(len(data) for _, _, attachments, _ in inspections for _, data, _ in attachments)
+    print(f"検査 {len(inspections)} 件  添付合計 {total / 1024 ** 2:.1f} MB  上限 {args.max_mb} MB/通")
+
+    server = FakeSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    max_bytes = int(args.max_mb * 1024 ** 2)
+    try:
+        print(f"{'送り方':<22}{'接続':>6}{'メール':>8}{'送信量(MB)':>12}{'時間(s)':>10}  確認")
+        for name, mode in (("1 件ずつ", None), ("まとめ（zip）", "zip"), ("まとめ（ブック）", "workbook")):
+            result = run_scenario(name, inspections, server, mode, max_bytes)
+            check = ""
+            if mode is not None:
+                ok, found = check_digest(server, len(inspections), mode)
+                check = f"{'OK' if ok else 'NG'}（{found}/{len(inspections)} 件）"
+            print(f"{result['name']:<22}{result['connections']:>6}{result['messages']:>8}"
+                  f"{result['bytes'] / 1024 ** 2:>12.2f}{result['seconds']:>10.2f}  {check}")
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+レポート作成の同時実行の負荷試験（inspection.jobs）
+
+複数の検査ステーションが同時にレポート（写真付き Excel）を作る状況を、
+セッションごとのスレッドで再現する。作り方を変えて比べる
+    inline   セッションのスレッドでそのまま作る（従来の作り方）
+    thread   JobPool(kind="thread") に投入して完了を待つ
+    process  JobPool(kind="process") に投入して完了を待つ
+
+同時に「他のユーザーの軽い再実行」を模したプローブ（数 ms の Python 処理を一定間隔で実行）を
+動かし、その遅れを測る。inline では同時に作るレポートの数だけ GIL を奪い合うため、プローブが遅れる
+
+    python benchmarks/bench_jobs.py
+    python benchmarks/bench_jobs.py --sessions 12 --photos 30 --workers 4 --modes inline process
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from inspection import report  # noqa: E402
+from inspection.jobs import JobPool, build_report_files  # noqa: E402
+
+MODES = ("inline", "thread", "process")
+
+# プローブ：PROBE_WORK 秒ぶんの Python 処理を PROBE_INTERVAL 秒ごとに実行する
+PROBE_INTERVAL = 0.05
+PROBE_WORK = 0.002
+
+
+def make_photos(directory, count, width=1600, height=1200):
+    from PIL import Image, ImageDraw
+
+    base = Image.effect_noise((width, height), 40).convert("RGB")
+    paths = []
+    for index in range(count):
+        img = base.copy()
+        ImageDraw.Draw(img).rectangle((0, 0, 300, 200), fill=(index * 41 % 256, 90, 160))
+        path = Path(directory) / f"photo_{index}.jpg"
+        img.save(path, format="JPEG", quality=85)
+        paths.append(str(path))
+    return paths
+
+def make_requests(sessions, photo_paths):
+    manual_path = str(ROOT / "manual.xlsx")
+    items = report.load_manual_template(manual_path)['items']
+    requests = []
+    for index in range(sessions):
+        requests.append({
+            'formats': ["Excel"],
+            'timestamp': f"bench_{index}",
+            'inspection_data': {
+                item['id']: {'pass': (index + position) % 7 != 0, 'category': item['category'],
+                             'description': item['description']}
+                for position, item in enumerate(items)
+            },
+            'photos': {item['id']: path for item, path in zip(items, photo_paths)},
+            'manual_items': items,
+            'writer': "山田",
+            'reviewer': "佐藤",
+            'serial': f"SN{index:04d}",
+            'lot_no': "LOT001",
+            'in_no': f"IN{index:04d}",
+            'inspection_date': "2026-06-01",
+            'manual_path': manual_path,
+            'layout': None,
+        })
+    return requests
+
+
+class Probe(threading.Thread):
+    """一定間隔で短い Python 処理を実行し、予定からの遅れを記録する"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.delays = []
+        self._finished = threading.Event()
+
+    def run(self):
+        scheduled = time.perf_counter()
+        while not self._finished.is_set():
+            end = time.perf_counter() + PROBE_WORK
+            while time.perf_counter() < end:
+                sum(range(100))
+            # 予定の開始時刻から処理が終わるまでの時間のうち、処理そのもの以外の分
+            finished = time.perf_counter()
+            self.delays.append(max(0.0, finished - scheduled - PROBE_WORK))
+            scheduled = max(scheduled + PROBE_INTERVAL, finished)
+            wait = scheduled - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+def run_mode(mode, requests, workers):
+    pool = None
+    if mode != "inline":
+        pool = JobPool(max_workers=workers, kind=mode)
+        # ワーカーの起動と読み込みは計測に含めない
+        pool.run(build_report_files, requests[0], label="warmup")
+
+    latencies = []
+    failures = []
+    lock = threading.Lock()
+
+    def session(request):
+        started = time.perf_counter()
+        if pool is None:
+            files, errors = build_report_files(request)
+        else:
+            files, errors = pool.run(build_report_files, request, label="report")
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            failures.extend(errors)
+
+    probe = Probe()
+    probe.start()
+    started = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(request,)) for request in requests]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    probe.stop()
+    if pool is not None:
+        pool.shutdown()
+
+    return {
+        'mode': mode,
+        'elapsed': elapsed,
+        'latency_p50': statistics.median(latencies),
+        'latency_max': max(latencies),
+        'probe_p50_ms': percentile(probe.delays, 0.5) * 1000,
+        'probe_p95_ms': percentile(probe.delays, 0.95) * 1000,
+        'probe_max_ms': max(probe.delays, default=0.0) * 1000,
+        'failures': len(failures),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="同時のレポート作成で他のセッションが止まるかを比較する")
+    parser.add_argument('--sessions', type=int, default=8, help="同時にレポートを作るセッション数")
+    parser.add_argument('--photos', type=int, default=20, help="1 レポートあたりの写真の枚数")
+    parser.add_argument('--workers', type=int, default=max(2, min(4, os.cpu_count() or 1)), help="ワーカー数")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help="比較する作り方")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        requests = make_requests(args.sessions, make_photos(tmp, args.photos))
+        print(f"セッション {args.sessions}  写真 {args.photos} 枚/レポート  ワーカー {args.workers}  "
+              f"CPU {os.cpu_count()}")
+        print(f"{'作り方':<10}{'全体(s)':>9}{'完了p50(s)':>12}{'完了max(s)':>12}"
+              f"{'遅れp50(ms)':>13}{'遅れp95(ms)':>13}{'遅れmax(ms)':>13}{'失敗':>6}")
+        for mode in args.modes:
+            result = run_mode(mode, requests, args.workers)
+            print(f"{result['mode']:<10}{result['elapsed']:>9.2f}{result['latency_p50']:>12.2f}"
+                  f"{result['latency_max']:>12.2f}{result['probe_p50_ms']:>13.1f}"
+                  f"{result['probe_p95_ms']:>13.1f}{result['probe_max_ms']:>13.1f}{result['failures']:>6}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+結合セル索引のマイクロベンチマーク
+
+従来の ws.merged_cells.ranges 総当たりと、build_merged_index による索引参照を
+同梱の manual.xlsx で比較する
+
+    python benchmarks/bench_merged_cells.py [--manual manual.xlsx] [--repeat 3]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import openpyxl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from inspection.excel_cells import (  # noqa: E402
+    build_merged_index,
+    resolve_checkbox_cell,
+    resolve_header_cell,
+    top_left_of,
+)
+
+HEADER_LABELS = ["IN.no", "OR.no", "本体S/N", "ロットNo", "入荷日", "検査日"]
+
+
+def linear_top_left(ws, row, col):
+    """従来方式：結合範囲を総当たりして左上セルを探す"""
+    coordinate = ws.cell(row=row, column=col).coordinate
+    for merged_range in ws.merged_cells.ranges:
+        if coordinate in merged_range:
+            min_col, min_row, max_col, max_row = merged_range.bounds
+            return (min_row, min_col)
+    return (row, col)
+
+def linear_compile(ws, rows):
+    """従来方式でヘッダーとチェック欄を解決する"""
+    for label in HEADER_LABELS:
+        for row in range(1, 11):
+            for col in range(1, 20):
+                value = ws.cell(row=row, column=col).value
+                if value and label in str(value):
+                    linear_top_left(ws, row, col + 1)
+                    break
+    for row in rows:
+        for col in range(21, 26):
+            r, c = linear_top_left(ws, row, col)
+            value = ws.cell(row=r, column=c).value
+            if value and ('□可' in str(value) or '□否' in str(value)):
+                break
+
+def indexed_compile(ws, rows):
+    """索引方式でヘッダーとチェック欄を解決する（索引の構築時間も含む）"""
+    merged_index = build_merged_index(ws)
+    for label in HEADER_LABELS:
+        resolve_header_cell(ws, label, (1, 10), merged_index)
+    for row in rows:
+        resolve_checkbox_cell(ws, row, merged_index=merged_index)
+
+def all_cells_linear(ws):
+    for row in range(1, ws.max_row + 1):
+        for col in range(1, ws.max_column + 1):
+            linear_top_left(ws, row, col)
+
+def all_cells_indexed(ws):
+    merged_index = build_merged_index(ws)
+    for row in range(1, ws.max_row + 1):
+        for col in range(1, ws.max_column + 1):
+            top_left_of(merged_index, row, col)
+
+def best_of(func, repeat, *args):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--manual', default=str(ROOT / 'manual.xlsx'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    ws = openpyxl.load_workbook(args.manual).worksheets[0]
+    rows = list(range(11, 46))
+    print(f"{args.manual}: {ws.max_row} 行 × {ws.max_column} 列, 結合範囲 {len(ws.merged_cells.ranges)} 件")
+
+    cases = [
+        ("ヘッダー + チェック欄の解決", linear_compile, indexed_compile, (ws, rows)),
+        ("全セルの左上解決", all_cells_linear, all_cells_indexed, (ws,)),
+    ]
+    for name, linear, indexed, case_args in cases:
+        t_linear = best_of(linear, args.repeat, *case_args)
+        t_indexed = best_of(indexed, args.repeat, *case_args)
+        print(f"{name}: 総当たり {t_linear * 1000:.2f} ms / 索引 {t_indexed * 1000:.2f} ms "
+              f"(x{t_linear / t_indexed:.1f})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+ほぼ同じ写真の検索（inspection.photo_index）のベンチマーク
+
+検査履歴データベースの photo_hashes 表に N 枚分の dHash を登録し、
+マルチインデックスハッシング（帯ごとのインデックス）での検索と、全件を読んで
+ハミング距離を計算する検索の時間を比べる。結果が一致することも確認する
+
+ハッシュは一様乱数（実際の写真は値が偏るため候補数はこれより多くなる）に、
+問い合わせの写真から 0〜8 ビット変えたものを混ぜる
+
+    python benchmarks/bench_photo_index.py
+    python benchmarks/bench_photo_index.py --photos 100000 300000 --max-distance 4 6 8
+"""
+
+import argparse
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from inspection import photo_index  # noqa: E402
+from inspection.history import InspectionHistory  # noqa: E402
+
+QUERIES = 20
+PLANTED = 10
+
+
+def populate(path, count, queries, rng):
+    """count 枚分のハッシュと、各問い合わせの近傍 PLANTED 枚を登録する"""
+    history = InspectionHistory(path)
+    rows = ((f"photo{index}", rng.getrandbits(64)) for index in range(count))
+    history.add_photo_hashes(rows)
+    planted = []
+    for number, query in enumerate(queries):
+        for index in range(PLANTED):
+            value = query
+            for position in rng.sample(range(64), index % 9):
+                value ^= 1 << position
+            planted.append((f"near{number}_{index}", value))
+    history.add_photo_hashes(planted)
+
+def linear_scan(conn, value, max_distance):
+    matches = []
+    for photo_ref, stored in conn.execute("SELECT photo_ref, dhash FROM photo_hashes"):
+        distance = photo_index.hamming(value, photo_index.from_signed(stored))
+        if distance <= max_distance:
+            matches.append((photo_ref, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="dHash の近傍検索（帯インデックス）と全件走査を比べる")
+    parser.add_argument('--photos', type=int, nargs='+', default=[100000, 300000], help="登録する写真の枚数")
+    parser.add_argument('--max-distance', type=int, nargs='+', default=[4, 6, 8], help="ハミング距離の上限")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    print(f"{'枚数':>8}{'距離':>6}{'索引(ms)':>10}{'p95(ms)':>10}{'全件(ms)':>10}{'一致':>6}{'件数':>6}")
+    for count in args.photos:
+        rng = random.Random(args.seed)
+        queries = [rng.getrandbits(64) for _ in range(QUERIES)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "history.sqlite3"
+            populate(path, count, queries, rng)
+            conn = sqlite3.connect(path)
+            for max_distance in args.max_distance:
+                indexed = []
+                found = 0
+                same = True
+                scan_seconds, expected = timed(linear_scan, conn, queries[0], max_distance)
+                for number, query in enumerate(queries):
+                    seconds, matches = timed(photo_index.nearest, conn, query, max_distance)
+                    indexed.append(seconds)
+                    found += len(matches)
+                    if number == 0:
+                        same = sorted(matches) == sorted(expected)
+                indexed.sort()
+                print(f"{count:>8}{max_distance:>6}{statistics.median(indexed) * 1000:>10.2f}"
+                      f"{indexed[int(len(indexed) * 0.95) - 1] * 1000:>10.2f}{scan_seconds * 1000:>10.0f}"
+                      f"{'OK' if same else 'NG':>6}{found / len(queries):>6.1f}")
+            conn.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""
+テンプレート複製のベンチマーク
+
+レポート 1 件あたりの「ワークブック準備 → 書き込み → 保存」の時間を、
+従来の load_workbook(manual.xlsx) と WorkbookTemplate.new_workbook() で比較する
+
+    python benchmarks/bench_template_pool.py [--manual manual.xlsx] [--reports 10]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+import openpyxl
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from inspection.excel_cells import safe_write_cell  # noqa: E402
+from inspection.template_pool import WorkbookTemplate  # noqa: E402
+
+
+def fill_and_save(wb, serial):
+    """レポート生成相当の書き込みと保存"""
+    ws = wb.worksheets[0]
+    safe_write_cell(ws, 'B8', serial)
+    for row in range(11, 36):
+        cell = ws.cell(row=row, column=22)
+        if cell.value:
+            cell.value = str(cell.value).replace('□可', '☑可')
+    output = BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+def measure(func, reports):
+    timings = []
+    for i in range(reports):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000, min(timings) * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--manual', default=str(ROOT / 'manual.xlsx'))
+    parser.add_argument('--reports', type=int, default=10)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    template = WorkbookTemplate(Path(args.manual).read_bytes())
+    setup_ms = (time.perf_counter() - start) * 1000
+
+    # コピー同士で値が混ざらないことを確認
+    first, second = template.new_workbook(), template.new_workbook()
+    first.worksheets[0]['V12'] = "☑可"
+    assert second.worksheets[0]['V12'].value != "☑可"
+
+    cases = [
+        ("ディスクから読込", lambda i: fill_and_save(openpyxl.load_workbook(args.manual), f"SN{i}")),
+        ("メモリ内コピー", lambda i: fill_and_save(template.new_workbook(), f"SN{i}")),
+        ("ディスクから読込（準備のみ）", lambda i: openpyxl.load_workbook(args.manual)),
+        ("メモリ内コピー（準備のみ）", lambda i: template.new_workbook()),
+    ]
+    print(f"{args.manual}: プロトタイプ作成 {setup_ms:.1f} ms（マニュアルのバージョンごとに 1 回）")
+    for name, func in cases:
+        median_ms, best_ms = measure(func, args.reports)
+        print(f"{name}: 中央値 {median_ms:.1f} ms / 最小 {best_ms:.1f} ms（{args.reports} 件）")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+起動時の import 時間の計測（python -X importtime）
+
+アプリ（inspection_form_app.py の先頭の import 文だけを実行したもの）と
+inspection パッケージの各モジュールを、それぞれ別プロセスで -X importtime 付きで import し、
+インタープリター起動分を差し引いた時間とパッケージ別の内訳を表示する
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --repeat 7 --top 15
+    python benchmarks/import_time.py -k app --output import_time.json
+"""
+
+import argparse
+import ast
+import json
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+APP_FILE = ROOT / "inspection_form_app.py"
+
+# 起動直後に重い依存を読み込んでいないか確認するモジュール
+MODULES = [
+    "inspection",
+    "inspection.report",
+    "inspection.pdf_report",
+    "inspection.photos",
+    "inspection.outbox",
+    "inspection.masters",
+    "inspection.history",
+    "inspection.drafts",
+    "inspection.export",
+    "inspection.metrics",
+]
+
+# 遅延 import にしている重い依存（import 文だけで読み込まれたら表示する）
+HEAVY = ("pandas", "openpyxl", "PIL", "reportlab", "smtplib", "pyarrow", "numpy")
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def app_imports(path=APP_FILE):
+    """アプリのモジュール直下の import 文だけを取り出す（UI は実行しない）"""
+    tree = ast.parse(Path(path).read_text(encoding="utf-8"))
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+def targets():
+    yield "app", app_imports()
+    for module in MODULES:
+        yield module, f"import {module}"
+
+def run_importtime(code):
+    """
+    -X importtime 付きで code を実行する
+    戻り値: [(自身の時間 µs, 累計 µs, 深さ, モジュール名), ...]
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in proc.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            entries.append((int(match[1]), int(match[2]), len(match[3]) // 2, match[4]))
+    return entries
+
+def total_us(entries):
+    return sum(cumulative for _, cumulative, depth, _ in entries if depth == 0)
+
+def by_package(entries):
+    """トップレベルのパッケージ名ごとに自身の時間を合計する"""
+    totals = defaultdict(int)
+    for self_us, _, _, name in entries:
+        totals[name.split(".")[0]] += self_us
+    return totals
+
+def measure(code, startup_us, startup_modules, repeat):
+    """
+    code の import 時間を repeat 回計測する（インタープリター起動分 startup_us を差し引く）
+    内訳は中央値に近い回のものを使う
+    """
+    runs = [run_importtime(code) for _ in range(repeat)]
+    totals = [total_us(entries) - startup_us for entries in runs]
+    median = statistics.median(totals)
+    entries = runs[min(range(repeat), key=lambda i: abs(totals[i] - median))]
+    modules = {name for _, _, _, name in entries} - startup_modules
+    return {
+        'ms': median / 1000,
+        'min_ms': min(totals) / 1000,
+        'modules': len(modules),
+        'heavy': sorted({name.split(".")[0] for name in modules} & set(HEAVY)),
+        'packages': {
+            package: us / 1000
+            for package, us in by_package([e for e in entries if e[3] not in startup_modules]).items()
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="-X importtime でアプリとパッケージの import 時間を計測する")
+    parser.add_argument('--repeat', type=int, default=5, help="1 対象あたりの実行回数（中央値を表示）")
+    parser.add_argument('--top', type=int, default=8, help="内訳に表示するパッケージ数")
+    parser.add_argument('-k', dest='keyword', default=None, help="対象名に含まれる文字列で絞り込む")
+    parser.add_argument('--output', default=None, help="結果を JSON で保存するパス")
+    args = parser.parse_args(argv)
+
+    # インタープリター起動時（site など）に読み込まれる分
+    baseline = [run_importtime("pass") for _ in range(args.repeat)]
+    startup_us = statistics.median(total_us(entries) for entries in baseline)
+    startup_modules = {name for _, _, _, name in baseline[0]}
+
+    results = {}
+    print(f"{'対象':<24}{'時間(ms)':>10}{'最小(ms)':>10}{'モジュール数':>12}  重い依存")
+    for name, code in targets():
+        if args.keyword and args.keyword not in name:
+            continue
+        result = measure(code, startup_us, startup_modules, args.repeat)
+        results[name] = result
+        print(f"{name:<24}{result['ms']:>10.1f}{result['min_ms']:>10.1f}{result['modules']:>12}  "
+              f"{', '.join(result['heavy']) or '-'}")
+
+    for name, result in results.items():
+        top = sorted(result['packages'].items(), key=lambda item: -item[1])[:args.top]
+        print(f"\n{name} の内訳: " + "  ".join(f"{package} {ms:.0f}ms" for package, ms in top))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,355 @@
+"""
+レポート生成ホットパスのベンチマーク
+
+合成マニュアル（行数・結合セル数を変えたもの）と同梱の manual.xlsx、
+合成検査データ（写真 0〜100 枚・解像度違い）で各処理を計測し、
+保存済みのベースラインと比較して性能の劣化を検出する
+
+計測対象:
+    load_manual          マニュアルの解析とコンパイル（キャッシュなし）
+    find_header          ヘッダー欄の検索と書き込み（find_and_write_header）
+    create_report        create_excel_report（テンプレートはキャッシュ済み。同梱と合成のマニュアル）
+    create_pdf           create_pdf_report（同じ検査データで PDF を作成。出力サイズを xlsx と比較）
+    thumbnails           写真シート用サムネイル作成
+
+各ケースは別プロセスで実行し、ウォームアップの後に繰り返し計測して
+CPU 時間・実行時間（どちらも最速値。参考に実行時間の中央値も記録）・ピーク RSS・出力サイズを記録する
+劣化の判定はそのプロセスの CPU 時間（time.process_time）の最速値で行う
+実行時間は同じマシンの他のプロセスと CPU を取り合うと数倍になるので、記録するだけで判定には使わない
+仮想マシンでは CPU 自体の速さも時間帯で 2 倍近く変わるため、CPU 時間の閾値も 2 倍にしている
+
+    python benchmarks/run_benchmarks.py                  # 計測してベースラインと比較
+    python benchmarks/run_benchmarks.py --save-baseline  # 計測結果をベースラインとして保存
+    python benchmarks/run_benchmarks.py --quick -k shipped
+
+ベースライン（benchmarks/baseline.json）はリポジトリに含める。計測する環境が変わったら
+その環境で --save-baseline を実行して更新する（python・platform・cpu_count も記録される）
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+SHIPPED_MANUAL = ROOT / "manual.xlsx"
+
+# (名前, 行数, 結合セル数)  None は同梱のマニュアル
+MANUALS = [
+    ("shipped", None, None),
+    ("small", 60, 120),
+    ("medium", 500, 1500),
+    ("large", 2400, 6000),
+]
+
+# (枚数, 幅, 高さ)
+PHOTO_SETS = [
+    (0, 0, 0),
+    (10, 1600, 1200),
+    (30, 4000, 3000),
+    (100, 1600, 1200),
+]
+
+REPORT_MAX_PHOTOS = 30
+
+# 劣化とみなす閾値（比率, 絶対値の余裕）
+# cpu_ms は最速値で比べる。同じ checkout でも 1.9 倍までぶれたので比率は 2 倍、
+# 数十 ms の短いケースは数 ms のぶれでも比率が大きく動くので余裕を 15 ms とる
+THRESHOLDS = {
+    'cpu_ms': (2.0, 15.0),
+    'peak_rss_mb': (1.20, 10.0),
+    'output_bytes': (1.10, 1024),
+}
+
+
+# ========== 合成データ ==========
+
+def make_synthetic_manual(path, rows, merges, seed=0):
+    """ヘッダー欄・検査項目行・「□可　□否」欄と指定数の結合セルを持つマニュアルを作る"""
+    import openpyxl
+
+    rng = random.Random(seed)
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "検査マニュアル"
+
+    ws['A1'] = "個別作業マニュアル【合成】"
+    labels = [(7, 1, "IN.no"), (7, 15, "OR.no"), (8, 1, "本体S/N"),
+              (8, 15, "ロットNo"), (9, 1, "入荷日"), (9, 15, "検査日")]
+    for row, col, label in labels:
+        ws.cell(row=row, column=col, value=label)
+        ws.merge_cells(start_row=row, start_column=col + 1, end_row=row, end_column=col + 12)
+    merged = len(labels)
+
+    for row in range(11, rows + 1):
+        if row % 5 == 1:
+            ws.cell(row=row, column=1, value=f"カテゴリ{row // 5}")
+        ws.cell(row=row, column=3, value="・")
+        ws.cell(row=row, column=4, value=f"検査項目 {row}：外観に傷・汚れが無いこと。")
+        ws.cell(row=row, column=22, value="□可　　　□否")
+        if merged < merges:
+            ws.merge_cells(start_row=row, start_column=22, end_row=row, end_column=25)
+            merged += 1
+        if merged < merges:
+            ws.merge_cells(start_row=row, start_column=4, end_row=row, end_column=20)
+            merged += 1
+
+    # 残りの結合セルは項目欄の右側に配置
+    row = 11
+    col = 27
+    while merged < merges:
+        width = rng.randint(1, 3)
+        ws.merge_cells(start_row=row, start_column=col, end_row=row, end_column=col + width)
+        merged += 1
+        col += width + 1
+        if col > 200:
+            col = 27
+            row += 1
+
+    wb.save(path)
+
+def make_photo(width, height, seed):
+    """ノイズ入りの JPEG（実写に近い圧縮率）"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    noise = Image.effect_noise((width // 4, height // 4), 30 + seed % 20).resize((width, height))
+    img = Image.merge("RGB", (noise, noise.rotate(90, expand=False), noise.transpose(Image.FLIP_LEFT_RIGHT)))
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=rng.randint(80, 92))
+    return buffer.getvalue()
+
+def manual_path_for(name, rows, merges, workdir):
+    if rows is None:
+        return str(SHIPPED_MANUAL)
+    path = Path(workdir) / f"manual_{name}.xlsx"
+    if not path.exists():
+        make_synthetic_manual(path, rows, merges)
+    return str(path)
+
+
+# ========== 計測ケース ==========
+
+def case_names(quick=False):
+    manuals = MANUALS[:2] if quick else MANUALS
+    photo_sets = PHOTO_SETS[:2] if quick else PHOTO_SETS
+    names = []
+    for name, _, _ in manuals:
+        names.append(f"load_manual[{name}]")
+        names.append(f"find_header[{name}]")
+    for count, width, height in photo_sets:
+        # 写真は 1 項目 1 枚なので、項目数（同梱マニュアルは 28）を超える枚数はサムネイル単体で計測する
+        if count <= REPORT_MAX_PHOTOS:
+            names.append(f"create_report[shipped,photos={count}@{width}x{height}]")
+            names.append(f"create_pdf[shipped,photos={count}@{width}x{height}]")
+    # 合成マニュアルでもレポートを作る（行数・結合セル数が増えたときの劣化を検出する）
+    for name, rows, _ in manuals:
+        if rows is not None:
+            for count, width, height in photo_sets[:2]:
+                names.append(f"create_report[{name},photos={count}@{width}x{height}]")
+    for count, width, height in photo_sets:
+        if count:
+            names.append(f"thumbnails[photos={count}@{width}x{height}]")
+    return names
+
+def _parse_case(name):
+    kind, _, rest = name.partition('[')
+    return kind, rest.rstrip(']')
+
+def _photo_spec(spec):
+    count, _, size = spec.partition('@')
+    width, _, height = size.partition('x')
+    return int(count), int(width or 0), int(height or 0)
+
+def run_case(name, workdir, repeat, warmup=2):
+    """1 ケースを計測する（子プロセス内で実行）"""
+    from inspection import report
+    from inspection.pdf_report import create_pdf_report
+    from inspection.excel_cells import build_merged_index, find_and_write_header
+    from inspection.photos import make_thumbnails
+
+    kind, arg = _parse_case(name)
+    manuals = {m[0]: m for m in MANUALS}
+    output_bytes = 0
+
+    if kind in ("load_manual", "find_header"):
+        manual_name, rows, merges = manuals[arg]
+        path = manual_path_for(manual_name, rows, merges, workdir)
+        data = Path(path).read_bytes()
+        if kind == "load_manual":
+            def func():
+                report.parse_manual(data)
+        else:
+            import openpyxl
+            ws = openpyxl.load_workbook(BytesIO(data)).worksheets[0]
+
+            def func():
+                merged_index = build_merged_index(ws)
+                for label in report.HEADER_LABELS:
+                    find_and_write_header(ws, label, "X", (1, 10), merged_index)
+
+    elif kind in ("create_report", "create_pdf"):
+        manual_name, _, photo_spec = arg.partition(',photos=')
+        count, width, height = _photo_spec(photo_spec)
+        _, rows, merges = manuals[manual_name]
+        path = manual_path_for(manual_name, rows, merges, workdir)
+        items = report.load_manual_template(path)['items']
+        inspection_data = {item['id']: {'pass': i % 7 != 0} for i, item in enumerate(items)}
+        # 写真は先頭の項目から 1 枚ずつ割り当てる
+        photos = {}
+        for i in range(min(count, len(items))):
+            photos[items[i]['id']] = make_photo(width, height, i)
+
+        def func():
+            if kind == "create_pdf":
+                output = create_pdf_report(
+                    inspection_data, photos, items, "作業者", "確認者",
+                    "SN-BENCH", "LOT-BENCH", "IN-BENCH", "2026-01-31"
+                )
+            else:
+                output = report.create_excel_report(
+                    inspection_data, photos, items, "作業者", "確認者",
+                    "SN-BENCH", "LOT-BENCH", "IN-BENCH", "2026-01-31", manual_path=path
+                )
+            return len(output.getvalue())
+
+    elif kind == "thumbnails":
+        count, width, height = _photo_spec(arg.replace('photos=', ''))
+        photos = [make_photo(width, height, i) for i in range(count)]
+
+        def func():
+            return sum(len(t[0]) for t in make_thumbnails(photos) if t)
+
+    else:
+        raise ValueError(f"unknown case: {name}")
+
+    for _ in range(max(warmup, 1)):
+        func()  # ウォームアップ（インポート・キャッシュ・ページフォールトを計測から外す）
+    timings = []
+    cpu_timings = []
+    for _ in range(repeat):
+        # 前の回のごみを片付けてから、計測中は GC を止める
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            cpu_start = time.process_time()
+            result = func()
+            cpu_timings.append((time.process_time() - cpu_start) * 1000)
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            gc.enable()
+        if isinstance(result, int):
+            output_bytes = result
+
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss_kb //= 1024
+    return {
+        'cpu_ms': round(min(cpu_timings), 3),
+        'wall_ms': round(min(timings), 3),
+        'wall_median_ms': round(statistics.median(timings), 3),
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+        'output_bytes': output_bytes,
+    }
+
+
+# ========== 比較 ==========
+
+def compare(results, baseline):
+    """ベースラインより悪化した指標を返す [(ケース, 指標, 基準, 今回)]"""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, (ratio, slack) in THRESHOLDS.items():
+            if metric not in base or not base[metric]:
+                continue
+            if metrics[metric] > base[metric] * ratio + slack:
+                regressions.append((name, metric, base[metric], metrics[metric]))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="ベースラインの JSON")
+    parser.add_argument('--save-baseline', action='store_true', help="今回の結果をベースラインとして保存")
+    parser.add_argument('--quick', action='store_true', help="小さいケースだけ実行")
+    parser.add_argument('-k', dest='keyword', default=None, help="ケース名に含まれる文字列で絞り込む")
+    parser.add_argument('--repeat', type=int, default=9, help="計測回数（最速値を使う）")
+    parser.add_argument('--warmup', type=int, default=2, help="計測前に捨てる実行回数")
+    parser.add_argument('--output', default=None, help="結果を JSON で保存するパス")
+    parser.add_argument('--workdir', default=None, help="合成マニュアルの保存先（既定: 一時ディレクトリ）")
+    parser.add_argument('--case', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        # 子プロセス：1 ケースだけ計測して JSON を出力
+        print(json.dumps(run_case(args.case, args.workdir, args.repeat, args.warmup)))
+        return 0
+
+    names = case_names(args.quick)
+    if args.keyword:
+        names = [name for name in names if args.keyword in name]
+
+    baseline = {}
+    if Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8')).get('results', {})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        Path(workdir).mkdir(parents=True, exist_ok=True)
+        print(f"{'ケース':<48} {'CPU(ms)':>10} {'時間(ms)':>10} {'RSS(MB)':>9} {'出力(KB)':>10} {'基準比':>8}")
+        for name in names:
+            proc = subprocess.run(
+                [sys.executable, __file__, '--case', name, '--repeat', str(args.repeat),
+                 '--warmup', str(args.warmup), '--workdir', workdir],
+                capture_output=True, text=True, cwd=str(ROOT)
+            )
+            if proc.returncode != 0:
+                print(f"{name:<48} 失敗\n{proc.stderr}", file=sys.stderr)
+                return 2
+            metrics = json.loads(proc.stdout.strip().splitlines()[-1])
+            results[name] = metrics
+            base = baseline.get(name, {}).get('cpu_ms')
+            ratio = f"x{metrics['cpu_ms'] / base:.2f}" if base else "-"
+            print(f"{name:<48} {metrics['cpu_ms']:>10.1f} {metrics['wall_ms']:>10.1f} "
+                  f"{metrics['peak_rss_mb']:>9.1f} {metrics['output_bytes'] / 1024:>10.1f} {ratio:>8}")
+
+    report_data = {
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'cpu_count': os.cpu_count(),
+        'results': results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report_data, ensure_ascii=False, indent=2), encoding='utf-8')
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(report_data, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"ベースラインを保存しました: {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline)
+    if not baseline:
+        print("ベースラインがありません（--save-baseline で保存できます）")
+    for name, metric, base, now in regressions:
+        print(f"⚠️ 劣化: {name} {metric} {base} → {now}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,43 @@
+"""
+入荷検査フォーム ライブラリ
+
+Streamlit に依存しない処理（Excel 操作など）をまとめたパッケージ
+
+サブモジュールは初めて参照したときに読み込む（import inspection だけでは何も読み込まない）
+    import inspection
+    inspection.report.create_excel_report(...)   # ここで openpyxl などを読み込む
+"""
+
+import importlib
+
+__all__ = [
+    "audit",
+    "batch",
+    "digest",
+    "drafts",
+    "excel_cells",
+    "export",
+    "history",
+    "jobs",
+    "mail",
+    "manuals",
+    "masters",
+    "metrics",
+    "outbox",
+    "pdf_report",
+    "photo_index",
+    "photo_store",
+    "photos",
+    "report",
+    "template_pool",
+    "text",
+]
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,264 @@
+"""
+監査用のまとめブック（複数の検査を 1 冊の Excel に）
+
+検査履歴データベースの検査を、openpyxl の write_only モードで 1 行ずつ書き出す
+- combined  全検査を 1 枚のシートに (検査, 項目) ごとの行で並べる
+- sheets    「一覧」シート + 検査ごとに 1 枚のシート
+
+写真は縮小した JPEG のサムネイルにして一時ディレクトリに書き、ブックにはファイルパスで登録する
+（保存時に 1 枚ずつ読み込まれる）。シートは書き終えたらすぐ閉じて一時ファイルに出すので、
+検査の件数が増えてもメモリに残るのは画像の位置情報などの小さなオブジェクトだけ
+
+    python -m inspection.audit audit_2025-06.xlsx --from 2025-06-01 --to 2025-06-30
+    python -m inspection.audit audit.xlsx --layout sheets --photos photos
+    python -m inspection.audit audit.xlsx --no-photos
+"""
+
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from . import metrics
+from .history import InspectionHistory
+from .photo_store import PhotoStore
+from .photos import THUMBNAIL_WORKERS, make_jpeg
+
+DEFAULT_DB = "history.sqlite3"
+DEFAULT_PHOTO_DIR = "photos"
+AUDIT_LAYOUTS = ("combined", "sheets")
+
+# サムネイルの長辺（ピクセル）と圧縮品質
+AUDIT_THUMBNAIL_PX = 120
+AUDIT_THUMBNAIL_QUALITY = 70
+
+# サムネイルを並べる列の幅（文字数）
+PHOTO_COLUMN_WIDTH = 18
+
+HEADER_FIELDS = (
+    ("IN.NO", 'in_no'), ("ロットNO", 'lot_no'), ("本体S/N", 'serial'), ("検査日", 'inspection_date'),
+    ("作業者", 'writer'), ("確認者", 'reviewer'), ("マニュアル", 'manual_version'),
+)
+COMBINED_COLUMNS = (
+    "ID", "検査日", "本体S/N", "IN.NO", "ロットNO", "作業者", "確認者",
+    "カテゴリ", "検査項目", "判定", "写真",
+)
+INDEX_COLUMNS = ("ID", "シート", "検査日", "本体S/N", "IN.NO", "ロットNO", "作業者", "不合格項目", "写真")
+ITEM_COLUMNS = ("No.", "カテゴリ", "検査項目", "判定", "写真")
+
+# シート名に使えない文字と長さの上限
+INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+MAX_SHEET_TITLE = 31
+
+
+def sheet_title(inspection):
+    """検査ごとのシート名（ID を先頭に付けるので重複しない）"""
+    label = INVALID_SHEET_CHARS.sub("_", inspection.get('serial') or inspection.get('in_no') or "")
+    title = f"{inspection['id']}_{label}" if label else str(inspection['id'])
+    return title[:MAX_SHEET_TITLE]
+
+def _judgement(passed):
+    return "可" if passed else "否"
+
+
+class _Thumbnails:
+    """
+    写真のハッシュ → 一時ディレクトリに書いたサムネイルのパス
+    検査 1 件分の写真をまとめてスレッドプールで縮小する。同じ写真は 1 回だけ縮小する
+    """
+
+    def __init__(self, directory, photo_path, max_px, quality, executor):
+        self.directory = Path(directory)
+        self.photo_path = photo_path
+        self.max_px = max_px
+        self.quality = quality
+        self.executor = executor
+        self._done = {}
+
+    def _make(self, digest):
+        source = self.photo_path(digest)
+        if source is None or not os.path.isfile(source):
+            return None
+        try:
+            data, width, height = make_jpeg(str(source), self.max_px, self.quality)
+        except Exception:
+            return None
+        target = self.directory / f"{digest}.jpg"
+        target.write_bytes(data)
+        return str(target), width, height
+
+    def prepare(self, inspection):
+        digests = {item['photo_ref'] for item in inspection['items'] if item['photo_ref']} - set(self._done)
+        if not digests:
+            return
+        digests = sorted(digests)
+        with metrics.timed("audit_thumbnails"):
+            for digest, result in zip(digests, self.executor.map(self._make, digests)):
+                self._done[digest] = result
+
+    def get(self, digest):
+        return self._done.get(digest) if digest else None
+
+
+def _add_thumbnail(ws, thumbnails, digest, column, row):
+    """サムネイルを貼り付けて行の高さをそろえる。戻り値: 貼り付けたか"""
+    from openpyxl.drawing.image import Image as XLImage
+
+    thumbnail = thumbnails.get(digest) if thumbnails else None
+    if thumbnail is None:
+        return False
+    path, _, height = thumbnail
+    image = XLImage(path)
+    ws.add_image(image, f"{column}{row}")
+    # ピクセル → ポイント（96dpi）
+    ws.row_dimensions[row].height = height * 0.75 + 4
+    return True
+
+def _append(ws, row_number, values):
+    """
+    1 行書き出す（write_only モードでは書いた行はもう変更できない）
+    書き出し済みの行の高さ指定は不要なので捨てる（行数ぶん溜めない）
+    """
+    ws.append(values)
+    ws.row_dimensions.pop(row_number, None)
+    return row_number + 1
+
+def _write_combined(wb, inspections, thumbnails, stats):
+    ws = wb.create_sheet("検査結果")
+    photo_column = "K"
+    for column, width in (("B", 12), ("C", 16), ("H", 14), ("I", 50), (photo_column, PHOTO_COLUMN_WIDTH)):
+        ws.column_dimensions[column].width = width
+    ws.freeze_panes = "A2"
+    row = _append(ws, 1, COMBINED_COLUMNS)
+
+    for inspection in inspections:
+        if thumbnails:
+            thumbnails.prepare(inspection)
+        for item in inspection['items']:
+            has_photo = _add_thumbnail(ws, thumbnails, item['photo_ref'], photo_column, row)
+            row = _append(ws, row, (
+                inspection['id'], inspection['inspection_date'], inspection['serial'],
+                inspection['in_no'], inspection['lot_no'], inspection['writer'], inspection['reviewer'],
+                item['category'], item['description'] or item['item_id'], _judgement(item['passed']),
+                None if has_photo else ("（写真なし）" if item['photo_ref'] else None),
+            ))
+            stats['items'] += 1
+            stats['photos'] += has_photo
+        stats['inspections'] += 1
+
+def _write_inspection_sheet(wb, inspection, thumbnails, stats):
+    ws = wb.create_sheet(sheet_title(inspection))
+    photo_column = "E"
+    for column, width in (("A", 12), ("B", 16), ("C", 50), (photo_column, PHOTO_COLUMN_WIDTH)):
+        ws.column_dimensions[column].width = width
+
+    row = 1
+    for label, key in HEADER_FIELDS:
+        row = _append(ws, row, (label, inspection.get(key)))
+    row = _append(ws, row, ())
+    row = _append(ws, row, ITEM_COLUMNS)
+
+    if thumbnails:
+        thumbnails.prepare(inspection)
+    photos = 0
+    for number, item in enumerate(inspection['items'], 1):
+        has_photo = _add_thumbnail(ws, thumbnails, item['photo_ref'], photo_column, row)
+        row = _append(ws, row, (
+            number, item['category'], item['description'] or item['item_id'], _judgement(item['passed']),
+            None if has_photo else ("（写真なし）" if item['photo_ref'] else None),
+        ))
+        photos += has_photo
+
+    # 書き終えたシートは閉じて一時ファイルに出す（開いたままにしない）
+    ws.close()
+    stats['items'] += len(inspection['items'])
+    stats['photos'] += photos
+    stats['inspections'] += 1
+    return ws.title, photos
+
+def _write_sheets(wb, inspections, thumbnails, stats):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.worksheet.hyperlink import Hyperlink
+
+    index = wb.create_sheet("一覧")
+    index.column_dimensions["B"].width = 24
+    index.freeze_panes = "A2"
+    index_row = _append(index, 1, INDEX_COLUMNS)
+
+    for inspection in inspections:
+        title, photos = _write_inspection_sheet(wb, inspection, thumbnails, stats)
+        link = WriteOnlyCell(index, value=title)
+        link.hyperlink = Hyperlink(ref="", location=f"'{title}'!A1")
+        index_row = _append(index, index_row, (
+            inspection['id'], link, inspection['inspection_date'], inspection['serial'],
+            inspection['in_no'], inspection['lot_no'], inspection['writer'],
+            sum(1 for item in inspection['items'] if not item['passed']), photos,
+        ))
+
+def write_audit_workbook(inspections, path, layout="combined", photo_path=None,
+                         thumbnail_px=AUDIT_THUMBNAIL_PX, quality=AUDIT_THUMBNAIL_QUALITY,
+                         max_workers=THUMBNAIL_WORKERS):
+    """
+    検査（InspectionHistory.get() と同じ形式の辞書）を順に読みながら監査用のブックを書き出す
+    inspections: イテレーター（ジェネレーターでよい。先読みしない）
+    photo_path: 写真のハッシュ → ファイルパスを返す関数（None なら写真を載せない）
+    戻り値: {'inspections': 件数, 'items': 行数, 'photos': 貼り付けた写真の枚数}
+    """
+    import openpyxl
+
+    if layout not in AUDIT_LAYOUTS:
+        raise ValueError(f"未対応のレイアウトです: {layout!r}（{' / '.join(AUDIT_LAYOUTS)}）")
+
+    stats = {'inspections': 0, 'items': 0, 'photos': 0}
+    wb = openpyxl.Workbook(write_only=True)
+    with tempfile.TemporaryDirectory(prefix="audit-") as tmp, \
+            ThreadPoolExecutor(max_workers=max_workers) as executor:
+        thumbnails = None
+        if photo_path is not None:
+            thumbnails = _Thumbnails(tmp, photo_path, thumbnail_px, quality, executor)
+        with metrics.timed("audit_rows"):
+            if layout == "combined":
+                _write_combined(wb, inspections, thumbnails, stats)
+            else:
+                _write_sheets(wb, inspections, thumbnails, stats)
+        with metrics.timed("audit_save"):
+            wb.save(path)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="検査履歴から監査用のまとめブック（写真のサムネイル付き）を作る")
+    parser.add_argument('output', help="出力する .xlsx")
+    parser.add_argument('--db', default=DEFAULT_DB, help="検査履歴データベース")
+    parser.add_argument('--layout', choices=AUDIT_LAYOUTS, default="combined",
+                        help="combined: 全検査を 1 枚のシートに / sheets: 検査ごとに 1 枚")
+    parser.add_argument('--from', dest='date_from', default=None, help="検査日の開始（YYYY-MM-DD）")
+    parser.add_argument('--to', dest='date_to', default=None, help="検査日の終了（YYYY-MM-DD）")
+    parser.add_argument('--photos', default=DEFAULT_PHOTO_DIR, help="写真ストアのディレクトリ")
+    parser.add_argument('--no-photos', action='store_true', help="写真を載せない")
+    parser.add_argument('--thumbnail-px', type=int, default=AUDIT_THUMBNAIL_PX, help="サムネイルの長辺（ピクセル）")
+    args = parser.parse_args(argv)
+
+    if not Path(args.db).exists():
+        print(f"検査履歴データベースが見つかりません: {args.db}", file=sys.stderr)
+        return 1
+
+    photo_path = None if args.no_photos else PhotoStore(args.photos).path
+
+    started = time.perf_counter()
+    history = InspectionHistory(args.db)
+    stats = write_audit_workbook(
+        history.iter_inspections(args.date_from, args.date_to), args.output, args.layout,
+        photo_path, thumbnail_px=args.thumbnail_px
+    )
+    print(f"検査 {stats['inspections']} 件・{stats['items']} 行・写真 {stats['photos']} 枚を書き出しました: "
+          f"{args.output}（{time.perf_counter() - started:.1f} 秒）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
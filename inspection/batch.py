@@ -0,0 +1,250 @@
+"""
+検査レポートの一括生成（Streamlit 不要）
+
+検査記録（JSON / CSV）からレポート xlsx を複数プロセスで並列に生成する
+マニュアル改訂後に過去の検査レポートを作り直す用途を想定
+
+    python -m inspection.batch records/ --out reports/ --jobs 4
+
+JSON（1 件、またはそのリスト）:
+    {
+      "in_no": "IN001", "lot_no": "LOT001", "serial": "SN12345",
+      "writer": "山田", "reviewer": "佐藤", "inspection_date": "2026-01-31",
+      "results": {"item_1": "可", "item_2": "否"},
+      "photos": {"item_1": "photos/item_1.jpg"}
+    }
+
+CSV（1 行 = 1 件）:
+    in_no, lot_no, serial, writer, reviewer, inspection_date の各列と、
+    項目ID の列（可 / 否）、"photo:項目ID" の列（写真ファイルのパス）
+
+写真のパスは記録ファイルのあるディレクトリからの相対パスで指定できる
+マニュアルと同じ名前の記述子（*.json、inspection.manuals を参照）があれば、その項目位置で読み込む
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from . import manuals, report
+
+HEADER_FIELDS = ["in_no", "lot_no", "serial", "writer", "reviewer", "inspection_date"]
+PHOTO_PREFIX = "photo:"
+PASS_VALUES = {"可", "ok", "pass", "true", "1", "○"}
+FAIL_VALUES = {"否", "ng", "fail", "false", "0", "×"}
+
+
+def parse_result(value):
+    """判定値（可/否, true/false など）を bool に変換。空欄は None"""
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower() if value is not None else ""
+    if not text:
+        return None
+    if text in PASS_VALUES:
+        return True
+    if text in FAIL_VALUES:
+        return False
+    raise ValueError(f"判定値を解釈できません: {value!r}")
+
+def _resolve_photo(path, base_dir):
+    photo = Path(path)
+    if not photo.is_absolute():
+        photo = base_dir / photo
+    return str(photo)
+
+def _normalize_record(raw, source, base_dir):
+    record = {field: str(raw.get(field) or "") for field in HEADER_FIELDS}
+    record['source'] = source
+    record['output'] = raw.get('output')
+    record['results'] = {}
+    for item_id, value in (raw.get('results') or {}).items():
+        result = parse_result(value)
+        if result is not None:
+            record['results'][item_id] = result
+    record['photos'] = {
+        item_id: _resolve_photo(path, base_dir)
+        for item_id, path in (raw.get('photos') or {}).items() if path
+    }
+    return record
+
+def _raw_from_csv_row(row):
+    raw = {field: row.get(field) for field in HEADER_FIELDS}
+    raw['output'] = row.get('output') or None
+    raw['results'] = {}
+    raw['photos'] = {}
+    for column, value in row.items():
+        if column is None or column in HEADER_FIELDS or column == 'output':
+            continue
+        if column.startswith(PHOTO_PREFIX):
+            raw['photos'][column[len(PHOTO_PREFIX):]] = value
+        else:
+            raw['results'][column] = value
+    return raw
+
+def load_records(paths):
+    """ファイル・ディレクトリから検査記録を読み込む"""
+    files = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            files.extend(sorted(p for p in path.rglob('*') if p.suffix.lower() in ('.json', '.csv')))
+        else:
+            files.append(path)
+
+    records = []
+
+    def add(raw, source, base_dir):
+        # 解釈できない記録は error 付きで残し、生成時に失敗として報告する
+        try:
+            records.append(_normalize_record(raw, source, base_dir))
+        except Exception as e:
+            records.append({'source': source, 'error': f"{type(e).__name__}: {e}"})
+
+    for file in files:
+        base_dir = file.parent
+        if file.suffix.lower() == '.csv':
+            with open(file, encoding='utf-8-sig', newline='') as f:
+                for line_no, row in enumerate(csv.DictReader(f), 2):
+                    add(_raw_from_csv_row(row), f"{file}:{line_no}", base_dir)
+        else:
+            with open(file, encoding='utf-8') as f:
+                data = json.load(f)
+            for index, raw in enumerate(data if isinstance(data, list) else [data]):
+                source = f"{file}[{index}]" if isinstance(data, list) else str(file)
+                add(raw, source, base_dir)
+    return records
+
+def output_name(record, index):
+    """出力ファイル名（指定が無ければ IN.NO・ロット・S/N から作る）"""
+    if record.get('output'):
+        return record['output']
+    parts = [record['in_no'], record['lot_no'], record['serial']]
+    stem = "_".join(re.sub(r'[^\w\-]+', '-', part) for part in parts if part) or f"record{index}"
+    return f"inspection_{stem}.xlsx"
+
+def build_one(record, out_path, manual_path, layout=None):
+    """1 件分のレポートを生成して保存する（ワーカープロセスで実行）"""
+    template = report.load_manual_template(manual_path, layout)
+    items = template['items']
+    known = {item['id']: item for item in items}
+    inspection_data = {
+        item_id: {
+            'pass': passed,
+            'description': known[item_id]['description'],
+            'category': known[item_id]['category'],
+        }
+        for item_id, passed in record['results'].items() if item_id in known
+    }
+    output = report.create_excel_report(
+        inspection_data, record['photos'], items,
+        record['writer'], record['reviewer'], record['serial'],
+        record['lot_no'], record['in_no'], record['inspection_date'],
+        manual_path=manual_path, layout=layout
+    )
+    data = output.getvalue()
+    tmp_path = f"{out_path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, out_path)
+    return len(data)
+
+def _print_progress(done, total, failed, started, label, stream):
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    rate = done / elapsed * 60
+    stream.write(f"\r[{done:>{len(str(total))}}/{total}] {done / total:6.1%}  "
+                 f"{rate:7.1f} 件/分  失敗 {failed}  {label[:40]:<40}")
+    stream.flush()
+
+def run(records, out_dir, manual_path=report.MANUAL_FILE, jobs=None, stream=sys.stderr):
+    """
+    レポートを並列に生成する
+    戻り値: {'total', 'succeeded', 'failed', 'errors', 'elapsed', 'per_minute', 'bytes'}
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    layout = manuals.layout_for(manual_path)
+
+    errors = [(record['source'], record['error']) for record in records if 'error' in record]
+    records = [record for record in records if 'error' not in record]
+
+    # 出力名が重複したら連番を付ける
+    targets = []
+    used = set()
+    for index, record in enumerate(records, 1):
+        name = output_name(record, index)
+        stem, suffix = os.path.splitext(name)
+        counter = 1
+        while name in used:
+            counter += 1
+            name = f"{stem}_{counter}{suffix or '.xlsx'}"
+        used.add(name)
+        targets.append((record, out_dir / name))
+
+    total = len(targets) + len(errors)
+    written = 0
+    done = len(errors)
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(build_one, record, str(path), manual_path, layout): (record, path)
+            for record, path in targets
+        }
+        for future in as_completed(futures):
+            record, path = futures[future]
+            try:
+                written += future.result()
+            except Exception as e:
+                errors.append((record['source'], f"{type(e).__name__}: {e}"))
+            done += 1
+            if stream is not None:
+                _print_progress(done, total, len(errors), started, path.name, stream)
+
+    if stream is not None and total:
+        stream.write("\n")
+
+    elapsed = time.perf_counter() - started
+    return {
+        'total': total,
+        'succeeded': total - len(errors),
+        'failed': len(errors),
+        'errors': errors,
+        'elapsed': elapsed,
+        'per_minute': (total - len(errors)) / elapsed * 60 if elapsed > 0 else 0.0,
+        'bytes': written,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="検査記録（JSON/CSV）からレポート xlsx を一括生成する",
+    )
+    parser.add_argument('records', nargs='+', help="検査記録のファイルまたはディレクトリ")
+    parser.add_argument('--out', required=True, help="レポートの出力先ディレクトリ")
+    parser.add_argument('--manual', default=report.MANUAL_FILE, help="マニュアル xlsx")
+    parser.add_argument('--jobs', type=int, default=None, help="並列プロセス数（既定: CPU 数）")
+    parser.add_argument('--quiet', action='store_true', help="進捗を表示しない")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.records)
+    if not records:
+        print("検査記録が見つかりません", file=sys.stderr)
+        return 1
+
+    summary = run(records, args.out, args.manual, args.jobs, stream=None if args.quiet else sys.stderr)
+
+    print(f"完了: {summary['succeeded']}/{summary['total']} 件  失敗: {summary['failed']} 件")
+    print(f"所要時間: {summary['elapsed']:.1f} 秒  スループット: {summary['per_minute']:.1f} 件/分  "
+          f"出力: {summary['bytes'] / 1024 ** 2:.1f} MB")
+    for source, message in summary['errors']:
+        print(f"  ❌ {source}: {message}", file=sys.stderr)
+    return 1 if summary['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
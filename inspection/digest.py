@@ -0,0 +1,219 @@
+"""
+まとめ送信（ダイジェスト）メールの組み立て
+
+同じ送信先に送る複数の検査結果を 1 通にまとめる
+- 本文に検査ごとの一覧表（IN.NO・ロットNO・S/N・合否件数）を載せる
+- 添付は zip 1 つにまとめる（内容が同じファイルは 1 回だけ入れる）か、
+  全検査の結果を 1 枚にまとめたブックにする
+- 1 通の大きさが max_bytes を超える場合は複数のメールに分ける
+
+検査 1 件分（entry）の形式:
+    {'summary': {...}, 'attachments': [(ファイル名, バイト列, MIME タイプ), ...]}
+summary は mail.report_summary() の戻り値
+"""
+
+import hashlib
+import os
+import zipfile
+from datetime import datetime
+from io import BytesIO
+
+from .mail import FOOTER
+from .outbox import XLSX_MIME
+
+ZIP_MIME = "application/zip"
+DIGEST_MODES = ("zip", "workbook")
+
+# 添付は base64 で約 4/3 倍になる。本文・ヘッダーの分の余裕
+BASE64_RATIO = 4 / 3
+MESSAGE_OVERHEAD = 16 * 1024
+
+# 圧縮済みの形式は zip で再圧縮しない（時間がかかるだけで小さくならない）
+STORED_SUFFIXES = (".xlsx", ".pdf", ".jpg", ".jpeg", ".png", ".zip")
+
+SUMMARY_COLUMNS = ("IN.NO", "ロットNO", "本体S/N", "検査日", "作業者", "合格", "不合格")
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+def _unique_name(name, used):
+    stem, suffix = os.path.splitext(name)
+    counter = 1
+    while name in used:
+        counter += 1
+        name = f"{stem}_{counter}{suffix}"
+    used.add(name)
+    return name
+
+def unique_attachments(entries):
+    """
+    全検査の添付を内容で重複除去する
+    戻り値: [(ファイル名, バイト列, MIME タイプ), ...]（ファイル名は重複しないように付け直す）
+    """
+    seen = set()
+    used = set()
+    files = []
+    for entry in entries:
+        for filename, data, mime_type in entry['attachments']:
+            digest = _digest(data)
+            if digest in seen:
+                continue
+            seen.add(digest)
+            files.append((_unique_name(filename, used), data, mime_type))
+    return files
+
+def _entry_sizes(entry, mode):
+    """検査 1 件分の添付の [(ハッシュ, 大きさ), ...]（まとめブックでは項目数からの概算）"""
+    if mode == "workbook":
+        return [(None, len(entry['summary'].get('items', ())) * 120)]
+    return [(_digest(data), len(data)) for _, data, _ in entry['attachments']]
+
+def _encoded_size(attachment_bytes):
+    return int(attachment_bytes * BASE64_RATIO) + MESSAGE_OVERHEAD
+
+def split_entries(entries, mode, max_bytes):
+    """
+    1 通が max_bytes 以下になるように検査を順番のまま分ける（同じ内容の添付は 1 回だけ数える）
+    1 件だけで max_bytes を超える検査は単独の 1 通にする
+    """
+    chunks = []
+    current = []
+    seen = set()
+    size = 0
+    for entry in entries:
+        sizes = _entry_sizes(entry, mode)
+        added = sum(length for digest, length in sizes if digest is None or digest not in seen)
+        if current and _encoded_size(size + added) > max_bytes:
+            chunks.append(current)
+            current, seen, size = [], set(), 0
+            added = sum(length for _, length in sizes)
+        current.append(entry)
+        seen.update(digest for digest, _ in sizes if digest is not None)
+        size += added
+    if current:
+        chunks.append(current)
+    return chunks
+
+def summary_table(entries):
+    """本文に載せる一覧表（等幅でなくても読めるよう「｜」区切り）"""
+    lines = [" ｜ ".join(("No.",) + SUMMARY_COLUMNS)]
+    for number, entry in enumerate(entries, 1):
+        summary = entry['summary']
+        lines.append(" ｜ ".join(str(value) for value in (
+            number,
+            summary.get('in_no') or "-",
+            summary.get('lot_no') or "-",
+            summary.get('serial') or "-",
+            summary.get('inspection_date') or "-",
+            summary.get('writer') or "-",
+            summary.get('passed', 0),
+            summary.get('failed', 0),
+        )))
+    return "\n".join(lines)
+
+def build_zip(files):
+    """添付をまとめた zip のバイト列"""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for filename, data, _ in files:
+            compression = zipfile.ZIP_STORED if filename.lower().endswith(STORED_SUFFIXES) else zipfile.ZIP_DEFLATED
+            archive.writestr(filename, data, compress_type=compression)
+    return buffer.getvalue()
+
+def _cell(value):
+    """ブックに書けない制御文字を取り除く（入力欄から紛れ込むと保存できない）"""
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    return ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+
+def _discard(wb):
+    """
+    途中で失敗した write_only のブックの書きかけのシートを閉じる
+    （閉じないと後でガベージコレクションされたときに "I/O operation on closed file" が出る）
+    """
+    for ws in wb.worksheets:
+        rows = getattr(ws, '_rows', None)
+        if rows is not None:
+            try:
+                rows.close()
+            except Exception:
+                pass
+
+def build_workbook(entries):
+    """
+    全検査の結果を 1 冊にまとめたブック（一覧シート + 全検査の項目別結果シート）
+    行を順に書き出すだけなので write_only モードで作る
+    """
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=True)
+    try:
+        ws = wb.create_sheet("一覧")
+        ws.append(("No.",) + SUMMARY_COLUMNS + ("確認者",))
+        for number, entry in enumerate(entries, 1):
+            summary = entry['summary']
+            ws.append([_cell(value) for value in (
+                number, summary.get('in_no'), summary.get('lot_no'), summary.get('serial'),
+                summary.get('inspection_date'), summary.get('writer'),
+                summary.get('passed', 0), summary.get('failed', 0), summary.get('reviewer'),
+            )])
+
+        ws = wb.create_sheet("検査結果")
+        ws.append(("No.", "IN.NO", "ロットNO", "本体S/N", "項目No.", "カテゴリ", "検査項目", "判定"))
+        for number, entry in enumerate(entries, 1):
+            summary = entry['summary']
+            for item_number, (category, description, passed) in enumerate(summary.get('items', ()), 1):
+                ws.append([_cell(value) for value in (
+                    number, summary.get('in_no'), summary.get('lot_no'), summary.get('serial'),
+                    item_number, category, description, "可" if passed else "否",
+                )])
+
+        buffer = BytesIO()
+        wb.save(buffer)
+    except BaseException:
+        _discard(wb)
+        raise
+    return buffer.getvalue()
+
+def build_digests(entries, mode="zip", max_bytes=15 * 1024 ** 2, now=None):
+    """
+    検査結果をまとめたメールを作る（max_bytes を超える場合は複数通）
+    戻り値: [{'subject', 'body', 'attachments', 'entries': このメールに入れた検査}, ...]
+    """
+    if mode not in DIGEST_MODES:
+        raise ValueError(f"未対応のまとめ方です: {mode!r}（{' / '.join(DIGEST_MODES)}）")
+    now = now or datetime.now()
+    chunks = split_entries(entries, mode, max_bytes)
+    stamp = now.strftime("%Y%m%d_%H%M")
+
+    messages = []
+    for index, chunk in enumerate(chunks, 1):
+        part = f"（{index}/{len(chunks)}）" if len(chunks) > 1 else ""
+        suffix = f"_{index}" if len(chunks) > 1 else ""
+        failed = sum(1 for entry in chunk if entry['summary'].get('failed'))
+        subject = f"Inspection Results Digest - {len(chunk)} inspections{part}"
+
+        if mode == "zip":
+            files = unique_attachments(chunk)
+            attachments = [(f"inspections_{stamp}{suffix}.zip", build_zip(files), ZIP_MIME)]
+            notes = "\n".join(f"- {filename}" for filename, _, _ in files)
+            attachment_text = f"添付の zip に各検査のファイルが入っています。\n{notes}"
+        else:
+            attachments = [(f"inspections_{stamp}{suffix}.xlsx", build_workbook(chunk), XLSX_MIME)]
+            attachment_text = "添付のブックに全検査の項目別の結果をまとめています。"
+
+        body = f"""
+入荷検査 {len(chunk)} 件の結果をまとめてお送りします{part}。
+不合格項目のある検査: {failed}件
+
+【検査一覧】
+{summary_table(chunk)}
+
+{attachment_text}
+
+---
+{FOOTER}
+"""
+        messages.append({'subject': subject, 'body': body, 'attachments': attachments, 'entries': chunk})
+    return messages
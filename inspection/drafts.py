@@ -0,0 +1,279 @@
+"""
+入力途中の検査の下書き（自動保存と再開）
+
+回答・写真・検査情報の変更を 1 件ずつ差分として SQLite（WAL）のジャーナルに追記する
+- 変更のたびに全状態を書き直さない（1 回の保存は 1 行の INSERT）
+- 再開時はスナップショット + それ以降の差分を順に適用して状態を復元する
+- 差分が compact_every 件たまったらスナップショットにまとめて古い差分を削除する
+
+写真そのものは写真ストアに保存済みなので、ジャーナルにはハッシュとファイル名だけを記録する
+"""
+
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    draft_id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    label TEXT NOT NULL DEFAULT '',
+    last_seq INTEGER NOT NULL DEFAULT 0,
+    snapshot TEXT,
+    snapshot_seq INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_drafts_updated ON drafts (updated_at);
+CREATE TABLE IF NOT EXISTS draft_events (
+    draft_id TEXT NOT NULL REFERENCES drafts(draft_id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (draft_id, seq)
+) WITHOUT ROWID;
+"""
+
+# 差分の種類と、復元後の状態での格納先
+KIND_RESULT = "result"    # 項目ID → 可なら True
+KIND_PHOTO = "photo"      # 項目ID → {'ref': ハッシュ, 'name': ファイル名}（None で削除）
+KIND_HEADER = "header"    # 欄名 → 値
+STATE_KEYS = {KIND_RESULT: 'results', KIND_PHOTO: 'photos', KIND_HEADER: 'header'}
+
+# 下書き一覧に表示する検査情報
+LABEL_FIELDS = ("inspector_id", "in_no", "lot_no")
+
+# 検査情報の欄名と、復元先の入力欄（画面のセッションのキー）
+PERSON_FIELDS = ("writer", "reviewer")
+TEXT_FIELDS = ("inspector_id", "in_no", "lot_no")
+
+
+def empty_state():
+    return {'results': {}, 'photos': {}, 'header': {}}
+
+def header_changes(known, values):
+    """
+    検査情報のうち、前回から変わった欄 [(欄名, 値), ...] を返し、known を今回の値に更新する
+    初めて見る欄は基準として覚えるだけで、変更に含めない
+    """
+    changes = []
+    for key, value in values.items():
+        if key in known and known[key] != value:
+            changes.append((key, value))
+        known[key] = value
+    return changes
+
+def restore_inputs(state, store, manual_keys=(), names=()):
+    """
+    下書きの状態（DraftJournal.load の戻り値）を入力欄に戻す値に変換する
+    store: 写真ストア（ストアに残っていない写真は復元しない）
+    manual_keys・names: 登録済みのマニュアルのキー・検査者の氏名（無くなったものは復元しない）
+    戻り値: {'results': {項目ID: bool},
+             'photos': {項目ID: {'ref', 'name', 'preview', 'dhash'}},
+             'fields': {入力欄のキー: 値},  # manual_key / writer / reviewer / inspector_id / in_no / lot_no / inspection_date
+             'header': {欄名: 値}}
+    """
+    from datetime import date
+
+    from .photo_index import dhash_file
+    from .photos import PREVIEW_WIDTH, make_jpeg
+
+    photos = {}
+    for item_id, photo in state['photos'].items():
+        if not store.exists(photo['ref']):
+            continue
+        path = store.path(photo['ref'])
+        photos[item_id] = {
+            'ref': photo['ref'],
+            'name': photo['name'],
+            'preview': make_jpeg(path, PREVIEW_WIDTH)[0],
+            'dhash': dhash_file(path),
+        }
+
+    header = state['header']
+    fields = {}
+    if header.get('manual') in set(manual_keys):
+        fields['manual_key'] = header['manual']
+    names = set(names)
+    for key in PERSON_FIELDS:
+        if header.get(key) in names:
+            fields[key] = header[key]
+    for key in TEXT_FIELDS:
+        if key in header:
+            fields[key] = header[key]
+    if header.get('inspection_date'):
+        fields['inspection_date'] = date.fromisoformat(header['inspection_date'])
+    return {'results': dict(state['results']), 'photos': photos, 'fields': fields, 'header': dict(header)}
+
+def _apply(state, kind, key, value):
+    target = state[STATE_KEYS[kind]]
+    if value is None:
+        target.pop(key, None)
+    else:
+        target[key] = value
+
+
+class DraftJournal:
+    """
+    下書きの差分ジャーナル
+    compact_every: この件数の差分がたまったらスナップショットにまとめる
+    """
+
+    def __init__(self, path, compact_every=200):
+        self.path = str(path)
+        self.compact_every = compact_every
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """1 トランザクション分の接続（終了時にコミットして閉じる）"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL では NORMAL でもプロセスが落ちた分は失われない（失うのは電源断の直前だけ）
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- 書き込み ----------
+
+    def create(self, header=None):
+        """
+        新しい下書きを作り、下書き ID を返す
+        header: 作成時点の検査情報 {欄名: 値}（最初の差分として記録する）
+        """
+        draft_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO drafts (draft_id, created_at, updated_at) VALUES (?, ?, ?)",
+                (draft_id, now, now)
+            )
+        for key, value in (header or {}).items():
+            self.append(draft_id, KIND_HEADER, key, value)
+        return draft_id
+
+    def append(self, draft_id, kind, key, value):
+        """
+        差分を 1 件追記する（value が None なら削除）
+        戻り値: 追記した差分の通し番号
+        """
+        if kind not in STATE_KEYS:
+            raise ValueError(f"未対応の差分です: {kind!r}")
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE drafts SET last_seq = last_seq + 1, updated_at = ? WHERE draft_id = ?",
+                (time.time(), draft_id)
+            ).rowcount
+            if not updated:
+                raise KeyError(draft_id)
+            row = conn.execute(
+                "SELECT last_seq, snapshot_seq FROM drafts WHERE draft_id = ?", (draft_id,)
+            ).fetchone()
+            seq = row['last_seq']
+            conn.execute(
+                "INSERT INTO draft_events (draft_id, seq, kind, key, value) VALUES (?, ?, ?, ?, ?)",
+                (draft_id, seq, kind, key, None if value is None else json.dumps(value, ensure_ascii=False))
+            )
+            pending = seq - row['snapshot_seq']
+        if kind == KIND_HEADER and key in LABEL_FIELDS:
+            self._update_label(draft_id)
+        if pending >= self.compact_every:
+            self.compact(draft_id)
+        return seq
+
+    def _update_label(self, draft_id):
+        """下書き一覧用の表示名（S/N / IN.NO / ロットNO）を更新する"""
+        header = self.load(draft_id)['header']
+        label = " / ".join(str(header.get(field) or "-") for field in LABEL_FIELDS)
+        with self._connect() as conn:
+            conn.execute("UPDATE drafts SET label = ? WHERE draft_id = ?", (label, draft_id))
+
+    def compact(self, draft_id):
+        """スナップショットを作り直し、取り込んだ差分を削除する"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            state, seq = self._replay(conn, draft_id)
+            if state is None:
+                return
+            conn.execute(
+                "UPDATE drafts SET snapshot = ?, snapshot_seq = ? WHERE draft_id = ?",
+                (json.dumps(state, ensure_ascii=False), seq, draft_id)
+            )
+            conn.execute("DELETE FROM draft_events WHERE draft_id = ? AND seq <= ?", (draft_id, seq))
+
+    def discard(self, draft_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM drafts WHERE draft_id = ?", (draft_id,))
+
+    def purge(self, max_age=7 * 24 * 3600):
+        """max_age 秒以上更新されていない下書きを削除する。戻り値: 削除件数"""
+        with self._connect() as conn:
+            removed = conn.execute(
+                "DELETE FROM drafts WHERE updated_at < ?", (time.time() - max_age,)
+            ).rowcount
+        if removed:
+            with self._connect() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    # ---------- 読み込み ----------
+
+    def _replay(self, conn, draft_id):
+        draft = conn.execute(
+            "SELECT snapshot, last_seq FROM drafts WHERE draft_id = ?", (draft_id,)
+        ).fetchone()
+        if draft is None:
+            return None, 0
+        state = json.loads(draft['snapshot']) if draft['snapshot'] else empty_state()
+        for event in conn.execute(
+            "SELECT kind, key, value FROM draft_events WHERE draft_id = ? ORDER BY seq", (draft_id,)
+        ):
+            value = None if event['value'] is None else json.loads(event['value'])
+            _apply(state, event['kind'], event['key'], value)
+        return state, draft['last_seq']
+
+    def load(self, draft_id):
+        """
+        下書きの状態を復元する（無ければ None）
+        戻り値: {'results': {項目ID: bool}, 'photos': {項目ID: {'ref', 'name'}}, 'header': {欄名: 値}}
+        """
+        with self._connect() as conn:
+            state, _ = self._replay(conn, draft_id)
+        return state
+
+    def exists(self, draft_id):
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT 1 FROM drafts WHERE draft_id = ?", (draft_id,)
+            ).fetchone() is not None
+
+    def recent(self, limit=20):
+        """更新の新しい順に下書きの一覧を返す"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT d.draft_id, d.label, d.created_at, d.updated_at, d.last_seq,"
+                " (SELECT COUNT(*) FROM draft_events e WHERE e.draft_id = d.draft_id) AS pending"
+                " FROM drafts d WHERE d.last_seq > 0 ORDER BY d.updated_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def referenced_photos(self):
+        """下書きから参照されている写真のハッシュ一覧"""
+        digests = set()
+        with self._connect() as conn:
+            for row in conn.execute("SELECT snapshot FROM drafts WHERE snapshot IS NOT NULL"):
+                digests.update(photo['ref'] for photo in json.loads(row[0])['photos'].values())
+            for row in conn.execute(
+                "SELECT value FROM draft_events WHERE kind = ? AND value IS NOT NULL", (KIND_PHOTO,)
+            ):
+                digests.add(json.loads(row[0])['ref'])
+        return digests
@@ -0,0 +1,90 @@
+"""
+結合セルを考慮したセル操作
+
+ws.merged_cells.ranges をセルごとに総当たりすると
+「セル数 × 結合範囲数」の計算量になるため、
+ワークシートごとに 1 回だけ座標 → 左上セルの索引を作って使い回す
+"""
+
+
+def build_merged_index(ws):
+    """
+    結合セルの索引を作成する
+    {(row, col): (左上 row, 左上 col)} の辞書（左上セル自身も含む）
+    """
+    index = {}
+    for merged_range in ws.merged_cells.ranges:
+        min_col, min_row, max_col, max_row = merged_range.bounds
+        top_left = (min_row, min_col)
+        for row in range(min_row, max_row + 1):
+            for col in range(min_col, max_col + 1):
+                index[(row, col)] = top_left
+    return index
+
+def top_left_of(merged_index, row, col):
+    """結合セルなら左上セルの座標、そうでなければそのままの座標を返す"""
+    return merged_index.get((row, col), (row, col))
+
+def safe_write_cell(ws, cell_address, value, merged_index=None):
+    """
+    結合セルを考慮して安全にセルに書き込む
+    """
+    try:
+        if merged_index is None:
+            merged_index = build_merged_index(ws)
+        cell = ws[cell_address]
+        # 結合セルの場合、左上のセルに書き込む
+        row, col = top_left_of(merged_index, cell.row, cell.column)
+        ws.cell(row=row, column=col).value = value
+        return True
+    except Exception:
+        # エラーが発生しても続行
+        return False
+
+def resolve_header_cell(ws, search_text, search_range=(1, 10), merged_index=None):
+    """
+    ヘッダーテキストを検索し、値を書き込むべき右隣セルの座標 (row, col) を返す
+    結合セルの場合は左上セルの座標を返す。見つからなければ None
+    """
+    if merged_index is None:
+        merged_index = build_merged_index(ws)
+    for row in range(search_range[0], search_range[1] + 1):
+        for col in range(1, 20):
+            try:
+                cell = ws.cell(row=row, column=col)
+                if cell.value and search_text in str(cell.value):
+                    # 右隣のセル（結合セルなら左上）
+                    return top_left_of(merged_index, row, col + 1)
+            except Exception:
+                continue
+    return None
+
+def find_and_write_header(ws, search_text, value, search_range=(1, 10), merged_index=None):
+    """
+    ヘッダーテキストを検索し、その右のセルに値を書き込む
+    """
+    target = resolve_header_cell(ws, search_text, search_range, merged_index)
+    if target is None:
+        return False
+    ws.cell(row=target[0], column=target[1]).value = value
+    return True
+
+def resolve_checkbox_cell(ws, excel_row, columns=(21, 26), merged_index=None):
+    """
+    V〜Y列（22〜25列）から「□可　□否」のセルを探し、左上セルの座標 (row, col) を返す
+    """
+    if merged_index is None:
+        merged_index = build_merged_index(ws)
+    for col in range(columns[0], columns[1]):
+        try:
+            # 結合セルの場合、左上セルを取得
+            row, actual_col = top_left_of(merged_index, excel_row, col)
+            actual_cell = ws.cell(row=row, column=actual_col)
+
+            if actual_cell.value:
+                cell_value = str(actual_cell.value)
+                if '□可' in cell_value or '□否' in cell_value:
+                    return (row, actual_col)
+        except Exception:
+            continue
+    return None
@@ -0,0 +1,120 @@
+"""
+検査履歴のエクスポート（CSV / Parquet）
+
+検査履歴データベースから (検査, 項目) ごとに 1 行を書き出す
+行はチャンク単位で読み書きするので、数百万行でもメモリ使用量は一定
+
+    python -m inspection.export history.csv
+    python -m inspection.export history.parquet --from 2025-01-01 --to 2025-12-31 --category 本体外観
+
+Parquet には pyarrow が必要（未インストールなら CSV のみ）
+"""
+
+import argparse
+import csv
+import sys
+import time
+from pathlib import Path
+
+from .history import ITEM_ROW_COLUMNS, InspectionHistory
+
+DEFAULT_DB = "history.sqlite3"
+DEFAULT_CHUNK_SIZE = 10000
+FORMATS = ("csv", "parquet")
+
+
+def write_csv(chunks, path, encoding="utf-8-sig"):
+    """
+    チャンク（行タプルのリスト）を順に CSV へ書き出す
+    既定の文字コードは Excel でそのまま開ける BOM 付き UTF-8
+    戻り値: 書き出した行数
+    """
+    count = 0
+    with open(path, 'w', encoding=encoding, newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(ITEM_ROW_COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            count += len(chunk)
+    return count
+
+def _parquet_schema(pa):
+    types = {
+        "inspection_id": pa.int64(),
+        "excel_row": pa.int32(),
+        "passed": pa.bool_(),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in ITEM_ROW_COLUMNS])
+
+def write_parquet(chunks, path, compression="zstd"):
+    """
+    チャンクごとに 1 つの行グループとして Parquet へ書き出す
+    戻り値: 書き出した行数
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet の出力には pyarrow が必要です（pip install pyarrow）") from e
+
+    schema = _parquet_schema(pa)
+    count = 0
+    with pq.ParquetWriter(str(path), schema, compression=compression) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            arrays = []
+            for index, field in enumerate(schema):
+                values = columns[index]
+                if field.name == "passed":
+                    values = [bool(v) for v in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            count += len(chunk)
+    return count
+
+def export_history(history, path, fmt=None, date_from=None, date_to=None, categories=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    検査履歴を CSV / Parquet に書き出す（fmt 省略時は拡張子で判定）
+    戻り値: 書き出した行数
+    """
+    fmt = fmt or Path(path).suffix.lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"未対応の形式です: {fmt!r}（{' / '.join(FORMATS)}）")
+
+    chunks = history.iter_item_rows(date_from, date_to, categories, chunk_size)
+    if fmt == "parquet":
+        return write_parquet(chunks, path)
+    return write_csv(chunks, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="検査履歴を (検査, 項目) ごとの行で CSV / Parquet に書き出す")
+    parser.add_argument('output', help="出力ファイル（拡張子 .csv / .parquet で形式を判定）")
+    parser.add_argument('--db', default=DEFAULT_DB, help="検査履歴データベース")
+    parser.add_argument('--format', choices=FORMATS, default=None, help="出力形式（既定: 拡張子から判定）")
+    parser.add_argument('--from', dest='date_from', default=None, help="検査日の開始（YYYY-MM-DD）")
+    parser.add_argument('--to', dest='date_to', default=None, help="検査日の終了（YYYY-MM-DD）")
+    parser.add_argument('--category', action='append', default=None, help="カテゴリで絞り込む（複数指定可）")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="1 回に読み込む行数")
+    args = parser.parse_args(argv)
+
+    if not Path(args.db).exists():
+        print(f"検査履歴データベースが見つかりません: {args.db}", file=sys.stderr)
+        return 1
+
+    started = time.perf_counter()
+    try:
+        count = export_history(
+            InspectionHistory(args.db), args.output, args.format,
+            args.date_from, args.date_to, args.category, args.chunk_size
+        )
+    except (ValueError, RuntimeError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    print(f"{count} 行を書き出しました: {args.output}（{time.perf_counter() - started:.1f} 秒）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,624 @@
+"""
+検査履歴データベース
+
+レポートを生成した検査を SQLite に保存し、本体S/N・IN.NO・ロットNO・検査日で検索する
+- inspections        検査 1 件（ヘッダー情報）
+- inspection_items   検査項目ごとの可否と写真の参照（写真ストアのハッシュ）
+- manual_items       マニュアルのバージョンごとの項目定義（カテゴリ・検査内容・行番号）
+- photo_hashes       写真ごとの知覚ハッシュ（dHash）と検索用の帯（inspection.photo_index）
+                     保存した検査から参照されている写真の分だけを持つ（検査の保存と同じトランザクションで更新）
+- rollup_*           不合格率の集計表（月 × マニュアル × 項目、月 × ロット、月）
+
+項目 ID（item_行番号）はマニュアルごとの行の位置なので、項目別の集計はマニュアル（と版）ごとに分ける
+
+検索列にはすべてインデックスを張り、前方一致も範囲検索でインデックスを使う
+集計表は検査の保存と同じトランザクションで差分更新するので、
+ダッシュボードは明細を走査せずに集計表だけを読めばよい
+"""
+
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime
+
+from . import photo_index
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inspections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT NOT NULL,
+    inspection_date TEXT NOT NULL,
+    serial TEXT NOT NULL DEFAULT '',
+    in_no TEXT NOT NULL DEFAULT '',
+    lot_no TEXT NOT NULL DEFAULT '',
+    writer TEXT NOT NULL DEFAULT '',
+    reviewer TEXT NOT NULL DEFAULT '',
+    manual_version TEXT NOT NULL DEFAULT '',
+    manual_key TEXT NOT NULL DEFAULT '',
+    item_count INTEGER NOT NULL DEFAULT 0,
+    failed_count INTEGER NOT NULL DEFAULT 0,
+    photo_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_inspections_serial ON inspections (serial, inspection_date);
+CREATE INDEX IF NOT EXISTS idx_inspections_in_no ON inspections (in_no, inspection_date);
+CREATE INDEX IF NOT EXISTS idx_inspections_lot_no ON inspections (lot_no, inspection_date);
+CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections (inspection_date);
+
+CREATE TABLE IF NOT EXISTS manual_items (
+    manual_version TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT NOT NULL,
+    excel_row INTEGER NOT NULL,
+    PRIMARY KEY (manual_version, item_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS inspection_items (
+    inspection_id INTEGER NOT NULL REFERENCES inspections(id) ON DELETE CASCADE,
+    item_id TEXT NOT NULL,
+    passed INTEGER NOT NULL,
+    photo_ref TEXT,
+    PRIMARY KEY (inspection_id, item_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_inspection_items_photo ON inspection_items (photo_ref)
+    WHERE photo_ref IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS photo_hashes (
+    photo_ref TEXT PRIMARY KEY,
+    dhash INTEGER NOT NULL,
+    band0 INTEGER NOT NULL,
+    band1 INTEGER NOT NULL,
+    band2 INTEGER NOT NULL,
+    band3 INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_photo_hashes_band0 ON photo_hashes (band0);
+CREATE INDEX IF NOT EXISTS idx_photo_hashes_band1 ON photo_hashes (band1);
+CREATE INDEX IF NOT EXISTS idx_photo_hashes_band2 ON photo_hashes (band2);
+CREATE INDEX IF NOT EXISTS idx_photo_hashes_band3 ON photo_hashes (band3);
+
+CREATE TABLE IF NOT EXISTS rollup_item_month (
+    month TEXT NOT NULL,
+    manual_key TEXT NOT NULL,
+    manual_version TEXT NOT NULL,
+    category TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    PRIMARY KEY (month, manual_key, manual_version, category, item_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_lot_month (
+    month TEXT NOT NULL,
+    lot_no TEXT NOT NULL,
+    inspections INTEGER NOT NULL,
+    failed_inspections INTEGER NOT NULL,
+    items INTEGER NOT NULL,
+    failed_items INTEGER NOT NULL,
+    PRIMARY KEY (month, lot_no)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_month (
+    month TEXT PRIMARY KEY,
+    inspections INTEGER NOT NULL,
+    failed_inspections INTEGER NOT NULL,
+    items INTEGER NOT NULL,
+    failed_items INTEGER NOT NULL
+) WITHOUT ROWID;
+"""
+
+# 集計表の形式が変わったら上げる（起動時に明細から作り直す）
+# 2: 項目別の集計をマニュアル・版ごとに分けた
+ROLLUP_VERSION = 2
+
+# 後から追加した列（古いデータベースには起動時に追加する）
+INSPECTION_COLUMNS = {"manual_key": "TEXT NOT NULL DEFAULT ''"}
+
+# 集計表への加算・減算（:sign = 1 で加算、-1 で減算）
+ROLLUP_SQL = (
+    """
+    INSERT INTO rollup_item_month (month, manual_key, manual_version, category, item_id, total, failed)
+    SELECT substr(i.inspection_date, 1, 7), i.manual_key, i.manual_version, COALESCE(mi.category, ''),
+           ii.item_id, :sign, :sign * (1 - ii.passed)
+    FROM inspections i
+    JOIN inspection_items ii ON ii.inspection_id = i.id
+    LEFT JOIN manual_items mi ON mi.manual_version = i.manual_version AND mi.item_id = ii.item_id
+    WHERE i.id = :id
+    ON CONFLICT (month, manual_key, manual_version, category, item_id) DO UPDATE SET
+        total = total + excluded.total,
+        failed = failed + excluded.failed
+    """,
+    """
+    INSERT INTO rollup_lot_month (month, lot_no, inspections, failed_inspections, items, failed_items)
+    SELECT substr(inspection_date, 1, 7), lot_no, :sign, :sign * (failed_count > 0),
+           :sign * item_count, :sign * failed_count
+    FROM inspections WHERE id = :id
+    ON CONFLICT (month, lot_no) DO UPDATE SET
+        inspections = inspections + excluded.inspections,
+        failed_inspections = failed_inspections + excluded.failed_inspections,
+        items = items + excluded.items,
+        failed_items = failed_items + excluded.failed_items
+    """,
+    """
+    INSERT INTO rollup_month (month, inspections, failed_inspections, items, failed_items)
+    SELECT substr(inspection_date, 1, 7), :sign, :sign * (failed_count > 0),
+           :sign * item_count, :sign * failed_count
+    FROM inspections WHERE id = :id
+    ON CONFLICT (month) DO UPDATE SET
+        inspections = inspections + excluded.inspections,
+        failed_inspections = failed_inspections + excluded.failed_inspections,
+        items = items + excluded.items,
+        failed_items = failed_items + excluded.failed_items
+    """,
+)
+
+ROLLUP_TABLES = ("rollup_item_month", "rollup_lot_month", "rollup_month")
+
+SEARCH_COLUMNS = ("serial", "in_no", "lot_no")
+
+# 項目をマニュアルの行の順に並べる式（項目 ID は "item_行番号" なので、
+# 項目定義が無いときも文字列ではなく行番号の数値で並べる。item_10 が item_2 より前にならない）
+ITEM_ORDER = "COALESCE(mi.excel_row, CAST(substr(ii.item_id, 6) AS INTEGER)), ii.item_id"
+
+# iter_item_rows が返す列
+ITEM_ROW_COLUMNS = (
+    "inspection_id", "inspection_date", "serial", "in_no", "lot_no", "writer", "reviewer",
+    "manual_version", "item_id", "category", "description", "excel_row", "passed", "photo_ref",
+)
+
+
+def _date_text(value):
+    if isinstance(value, (date, datetime)):
+        return value.strftime("%Y-%m-%d")
+    return str(value)
+
+def _apply_rollups(conn, inspection_id, sign):
+    """検査 1 件分を集計表に加算（sign=1）または減算（sign=-1）する"""
+    for sql in ROLLUP_SQL:
+        conn.execute(sql, {'id': inspection_id, 'sign': sign})
+
+def _insert_photo_hashes(conn, rows):
+    """写真の dHash を登録する rows: [(写真のハッシュ, dHash), ...]（登録済みなら上書き）"""
+    conn.executemany(
+        "INSERT OR REPLACE INTO photo_hashes (photo_ref, dhash, band0, band1, band2, band3)"
+        " VALUES (?, ?, ?, ?, ?, ?)",
+        (photo_index.hash_row(photo_ref, value) for photo_ref, value in rows)
+    )
+
+def _delete_unreferenced_hashes(conn, photo_refs):
+    conn.executemany(
+        "DELETE FROM photo_hashes WHERE photo_ref = ?"
+        " AND NOT EXISTS (SELECT 1 FROM inspection_items WHERE photo_ref = photo_hashes.photo_ref)",
+        [(photo_ref,) for photo_ref in set(photo_refs)]
+    )
+
+def manual_item_rows(manual_items):
+    """
+    マニュアルの項目定義を manual_items 表の行に変換する [(項目ID, カテゴリ, 検査内容, 行番号)]
+    カテゴリ欄は結合セルのため先頭行にしか値が無いので、空欄は直前のカテゴリで埋める
+    """
+    rows = []
+    current = ""
+    for item in manual_items:
+        if item['category']:
+            current = item['category'].replace("\n", "")
+        rows.append((item['id'], current, item['description'], item['excel_row']))
+    return rows
+
+
+class InspectionHistory:
+    """検査履歴の保存と検索"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(inspections)")}
+            for name, column_type in INSPECTION_COLUMNS.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE inspections ADD COLUMN {name} {column_type}")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < ROLLUP_VERSION:
+                # 集計表の列が変わっていることがあるので作り直す
+                for table in ROLLUP_TABLES:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.executescript(SCHEMA)
+                self._rebuild_rollups(conn)
+                conn.execute(f"PRAGMA user_version = {ROLLUP_VERSION}")
+
+    @contextmanager
+    def _connect(self):
+        """1 トランザクション分の接続（終了時にコミットして閉じる）"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- 保存 ----------
+
+    def save_inspection(self, header, results, photo_refs, manual_items, manual_version, inspection_id=None,
+                        manual_key="", photo_hashes=None):
+        """
+        検査 1 件を保存し、ID を返す
+        header: {'serial', 'in_no', 'lot_no', 'writer', 'reviewer', 'inspection_date'}
+        results: {項目ID: 可なら True}
+        photo_refs: {項目ID: 写真ストアのハッシュ}
+        manual_key: マニュアルの登録簿のキー（項目別の集計をマニュアルごとに分ける）
+        photo_hashes: {項目ID: 写真の dHash}（ほぼ同じ写真の検索用に登録する）
+        inspection_id を渡すと、その検査を上書きする（同じ検査の再生成）
+        """
+        known = {item['id'] for item in manual_items}
+        rows = [
+            (item_id, 1 if passed else 0, photo_refs.get(item_id))
+            for item_id, passed in results.items() if item_id in known
+        ]
+        values = (
+            datetime.now().isoformat(timespec="seconds"),
+            _date_text(header.get('inspection_date', "")),
+            header.get('serial') or "",
+            header.get('in_no') or "",
+            header.get('lot_no') or "",
+            header.get('writer') or "",
+            header.get('reviewer') or "",
+            manual_version or "",
+            manual_key or "",
+            len(rows),
+            sum(1 for row in rows if not row[1]),
+            sum(1 for row in rows if row[2]),
+        )
+
+        hash_rows = [
+            (photo_refs[item_id], value) for item_id, value in (photo_hashes or {}).items()
+            if photo_refs.get(item_id) and item_id in known
+        ]
+
+        with self._connect() as conn:
+            replaced = []
+            conn.executemany(
+                "INSERT OR IGNORE INTO manual_items (manual_version, item_id, category, description, excel_row)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(manual_version or "",) + row for row in manual_item_rows(manual_items)]
+            )
+            if inspection_id is not None:
+                # 上書きする検査の分を集計表から差し引いておく
+                _apply_rollups(conn, inspection_id, -1)
+                updated = conn.execute(
+                    "UPDATE inspections SET created_at = ?, inspection_date = ?, serial = ?, in_no = ?,"
+                    " lot_no = ?, writer = ?, reviewer = ?, manual_version = ?, manual_key = ?, item_count = ?,"
+                    " failed_count = ?, photo_count = ? WHERE id = ?",
+                    values + (inspection_id,)
+                ).rowcount
+                if updated:
+                    replaced = [row[0] for row in conn.execute(
+                        "SELECT photo_ref FROM inspection_items WHERE inspection_id = ? AND photo_ref IS NOT NULL",
+                        (inspection_id,)
+                    )]
+                    conn.execute("DELETE FROM inspection_items WHERE inspection_id = ?", (inspection_id,))
+                else:
+                    inspection_id = None
+            if inspection_id is None:
+                inspection_id = conn.execute(
+                    "INSERT INTO inspections (created_at, inspection_date, serial, in_no, lot_no, writer,"
+                    " reviewer, manual_version, manual_key, item_count, failed_count, photo_count)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    values
+                ).lastrowid
+            conn.executemany(
+                "INSERT INTO inspection_items (inspection_id, item_id, passed, photo_ref) VALUES (?, ?, ?, ?)",
+                [(inspection_id,) + row for row in rows]
+            )
+            _apply_rollups(conn, inspection_id, 1)
+            _insert_photo_hashes(conn, hash_rows)
+            # 上書きで差し替えられ、どの検査からも参照されなくなった写真は検索の対象から外す
+            _delete_unreferenced_hashes(conn, replaced)
+        return inspection_id
+
+    def versions_without_manual_key(self):
+        """マニュアルのキーが記録されていない検査（マニュアルの登録簿より前の検査）の版の一覧"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT manual_version FROM inspections WHERE manual_key = ''"
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def assign_manual_key(self, manual_version, manual_key):
+        """
+        キーが記録されていない検査のうち、版が manual_version のものに manual_key を記録する
+        集計表も検査ごとに差し引いて加え直す。戻り値: 更新した検査の件数
+        """
+        with self._connect() as conn:
+            ids = [row[0] for row in conn.execute(
+                "SELECT id FROM inspections WHERE manual_key = '' AND manual_version = ?", (manual_version,)
+            )]
+            for inspection_id in ids:
+                _apply_rollups(conn, inspection_id, -1)
+                conn.execute("UPDATE inspections SET manual_key = ? WHERE id = ?", (manual_key, inspection_id))
+                _apply_rollups(conn, inspection_id, 1)
+        return len(ids)
+
+    def _rebuild_rollups(self, conn):
+        """集計表を明細から作り直す（集計表の追加・変更時）"""
+        for table in ROLLUP_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute(
+            "INSERT INTO rollup_item_month (month, manual_key, manual_version, category, item_id, total, failed)"
+            " SELECT substr(i.inspection_date, 1, 7), i.manual_key, i.manual_version, COALESCE(mi.category, ''),"
+            "        ii.item_id, COUNT(*), SUM(1 - ii.passed)"
+            " FROM inspections i"
+            " JOIN inspection_items ii ON ii.inspection_id = i.id"
+            " LEFT JOIN manual_items mi ON mi.manual_version = i.manual_version AND mi.item_id = ii.item_id"
+            " GROUP BY 1, 2, 3, 4, 5"
+        )
+        conn.execute(
+            "INSERT INTO rollup_lot_month (month, lot_no, inspections, failed_inspections, items, failed_items)"
+            " SELECT substr(inspection_date, 1, 7), lot_no, COUNT(*), SUM(failed_count > 0),"
+            "        SUM(item_count), SUM(failed_count)"
+            " FROM inspections GROUP BY 1, 2"
+        )
+        conn.execute(
+            "INSERT INTO rollup_month (month, inspections, failed_inspections, items, failed_items)"
+            " SELECT month, SUM(inspections), SUM(failed_inspections), SUM(items), SUM(failed_items)"
+            " FROM rollup_lot_month GROUP BY month"
+        )
+
+    # ---------- 集計 ----------
+
+    def failure_rates(self, by, date_from=None, date_to=None, limit=None, manual_key=None):
+        """
+        集計表から不合格率を返す
+        by: 'item'（項目別）, 'category'（カテゴリ別）, 'lot'（ロット別）, 'month'（月別）
+        期間は月単位（date_from / date_to を含む月）で絞り込む
+        manual_key を渡すと、項目別・カテゴリ別はそのマニュアルの検査だけを集計する
+        各行に total（件数）, failed（不合格数）, rate（不合格率）を含む
+        項目別は manual_key・manual_version ごとの行で、description はその版のマニュアルの検査内容
+        カテゴリ別は manual_key ごとの行
+        """
+        queries = {
+            'item': (
+                "SELECT r.manual_key, r.manual_version, r.category, r.item_id, mi.description,"
+                " SUM(r.total) AS total, SUM(r.failed) AS failed"
+                " FROM rollup_item_month r"
+                " LEFT JOIN manual_items mi ON mi.manual_version = r.manual_version AND mi.item_id = r.item_id"
+                " {where} GROUP BY r.manual_key, r.manual_version, r.category, r.item_id"
+            ),
+            'category': (
+                "SELECT manual_key, category, SUM(total) AS total, SUM(failed) AS failed"
+                " FROM rollup_item_month {where} GROUP BY manual_key, category"
+            ),
+            'lot': (
+                "SELECT lot_no, SUM(inspections) AS inspections,"
+                " SUM(failed_inspections) AS failed_inspections,"
+                " SUM(items) AS total, SUM(failed_items) AS failed"
+                " FROM rollup_lot_month {where} GROUP BY lot_no"
+            ),
+            'month': (
+                "SELECT month, inspections, failed_inspections, items AS total, failed_items AS failed"
+                " FROM rollup_month {where}"
+            ),
+        }
+        if by not in queries:
+            raise ValueError(f"未対応の集計単位です: {by!r}")
+
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("month >= ?")
+            params.append(_date_text(date_from)[:7])
+        if date_to:
+            conditions.append("month <= ?")
+            params.append(_date_text(date_to)[:7])
+        if manual_key is not None and by in ('item', 'category'):
+            conditions.append("manual_key = ?")
+            params.append(manual_key)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        order = "month" if by == 'month' else "failed * 1.0 / total DESC, failed DESC"
+        sql = f"SELECT * FROM ({queries[by].format(where=where)}) WHERE total > 0 ORDER BY {order}"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        result = []
+        for row in rows:
+            row = dict(row)
+            row['rate'] = row['failed'] / row['total']
+            result.append(row)
+        return result
+
+    # ---------- 検索 ----------
+
+    def search(self, serial=None, in_no=None, lot_no=None, date_from=None, date_to=None,
+               prefix=False, limit=100, offset=0):
+        """
+        検査を検索する（検査日の新しい順）
+        prefix=True なら S/N・IN.NO・ロットNO を前方一致で検索する
+        """
+        conditions = []
+        params = []
+        for column, value in zip(SEARCH_COLUMNS, (serial, in_no, lot_no)):
+            if not value:
+                continue
+            if prefix:
+                # LIKE ではなく範囲条件にしてインデックスを使う
+                conditions.append(f"{column} >= ? AND {column} < ?")
+                params.extend([value, value + "\U0010ffff"])
+            else:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if date_from:
+            conditions.append("inspection_date >= ?")
+            params.append(_date_text(date_from))
+        if date_to:
+            conditions.append("inspection_date <= ?")
+            params.append(_date_text(date_to))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM inspections {where} ORDER BY inspection_date DESC, id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def _with_items(conn, header):
+        items = conn.execute(
+            "SELECT ii.item_id, mi.category, mi.description, mi.excel_row, ii.passed, ii.photo_ref"
+            " FROM inspection_items ii"
+            " LEFT JOIN manual_items mi"
+            "   ON mi.manual_version = ? AND mi.item_id = ii.item_id"
+            " WHERE ii.inspection_id = ?"
+            f" ORDER BY {ITEM_ORDER}",
+            (header['manual_version'], header['id'])
+        ).fetchall()
+        result = dict(header)
+        result['items'] = [dict(row) for row in items]
+        return result
+
+    def get(self, inspection_id):
+        """検査 1 件のヘッダーと項目ごとの結果を返す（無ければ None）"""
+        with self._connect() as conn:
+            header = conn.execute("SELECT * FROM inspections WHERE id = ?", (inspection_id,)).fetchone()
+            if header is None:
+                return None
+            return self._with_items(conn, header)
+
+    def iter_inspections(self, date_from=None, date_to=None, chunk_size=500):
+        """
+        検査を検査日・ID の順に 1 件ずつ get() と同じ形式で返すジェネレーター
+        ヘッダーは chunk_size 件ずつ読み、項目はその都度読むので、件数が多くてもメモリ使用量は一定
+        """
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("inspection_date >= ?")
+            params.append(_date_text(date_from))
+        if date_to:
+            conditions.append("inspection_date <= ?")
+            params.append(_date_text(date_to))
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            cursor = conn.execute(f"SELECT * FROM inspections {where} ORDER BY inspection_date, id", params)
+            while True:
+                headers = cursor.fetchmany(chunk_size)
+                if not headers:
+                    break
+                for header in headers:
+                    yield self._with_items(conn, header)
+
+    def iter_item_rows(self, date_from=None, date_to=None, categories=None, chunk_size=5000):
+        """
+        (検査, 項目) ごとの行を chunk_size 件ずつのリストで返すジェネレーター
+        列は ITEM_ROW_COLUMNS の順。検査日・検査 ID・マニュアルの行の順に並ぶ
+        全件をメモリに載せないよう、カーソルから fetchmany で少しずつ読む
+        """
+        conditions = []
+        params = []
+        if date_from:
+            conditions.append("i.inspection_date >= ?")
+            params.append(_date_text(date_from))
+        if date_to:
+            conditions.append("i.inspection_date <= ?")
+            params.append(_date_text(date_to))
+        if categories:
+            categories = list(categories)
+            conditions.append(f"mi.category IN ({', '.join('?' * len(categories))})")
+            params.extend(categories)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT i.id, i.inspection_date, i.serial, i.in_no, i.lot_no, i.writer, i.reviewer,"
+                " i.manual_version, ii.item_id, mi.category, mi.description, mi.excel_row,"
+                " ii.passed, ii.photo_ref"
+                " FROM inspections i"
+                " JOIN inspection_items ii ON ii.inspection_id = i.id"
+                " LEFT JOIN manual_items mi"
+                "   ON mi.manual_version = i.manual_version AND mi.item_id = ii.item_id"
+                f" {where}"
+                f" ORDER BY i.inspection_date, i.id, {ITEM_ORDER}",
+                params
+            )
+            # 行数が多いので sqlite3.Row ではなくタプルのまま受け取る
+            cursor.row_factory = None
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    # ---------- 写真の知覚ハッシュ ----------
+
+    def add_photo_hashes(self, rows):
+        """写真の dHash を登録する rows: [(写真のハッシュ, dHash), ...]（登録済みなら上書き）"""
+        with self._connect() as conn:
+            _insert_photo_hashes(conn, rows)
+
+    def add_photo_hash(self, photo_ref, value):
+        self.add_photo_hashes([(photo_ref, value)])
+
+    def prune_photo_hashes(self):
+        """どの検査からも参照されていない写真の dHash を削除し、件数を返す"""
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM photo_hashes"
+                " WHERE NOT EXISTS (SELECT 1 FROM inspection_items WHERE photo_ref = photo_hashes.photo_ref)"
+            ).rowcount
+
+    def photos_without_hash(self):
+        """履歴から参照されていて dHash が未登録の写真のハッシュ一覧"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT ii.photo_ref FROM inspection_items ii"
+                " LEFT JOIN photo_hashes ph ON ph.photo_ref = ii.photo_ref"
+                " WHERE ii.photo_ref IS NOT NULL AND ph.photo_ref IS NULL"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def similar_photos(self, value, max_distance=photo_index.DEFAULT_MAX_DISTANCE,
+                       exclude_inspection=None, limit=5):
+        """
+        dHash が value に近い写真を使った過去の検査項目を、近い順（同じ距離なら新しい順）に返す
+        exclude_inspection: 除く検査 ID（同じ検査の再生成で自分の写真に一致しないように）
+        戻り値: [{'distance', 'photo_ref', 'inspection_id', 'inspection_date', 'serial', 'in_no',
+                  'lot_no', 'item_id', 'description'}, ...]
+        """
+        if not photo_index.is_informative(value):
+            return []
+        with self._connect() as conn:
+            distances = dict(photo_index.nearest(conn, value, max_distance))
+            if not distances:
+                return []
+            refs = list(distances)
+            params = refs[:]
+            exclude = ""
+            if exclude_inspection is not None:
+                exclude = " AND i.id != ?"
+                params.append(exclude_inspection)
+            rows = conn.execute(
+                "SELECT ii.photo_ref, i.id AS inspection_id, i.inspection_date, i.serial, i.in_no, i.lot_no,"
+                " ii.item_id, mi.description"
+                " FROM inspection_items ii"
+                " JOIN inspections i ON i.id = ii.inspection_id"
+                " LEFT JOIN manual_items mi"
+                "   ON mi.manual_version = i.manual_version AND mi.item_id = ii.item_id"
+                f" WHERE ii.photo_ref IN ({', '.join('?' * len(refs))}){exclude}",
+                params
+            ).fetchall()
+        matches = [dict(row, distance=distances[row['photo_ref']]) for row in rows]
+        matches.sort(key=lambda match: (match['inspection_date'], match['inspection_id']), reverse=True)
+        matches.sort(key=lambda match: match['distance'])
+        return matches[:limit]
+
+    def referenced_photos(self):
+        """履歴から参照されている写真のハッシュ一覧"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT photo_ref FROM inspection_items WHERE photo_ref IS NOT NULL"
+            ).fetchall()
+        return {row[0] for row in rows}
@@ -0,0 +1,312 @@
+"""
+重い処理（レポート作成・写真の取り込み）のワーカープール
+
+Streamlit のセッションはすべて同じプロセスのスレッドで動くため、あるユーザーの
+レポート作成（PIL・wb.save）が GIL を握ると、他のユーザーの画面まで止まる
+ここでは重い処理を別プロセスのワーカーに渡し、セッションはジョブの完了を待つだけにする
+（待っている間は GIL を手放すので、他のセッションは止まらない）
+
+    pool = JobPool(max_workers=4)
+    job = pool.submit(build_report_files, request, label="report")
+    st.session_state.report_job = job.id        # 再実行をまたいでも同じジョブを待てる
+    files, errors = pool.get(job_id).result(timeout=120)
+
+ワーカーで実行する関数はモジュール直下に置く（プロセス間で pickle して渡すため）
+引数には写真のバイト列ではなくファイルパスを渡し、受け渡しの量を減らす
+ワーカーのマニュアルのテンプレートはワーカーごとに report のキャッシュに残る
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+import types
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from . import metrics
+
+JOB_WORKERS = max(2, min(4, (os.cpu_count() or 1) - 1))
+WORKER_KINDS = ("process", "thread")
+
+# 完了してから結果を受け取られないまま残すジョブの秒数
+JOB_TTL = 15 * 60
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+STATUS_LABELS = {
+    STATUS_QUEUED: "順番待ち",
+    STATUS_RUNNING: "処理中",
+    STATUS_DONE: "完了",
+    STATUS_FAILED: "失敗",
+}
+
+
+# ========== レポート作成の依頼 ==========
+
+def report_request(report_format, inspection_data, photos, manual_items, manual, writer, reviewer,
+                   serial, lot_no, in_no, inspection_date):
+    """
+    build_report_files に渡すレポート作成の依頼を組み立てる
+    report_format: "Excel" / "PDF" / "Excel + PDF"
+    photos: {項目ID: 写真のパス}
+    manual: マニュアルの登録簿の 1 件 {'path', 'layout', ...}
+    """
+    return {
+        'formats': [fmt for fmt in ("Excel", "PDF") if fmt in report_format],
+        'timestamp': datetime.now().strftime("%Y%m%d_%H%M%S"),
+        'inspection_data': inspection_data,
+        'photos': photos,
+        'manual_items': manual_items,
+        'writer': writer,
+        'reviewer': reviewer,
+        'serial': serial,
+        'lot_no': lot_no,
+        'in_no': in_no,
+        'inspection_date': inspection_date,
+        'manual_path': manual['path'],
+        'layout': manual['layout'],
+    }
+
+
+# ========== ワーカーで実行する処理 ==========
+
+def build_report_files(request):
+    """
+    レポート（Excel / PDF）を作る
+    request: {'formats': ["Excel", "PDF"], 'timestamp', 'inspection_data', 'photos': {項目ID: パス},
+              'manual_items', 'writer', 'reviewer', 'serial', 'lot_no', 'in_no', 'inspection_date',
+              'manual_path', 'layout'}
+    戻り値: (files, errors)
+        files  = [(ファイル名, バイト列, MIME タイプ), ...]
+        errors = [(形式, エラー内容, トレースバック), ...]（片方の形式だけ失敗しても他方は返す）
+    """
+    from . import report
+    from .outbox import PDF_MIME, XLSX_MIME
+
+    args = (
+        request['inspection_data'], request['photos'], request['manual_items'],
+        request['writer'], request['reviewer'], request['serial'],
+        request['lot_no'], request['in_no'], request['inspection_date'],
+    )
+    files = []
+    errors = []
+    if "Excel" in request['formats']:
+        try:
+            data = report.create_excel_report(
+                *args, manual_path=request['manual_path'], layout=request['layout']
+            )
+            files.append((f"inspection_{request['timestamp']}.xlsx", data.getvalue(), XLSX_MIME))
+        except Exception as e:
+            errors.append(("Excel", str(e), traceback.format_exc()))
+    if "PDF" in request['formats']:
+        try:
+            from . import pdf_report
+
+            data = pdf_report.create_pdf_report(*args)
+            files.append((f"inspection_{request['timestamp']}.pdf", data.getvalue(), PDF_MIME))
+        except Exception as e:
+            errors.append(("PDF", str(e), traceback.format_exc()))
+    return files, errors
+
+def ingest_photo_job(data, max_px, quality, fmt):
+    """アップロードされた写真の取り込み（photos.ingest_photo をワーカーで実行）"""
+    from .photos import ingest_photo
+
+    return ingest_photo(data, max_px=max_px, quality=quality, fmt=fmt)
+
+def _warm_up():
+    """ワーカー起動時に重い依存を読み込んでおく（最初のジョブを遅くしない）"""
+    from . import report  # noqa: F401
+
+def _ready():
+    """ワーカーを起動するためだけの空のジョブ"""
+    return os.getpid()
+
+def _run(func, args, kwargs, collect=False, tracing=False):
+    """
+    ワーカー側で func を実行し、開始・終了時刻とワーカーの PID も返す
+    collect=True（別プロセスのワーカー）のときは、実行中の計測値も返して呼び出し元で合算する
+    （ワーカーは 1 度に 1 つのジョブしか実行しないので、実行前にリセットすればそのジョブの分だけになる）
+    """
+    if collect:
+        metrics.set_memory_tracing(tracing)
+        metrics.reset()
+    started = time.time()
+    result = func(*args, **kwargs)
+    finished = time.time()
+    return result, started, finished, os.getpid(), metrics.snapshot() if collect else None
+
+
+# ========== ジョブとプール ==========
+
+# ワーカーの起動（__main__ の差し替え）を同時に行わない
+_spawn_lock = threading.Lock()
+
+
+@contextmanager
+def _without_main_script():
+    """
+    spawn の子プロセスは起動時に __main__ のファイルを読み込み直す
+    Streamlit では __main__ が実行中のアプリのスクリプトなので、ワーカーを起動する間だけ
+    空のモジュールに差し替えて、ワーカーがアプリを実行しないようにする
+    差し替えはプロセス全体に効くので、プールを作るときに 1 回だけ行う（投入のたびには行わない）
+    """
+    main = sys.modules.get('__main__')
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try:
+        yield
+    finally:
+        sys.modules['__main__'] = main
+
+
+class Job:
+    """投入したジョブのハンドル（concurrent.futures.Future の薄いラッパー）"""
+
+    def __init__(self, job_id, label, future):
+        self.id = job_id
+        self.label = label
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.worker = None
+        self._future = future
+        self._recorded = False
+
+    @property
+    def status(self):
+        if self._future.done():
+            return STATUS_FAILED if self._future.exception() is not None else STATUS_DONE
+        return STATUS_RUNNING if self._future.running() else STATUS_QUEUED
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        """
+        完了を待って結果を返す（timeout 秒を過ぎたら TimeoutError）
+        ワーカーで起きた例外はそのまま送出する
+        """
+        try:
+            result, started, finished, worker, worker_metrics = self._future.result(timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"ジョブ {self.id} が {timeout} 秒以内に終わりませんでした") from None
+        self.started_at, self.finished_at, self.worker = started, finished, worker
+        if not self._recorded:
+            # ワーカーのプロセスで計測した段階ごとの値を、どのジョブの値かのラベルを付けて合算する
+            if worker_metrics is not None:
+                metrics.merge(worker_metrics, job=self.label)
+            # 順番待ちの時間と実行時間を分けて記録する
+            metrics.observe("job_wait", max(0.0, started - self.submitted_at), job=self.label)
+            metrics.observe("job_run", finished - started, job=self.label)
+            self._recorded = True
+        return result
+
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.submitted_at
+
+
+class JobPool:
+    """
+    ワーカープール（全セッションで 1 つを共有する）
+    kind="process" はプロセスプール（spawn で起動するので、Streamlit のスレッドを fork しない）
+    kind="thread" はスレッドプール（プロセスを起動できない環境用。GIL の競合は減らない）
+    ワーカーはプールを作るときにすべて起動する
+    ワーカーが異常終了してプールが壊れた場合は、次の投入時に作り直す
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, kind="process", ttl=JOB_TTL):
+        if kind not in WORKER_KINDS:
+            raise ValueError(f"未対応のワーカーの種類です: {kind!r}（{' / '.join(WORKER_KINDS)}）")
+        self.max_workers = max_workers
+        self.kind = kind
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        if self.kind == "thread":
+            return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        executor = ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up
+        )
+        # プロセスプールは空きのワーカーが無いと投入時にワーカーを 1 つ起動するので、
+        # 作った直後に空のジョブを max_workers 個続けて投入して全ワーカーを起動しておく
+        # （起動には時間がかかるので、続けて投入すればどれも空きのワーカーが無い状態で投入される）
+        # 以後はワーカーが揃っているので、投入時に __main__ を差し替える必要はない
+        with _spawn_lock, _without_main_script():
+            for _ in range(self.max_workers):
+                executor.submit(_ready)
+        return executor
+
+    def _submit(self, func, args, kwargs):
+        if self.kind == "process":
+            return self._executor.submit(_run, func, args, kwargs, True, tracemalloc.is_tracing())
+        return self._executor.submit(_run, func, args, kwargs)
+
+    def _prune(self, now):
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.done() and now - job.submitted_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, func, *args, label="job", **kwargs):
+        """func(*args, **kwargs) をワーカーで実行するジョブを投入し、ハンドルを返す"""
+        with self._lock:
+            self._prune(time.time())
+            if self._executor is None:
+                self._executor = self._new_executor()
+            try:
+                future = self._submit(func, args, kwargs)
+            except BrokenProcessPool:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._new_executor()
+                future = self._submit(func, args, kwargs)
+                metrics.incr("job_pool_restarts_total")
+            job = Job(uuid.uuid4().hex, label, future)
+            self._jobs[job.id] = job
+        metrics.incr("jobs_submitted_total", job=label)
+        return job
+
+    def run(self, func, *args, label="job", timeout=None, **kwargs):
+        """ジョブを投入して完了まで待ち、結果を返す"""
+        return self.submit(func, *args, label=label, **kwargs).result(timeout)
+
+    def get(self, job_id):
+        """ID からジョブを取得（期限切れ・不明なら None）"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        """結果を受け取ったジョブを一覧から外す"""
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def stats(self):
+        """状態ごとのジョブ数とワーカー数（管理画面用）"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in STATUS_LABELS}
+        for job in jobs:
+            counts[job.status] += 1
+        return {'kind': self.kind, 'workers': self.max_workers, **counts}
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
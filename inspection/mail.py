@@ -0,0 +1,96 @@
+"""
+検査結果メールの作成と SMTP 設定
+
+件名・本文の組み立てと SMTP 設定の読み込みを Streamlit から切り離し、
+画面（inspection_form_app.py）以外からも同じ内容のメールを送れるようにする
+実際の送信は outbox（送信キュー）が行う
+"""
+
+from .outbox import XLSX_MIME
+from .text import normalize_email
+
+DEFAULT_SMTP_PORT = "587"
+FOOTER = "入荷検査フォーム v3.4"
+
+# 添付ファイル一覧で Excel に付ける説明
+XLSX_NOTE = "（シート1: 検査結果 / シート2: 検査写真）"
+
+
+def smtp_settings(source):
+    """
+    SMTP 設定を取得する（st.secrets・os.environ など get を持つものから読む）
+    SMTP_SERVER・SMTP_EMAIL・SMTP_PASSWORD のどれかが無ければ None
+    """
+    server = source.get("SMTP_SERVER")
+    port = source.get("SMTP_PORT", DEFAULT_SMTP_PORT)
+    email = source.get("SMTP_EMAIL")
+    password = source.get("SMTP_PASSWORD")
+
+    if not all([server, email, password]):
+        return None
+
+    return {
+        'server': server,
+        'port': int(port),
+        'email': normalize_email(email),
+        'password': password,
+    }
+
+def report_email(inspector_id, in_no, lot_no, writer_name, reviewer_name, inspection_date,
+                 passed, failed, attachments):
+    """
+    検査結果メールの件名と本文を作る
+    attachments: [(ファイル名, バイト列, MIME タイプ), ...]
+    戻り値: (件名, 本文)
+    """
+    attachment_notes = "\n".join(
+        f"- {filename}" + (XLSX_NOTE if mime == XLSX_MIME else "")
+        for filename, _, mime in attachments
+    )
+
+    subject = f"Inspection Result - {in_no} / {lot_no}"
+    body = f"""
+入荷検査が完了しました。
+
+【検査情報】
+本体S/N: {inspector_id}
+IN.NO: {in_no}
+ロットNO: {lot_no}
+作業者: {writer_name}
+確認者: {reviewer_name}
+検査日: {inspection_date}
+
+【結果】
+合格項目: {passed}件
+不合格項目: {failed}件
+
+詳細は添付のファイルをご確認ください。
+{attachment_notes}
+
+---
+{FOOTER}
+"""
+    return subject, body
+
+def report_summary(inspector_id, in_no, lot_no, writer_name, reviewer_name, inspection_date,
+                   inspection_data):
+    """
+    まとめ送信（digest）の一覧表・まとめブック用に、検査 1 件分の結果を JSON にできる形で返す
+    inspection_data: 項目ID → {'pass', 'category', 'description'}
+    """
+    items = [
+        [data.get('category', ""), data.get('description', ""), bool(data.get('pass', True))]
+        for data in inspection_data.values()
+    ]
+    passed = sum(1 for item in items if item[2])
+    return {
+        'serial': inspector_id,
+        'in_no': in_no,
+        'lot_no': lot_no,
+        'writer': writer_name,
+        'reviewer': reviewer_name,
+        'inspection_date': str(inspection_date),
+        'passed': passed,
+        'failed': len(items) - passed,
+        'items': items,
+    }
@@ -0,0 +1,150 @@
+"""
+マニュアルの登録簿（部品種別ごとのマニュアル）
+
+manuals/ ディレクトリの *.xlsx を 1 件ずつマニュアルとして登録する
+同じ名前の *.json（記述子）を置くと、表示名と検査項目の位置を指定できる
+
+    manuals/power_unit.xlsx
+    manuals/power_unit.json
+    {
+      "name": "電源ユニット",
+      "item_rows": [11, 45],
+      "skip_rows": [40, 41],
+      "category_column": "A",
+      "description_column": "D",
+      "checkbox_columns": ["U", "Y"]
+    }
+
+記述子で省略した項目は既定のレイアウト（report.DEFAULT_LAYOUT）になる
+解析結果は report のテンプレートキャッシュに (ファイル, レイアウト) ごとに残るため、
+マニュアルを切り替えても再解析しない（ファイルか記述子が変わったときだけ解析し直す）
+"""
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from . import report
+
+DESCRIPTOR_SUFFIX = ".json"
+MANUAL_SUFFIX = ".xlsx"
+
+
+def group_items(manual_items):
+    """
+    検査項目をカテゴリごとにまとめる {カテゴリ: [(No., 項目), ...]}
+    カテゴリ欄が空の行は直前のカテゴリに含める
+    """
+    groups = {}
+    current = "その他"
+    for number, item in enumerate(manual_items, 1):
+        if item['category']:
+            current = item['category']
+        groups.setdefault(current, []).append((number, item))
+    return groups
+
+def load_descriptor(path):
+    """
+    記述子を読み込む
+    戻り値: (表示名, レイアウト)。表示名が無ければ None
+    """
+    with open(path, encoding='utf-8') as f:
+        descriptor = json.load(f)
+    if not isinstance(descriptor, dict):
+        raise ValueError("記述子は JSON のオブジェクトで書いてください")
+    descriptor = dict(descriptor)
+    name = descriptor.pop('name', None)
+    return name, report.normalize_layout(descriptor)
+
+def layout_for(manual_path):
+    """マニュアルと同じ名前の記述子があればそのレイアウトを返す（無ければ None）"""
+    descriptor = Path(manual_path).with_suffix(DESCRIPTOR_SUFFIX)
+    if not descriptor.exists():
+        return None
+    return load_descriptor(descriptor)[1]
+
+
+class ManualRegistry:
+    """
+    マニュアルの一覧
+    default_path のマニュアル（従来の manual.xlsx）を先頭に、directory 内のマニュアルを名前順に並べる
+    ディレクトリの内容が変わったときだけ一覧を作り直す
+    """
+
+    def __init__(self, directory, default_path=None):
+        self.directory = Path(directory)
+        self.default_path = Path(default_path) if default_path else None
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._entries = {}
+        self.errors = []
+
+    def _files(self):
+        """一覧の元になるファイルと更新時刻"""
+        files = []
+        if self.default_path is not None:
+            files.append(self.default_path)
+            files.append(self.default_path.with_suffix(DESCRIPTOR_SUFFIX))
+        try:
+            with os.scandir(self.directory) as it:
+                files.extend(Path(entry.path) for entry in it
+                             if entry.name.endswith((MANUAL_SUFFIX, DESCRIPTOR_SUFFIX))
+                             and not entry.name.startswith(("~$", ".")))
+        except FileNotFoundError:
+            pass
+
+        stamped = []
+        for path in files:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            stamped.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return sorted(stamped)
+
+    def _scan(self, files):
+        paths = [Path(name) for name, _, _ in files if name.endswith(MANUAL_SUFFIX)]
+        if self.default_path is not None and self.default_path in paths:
+            paths.remove(self.default_path)
+            paths.insert(0, self.default_path)
+
+        entries = {}
+        errors = []
+        for path in paths:
+            key = path.stem
+            if key in entries:
+                key = f"{path.parent.name}/{path.stem}"
+            try:
+                descriptor = path.with_suffix(DESCRIPTOR_SUFFIX)
+                name, layout = load_descriptor(descriptor) if descriptor.exists() else (None, None)
+            except (OSError, ValueError, TypeError) as e:
+                errors.append(f"{descriptor.name}: {e}")
+                continue
+            entries[key] = {
+                'key': key,
+                'name': name or path.name,
+                'path': str(path),
+                'layout': layout,
+            }
+        return entries, errors
+
+    def entries(self):
+        """登録されているマニュアルの一覧 [{'key', 'name', 'path', 'layout'}, ...]"""
+        files = self._files()
+        with self._lock:
+            if files != self._stamp:
+                self._entries, self.errors = self._scan(files)
+                self._stamp = files
+            return list(self._entries.values())
+
+    def get(self, key):
+        for entry in self.entries():
+            if entry['key'] == key:
+                return entry
+        raise KeyError(key)
+
+    def load(self, key):
+        """マニュアルの解析・コンパイル済みテンプレートを取得（report のキャッシュ経由）"""
+        entry = self.get(key)
+        return report.load_manual_template(entry['path'], entry['layout'])
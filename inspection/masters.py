@@ -0,0 +1,126 @@
+"""
+検査者マスターと設定ファイル
+
+- 検査者マスターは mtime が変わったときだけ読み直し、全セッションで共有する
+- メールアドレスの正規化は列単位（pandas の文字列演算）でまとめて行う
+- 設定ファイルは内容が変わったときだけ、一時ファイル + リネームで書き込む
+
+pandas はマスターを読み込むときに読み込む（設定ファイルの保存だけなら不要）
+"""
+
+import copy
+import json
+import os
+import tempfile
+import threading
+
+MASTER_SHEET = "検査者一覧"
+EMAIL_COLUMN = "メールアドレス"
+
+
+def normalize_email_series(series):
+    """
+    メールアドレス列の全角文字を半角に変換し、空白を除去する（normalize_email の列版）
+    空欄は空文字列になる
+    """
+    return (
+        series.astype("string")
+        .fillna("")
+        .str.normalize("NFKC")
+        .str.strip()
+        .str.replace(r"[ 　]", "", regex=True)
+    )
+
+def read_master(path, sheet_name=MASTER_SHEET):
+    """検査者マスター Excel を読み込み、メールアドレスを正規化する"""
+    import pandas as pd
+
+    df = pd.read_excel(path, sheet_name=sheet_name)
+    if EMAIL_COLUMN in df.columns:
+        df[EMAIL_COLUMN] = normalize_email_series(df[EMAIL_COLUMN])
+    return df
+
+
+class MasterCache:
+    """
+    検査者マスターのプロセス共通キャッシュ
+    ファイルの mtime とサイズが変わったときだけ読み直す
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, path, sheet_name=MASTER_SHEET):
+        """キャッシュ済みのマスターを返す（呼び出し側で変更しないこと）"""
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        key = (path, sheet_name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            df = read_master(path, sheet_name)
+            self._entries[key] = (stamp, df)
+            return df
+
+_master_cache = MasterCache()
+
+def load_master(path, sheet_name=MASTER_SHEET):
+    """検査者マスターを取得（キャッシュ経由）"""
+    return _master_cache.get(path, sheet_name)
+
+
+_config_lock = threading.Lock()
+_config_written = {}
+
+def write_json_atomic(path, data):
+    """一時ファイルに書いてからリネームする（途中まで書かれたファイルを残さない）"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def save_config_if_changed(path, data):
+    """
+    設定ファイルの内容が data と異なるときだけ書き込む
+    戻り値: 書き込んだら True
+    """
+    with _config_lock:
+        try:
+            stat = os.stat(path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+
+        cached = _config_written.get(path)
+        if cached is not None and cached[0] == stamp:
+            current = cached[1]
+        elif stamp is None:
+            current = None
+        else:
+            # 他のプロセスが書き換えた場合は読み直して比較する
+            try:
+                with open(path, encoding='utf-8') as f:
+                    current = json.load(f)
+            except (OSError, ValueError):
+                current = None
+
+        if current == data:
+            _config_written[path] = (stamp, current)
+            return False
+
+        write_json_atomic(path, data)
+        stat = os.stat(path)
+        _config_written[path] = ((stat.st_mtime_ns, stat.st_size), copy.deepcopy(data))
+        return True
@@ -0,0 +1,328 @@
+"""
+処理時間・件数・メモリの計測
+
+本番でも常時有効にできるよう、計測は perf_counter とロック付きの加算だけにしている
+- timed(段階名)       処理時間を集計する（with 文・デコレーターの両方で使える）
+- incr(名前)          件数を数える
+- timed(..., memory=True)  前後の RSS と、tracemalloc 有効時は段階中のピークも記録する
+                           （tracemalloc はメモリ確保が遅くなるため既定では無効）
+
+集計結果は snapshot() で取り出せるほか、Prometheus のテキスト形式（textfile collector 用）で
+書き出せる。configure_json_log() を呼ぶと、段階ごとの計測値を 1 行 1 JSON でログにも出す
+別プロセスのワーカーで計測した値は、ワーカーの snapshot() を merge() で合算する
+"""
+
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+# Prometheus のヒストグラムの区切り（秒）
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX = "inspection"
+
+logger = logging.getLogger("inspection.metrics")
+logger.propagate = False
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    """現在の RSS（取得できない環境ではピーク RSS）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+class _Timer:
+    __slots__ = ("count", "total", "max", "last", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        if seconds > self.max:
+            self.max = seconds
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+
+class _Timed:
+    """timed() の戻り値（with 文とデコレーターを兼ねる）"""
+
+    __slots__ = ("metrics", "stage", "memory", "labels", "started", "rss_before", "traced_before")
+
+    def __init__(self, metrics, stage, memory, labels):
+        self.metrics = metrics
+        self.stage = stage
+        self.memory = memory
+        self.labels = labels
+
+    def __enter__(self):
+        if self.memory:
+            self.rss_before = rss_bytes()
+            self.traced_before = None
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+                self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started, **self.labels)
+        if self.memory:
+            values = {'rss_before': self.rss_before, 'rss_after': rss_bytes()}
+            if self.traced_before is not None and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                values['traced_peak'] = peak - self.traced_before
+                values['traced_retained'] = current - self.traced_before
+            self.metrics.record_memory(self.stage, values)
+        return False
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Timed(self.metrics, self.stage, self.memory, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+class Metrics:
+    """プロセス内の計測値の集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._counters = {}
+        self._memory = {}
+        self.started_at = time.time()
+
+    # ---------- 記録 ----------
+
+    def observe(self, stage, seconds, **labels):
+        key = (stage, _label_key(labels))
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is None:
+                timer = self._timers[key] = _Timer()
+            timer.observe(seconds)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(
+                {'ts': round(time.time(), 3), 'stage': stage, 'seconds': round(seconds, 6), **labels},
+                ensure_ascii=False
+            ))
+
+    def incr(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def record_memory(self, stage, values):
+        with self._lock:
+            self._memory[stage] = values
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'ts': round(time.time(), 3), 'stage': stage, 'memory': values}))
+
+    def timed(self, stage, memory=False, **labels):
+        """
+        処理時間を計測する
+            with metrics.timed("wb_save"): ...
+            @metrics.timed("load_manual")
+        """
+        return _Timed(self, stage, memory, labels)
+
+    def merge(self, snapshot, **labels):
+        """
+        別プロセス（ジョブのワーカー）の snapshot() の値を加算する
+        labels は合算する計測値に付け足すラベル（どのジョブの値かを区別する）
+        """
+        with self._lock:
+            for timer in snapshot['timers']:
+                key = (timer['stage'], _label_key({**timer['labels'], **labels}))
+                target = self._timers.get(key)
+                if target is None:
+                    target = self._timers[key] = _Timer()
+                target.count += timer['count']
+                target.total += timer['total_seconds']
+                target.max = max(target.max, timer['max_ms'] / 1000)
+                target.last = timer['last_ms'] / 1000
+                for index, count in enumerate(timer.get('buckets', ())):
+                    target.buckets[index] += count
+            for counter in snapshot['counters']:
+                key = (counter['name'], _label_key({**counter['labels'], **labels}))
+                self._counters[key] = self._counters.get(key, 0) + counter['value']
+            for stage, values in snapshot['memory'].items():
+                self._memory[stage] = dict(values)
+        if logger.isEnabledFor(logging.INFO):
+            now = round(time.time(), 3)
+            for timer in snapshot['timers']:
+                logger.info(json.dumps(
+                    {'ts': now, 'stage': timer['stage'], 'seconds': round(timer['total_seconds'], 6),
+                     'count': timer['count'], **timer['labels'], **labels},
+                    ensure_ascii=False
+                ))
+            for stage, values in snapshot['memory'].items():
+                logger.info(json.dumps({'ts': now, 'stage': stage, 'memory': values, **labels}, ensure_ascii=False))
+
+    # ---------- 取り出し ----------
+
+    def snapshot(self):
+        """集計値を辞書で返す（管理画面・JSON 出力用）"""
+        with self._lock:
+            timers = [
+                {
+                    'stage': stage, 'labels': dict(labels), 'count': t.count,
+                    'total_seconds': t.total, 'avg_ms': t.total / t.count * 1000 if t.count else 0.0,
+                    'max_ms': t.max * 1000, 'last_ms': t.last * 1000, 'buckets': list(t.buckets),
+                }
+                for (stage, labels), t in self._timers.items()
+            ]
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in self._counters.items()
+            ]
+            memory = {stage: dict(values) for stage, values in self._memory.items()}
+        return {
+            'started_at': self.started_at,
+            'rss_bytes': rss_bytes(),
+            'tracemalloc': tracemalloc.is_tracing(),
+            'timers': sorted(timers, key=lambda t: (t['stage'], sorted(t['labels'].items()))),
+            'counters': sorted(counters, key=lambda c: (c['name'], sorted(c['labels'].items()))),
+            'memory': memory,
+        }
+
+    def render_prometheus(self):
+        """Prometheus のテキスト形式で返す"""
+        def fmt_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+            return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+        with self._lock:
+            timers = sorted(self._timers.items())
+            counters = sorted(self._counters.items())
+            memory = sorted(self._memory.items())
+
+        lines = [
+            f"# HELP {PREFIX}_stage_seconds 処理段階ごとの所要時間",
+            f"# TYPE {PREFIX}_stage_seconds histogram",
+        ]
+        for (stage, labels), t in timers:
+            base = (("stage", stage),) + labels
+            cumulative = 0
+            for bound, count in zip(BUCKETS, t.buckets):
+                cumulative += count
+                lines.append(f"{PREFIX}_stage_seconds_bucket{fmt_labels(base, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}_stage_seconds_bucket{fmt_labels(base, [('le', '+Inf')])} {t.count}")
+            lines.append(f"{PREFIX}_stage_seconds_sum{fmt_labels(base)} {t.total:.6f}")
+            lines.append(f"{PREFIX}_stage_seconds_count{fmt_labels(base)} {t.count}")
+
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append(f"{PREFIX}_{name}{fmt_labels(labels)} {value}")
+
+        lines.append(f"# TYPE {PREFIX}_memory_bytes gauge")
+        for stage, values in memory:
+            for kind, value in sorted(values.items()):
+                lines.append(f"{PREFIX}_memory_bytes{fmt_labels([('stage', stage), ('kind', kind)])} {value}")
+        lines.append(f"# TYPE {PREFIX}_process_resident_memory_bytes gauge")
+        lines.append(f"{PREFIX}_process_resident_memory_bytes {rss_bytes()}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Prometheus 形式のファイルを一時ファイル + リネームで書き出す"""
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".prom")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(self.render_prometheus())
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self._memory.clear()
+            self.started_at = time.time()
+
+
+_metrics = Metrics()
+_export_lock = threading.Lock()
+_last_export = [0.0]
+
+timed = _metrics.timed
+incr = _metrics.incr
+observe = _metrics.observe
+snapshot = _metrics.snapshot
+render_prometheus = _metrics.render_prometheus
+write_prometheus = _metrics.write_prometheus
+reset = _metrics.reset
+merge = _metrics.merge
+
+
+def get_metrics():
+    return _metrics
+
+def export_if_due(path, interval=15.0):
+    """前回の書き出しから interval 秒以上たっていれば Prometheus 形式で書き出す"""
+    now = time.monotonic()
+    with _export_lock:
+        if now - _last_export[0] < interval:
+            return False
+        _last_export[0] = now
+    write_prometheus(path)
+    return True
+
+def configure_json_log(path, max_bytes=10 * 1024 ** 2, backup_count=3):
+    """計測値を 1 行 1 JSON でファイルに出力する（ローテーション付き、二重登録しない）"""
+    import logging.handlers
+
+    path = os.path.abspath(path)
+    for handler in logger.handlers:
+        if getattr(handler, 'baseFilename', None) == path:
+            return
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+def set_memory_tracing(enabled, frames=1):
+    """tracemalloc の有効・無効を切り替える"""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
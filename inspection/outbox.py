@@ -0,0 +1,533 @@
+"""
+メール送信キュー（アウトボックス）
+
+送信するメールを SQLite に保存し、バックグラウンドのワーカーが送信する
+- 画面は SMTP の応答を待たずに戻れる
+- 1 回の SMTP 接続（STARTTLS + ログイン）で複数のメールをまとめて送る
+- 一時的な失敗は指数バックオフで再送し、状態はメールごとに記録する
+- まとめ送信（enqueue_digest）の検査結果は digest_window 秒ためてから、
+  同じ送信先の分を 1 通（大きければ digest_max_bytes ごとに分割）にまとめて送る
+  まとめられなかった送信先の分は、他のメールを止めないように送信先ごとにバックオフして作り直す
+
+送信中のメールには取り出したワーカー（claimed_by）と時刻（claimed_at）を記録する
+同じデータベースを複数のプロセスで共有しても、lease_timeout 秒を過ぎた（送信途中で止まった）分だけを送信待ちに戻す
+
+smtp_factory に smtplib.SMTP 互換のクラスを渡せば、
+ローカルの偽 SMTP サーバー（aiosmtpd など）に対しても動作を確認できる
+
+smtplib・email（ssl を含む）は最初に送信するときに読み込む（画面の起動を遅くしない）
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from . import metrics
+
+logger = logging.getLogger("inspection.outbox")
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_MIME = "application/pdf"
+
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_HELD = "held"            # まとめ送信の待ち合わせ中
+STATUS_DIGESTED = "digested"    # まとめたメール（digest_id）に含めた
+
+STATUS_LABELS = {
+    STATUS_PENDING: "送信待ち",
+    STATUS_SENDING: "送信中",
+    STATUS_SENT: "送信済み",
+    STATUS_FAILED: "送信失敗",
+    STATUS_HELD: "まとめ送信待ち",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at REAL NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    sent_at REAL,
+    digest_key TEXT,
+    summary TEXT,
+    digest_id INTEGER,
+    claimed_at REAL,
+    claimed_by TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_due ON messages (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS attachments (
+    message_id INTEGER NOT NULL REFERENCES messages(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    mime_type TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_attachments_message ON attachments (message_id);
+"""
+
+# まとめ送信の列（古いデータベースには後から追加する）
+DIGEST_COLUMNS = {"digest_key": "TEXT", "summary": "TEXT", "digest_id": "INTEGER"}
+DIGEST_INDEX = "CREATE INDEX IF NOT EXISTS idx_messages_digest ON messages (status, digest_key)"
+# 送信中の取り出し元の列（古いデータベースには後から追加する）
+CLAIM_COLUMNS = {"claimed_at": "REAL", "claimed_by": "TEXT"}
+
+
+def build_message(sender, recipients, subject, body, attachments):
+    """
+    添付付きのメールを組み立てる
+    attachments: [(ファイル名, バイト列, MIME タイプ), ...]
+    """
+    from email import encoders
+    from email.header import Header
+    from email.mime.base import MIMEBase
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+
+    msg = MIMEMultipart()
+    msg['From'] = sender
+    msg['To'] = ', '.join(recipients)
+    msg['Subject'] = Header(subject, 'utf-8')
+
+    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+
+    for filename, data, mime_type in attachments:
+        maintype, _, subtype = mime_type.partition('/')
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(data)
+        encoders.encode_base64(part)
+        part.add_header(
+            'Content-Disposition',
+            'attachment',
+            filename=filename
+        )
+        msg.attach(part)
+
+    return msg
+
+
+class Outbox:
+    """
+    SQLite に保存するメール送信キュー
+    smtp_settings: {'server', 'port', 'email', 'password', 'starttls'}
+    smtp_factory: 省略時は smtplib.SMTP
+    smtp_timeout: SMTP の接続・応答を待つ秒数
+    lease_timeout: 送信中のまま放置されたメールを送信待ちに戻すまでの秒数（省略時は smtp_timeout の 5 倍）
+    digest_window: まとめ送信で最初の検査から待つ秒数
+    digest_max_bytes: まとめたメール 1 通の上限（超える分は別のメールにする）
+    digest_mode: "zip"（添付を zip にまとめる）/ "workbook"（結果を 1 冊のブックにまとめる）
+    """
+
+    def __init__(self, path, smtp_settings, smtp_factory=None, batch_size=20,
+                 max_attempts=5, backoff_base=30.0, backoff_max=3600.0, poll_interval=10.0,
+                 digest_window=1800.0, digest_max_bytes=15 * 1024 ** 2, digest_mode="zip",
+                 smtp_timeout=60.0, lease_timeout=None):
+        from .digest import DIGEST_MODES
+
+        self.path = str(path)
+        self.smtp_settings = smtp_settings
+        self.smtp_factory = smtp_factory
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.digest_window = digest_window
+        self.digest_max_bytes = digest_max_bytes
+        if digest_mode not in DIGEST_MODES:
+            raise ValueError(f"未対応のまとめ方です: {digest_mode!r}（{' / '.join(DIGEST_MODES)}）")
+        self.digest_mode = digest_mode
+        self.smtp_timeout = smtp_timeout
+        self.lease_timeout = smtp_timeout * 5 if lease_timeout is None else lease_timeout
+        # 送信中のメールの取り出し元（同じデータベースを使う他のプロセス・インスタンスと区別する）
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(messages)")}
+            for name, column_type in {**DIGEST_COLUMNS, **CLAIM_COLUMNS}.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {name} {column_type}")
+            conn.execute(DIGEST_INDEX)
+            self._release_stale(conn, time.time())
+
+    @contextmanager
+    def _connect(self):
+        """1 トランザクション分の接続（終了時にコミットして閉じる）"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---------- キュー操作 ----------
+
+    def enqueue(self, recipients, subject, body, attachments=()):
+        """メールをキューに登録し、メッセージ ID を返す"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (created_at, recipients, subject, body, status, next_attempt_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (now, json.dumps(list(recipients), ensure_ascii=False), subject, body, STATUS_PENDING, now)
+            )
+            message_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO attachments (message_id, filename, mime_type, data) VALUES (?, ?, ?, ?)",
+                [(message_id, filename, mime_type, data) for filename, data, mime_type in attachments]
+            )
+        self._wakeup.set()
+        return message_id
+
+    def enqueue_digest(self, recipients, subject, body, attachments=(), summary=None):
+        """
+        まとめ送信に登録し、メッセージ ID を返す
+        同じ送信先の分は digest_window 秒後に 1 通にまとめて送る（1 件だけならそのまま送る）
+        summary: 一覧表・まとめブック用の検査結果（mail.report_summary の戻り値）
+        """
+        recipients = list(recipients)
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO messages (created_at, recipients, subject, body, status, next_attempt_at,"
+                " digest_key, summary) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, json.dumps(recipients, ensure_ascii=False), subject, body, STATUS_HELD,
+                 now + self.digest_window, json.dumps(sorted(set(recipients)), ensure_ascii=False),
+                 json.dumps(summary or {}, ensure_ascii=False))
+            )
+            message_id = cursor.lastrowid
+            conn.executemany(
+                "INSERT INTO attachments (message_id, filename, mime_type, data) VALUES (?, ?, ?, ?)",
+                [(message_id, filename, mime_type, data) for filename, data, mime_type in attachments]
+            )
+        self._wakeup.set()
+        return message_id
+
+    def flush_digests(self, force=False):
+        """
+        待ち時間の過ぎた送信先ごとに、まとめ送信の検査を 1 通（または上限ごとに数通）にまとめて送信待ちにする
+        force: 待ち時間に関係なくすべてまとめる
+        戻り値: 作ったメールの件数
+        """
+        from .digest import build_digests
+
+        now = time.time()
+        created = 0
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            keys = [row[0] for row in conn.execute(
+                "SELECT digest_key FROM messages WHERE status = ? GROUP BY digest_key"
+                " HAVING MIN(next_attempt_at) <= ?",
+                (STATUS_HELD, float("inf") if force else now)
+            )]
+            for key in keys:
+                held = conn.execute(
+                    "SELECT id, recipients, summary, attempts FROM messages"
+                    " WHERE status = ? AND digest_key = ? ORDER BY id",
+                    (STATUS_HELD, key)
+                ).fetchall()
+                if len(held) == 1:
+                    # 1 件だけならまとめずにそのまま送る
+                    conn.execute(
+                        "UPDATE messages SET status = ?, next_attempt_at = ? WHERE id = ?",
+                        (STATUS_PENDING, now, held[0]['id'])
+                    )
+                    continue
+
+                entries = [{
+                    'id': row['id'],
+                    'summary': json.loads(row['summary'] or "{}"),
+                    'attachments': self._attachments(row['id'], conn),
+                } for row in held]
+                try:
+                    with metrics.timed("digest_build"):
+                        digests = build_digests(entries, self.digest_mode, self.digest_max_bytes)
+                except Exception as e:
+                    # この送信先の分だけ後で作り直す（他の送信先・通常のメールは止めない）
+                    logger.exception("まとめ送信の作成に失敗しました（送信先 %s）", key)
+                    self._mark_digest_retry(conn, held, e, now)
+                    continue
+                for digest in digests:
+                    cursor = conn.execute(
+                        "INSERT INTO messages (created_at, recipients, subject, body, status, next_attempt_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (now, held[0]['recipients'], digest['subject'], digest['body'], STATUS_PENDING, now)
+                    )
+                    digest_id = cursor.lastrowid
+                    conn.executemany(
+                        "INSERT INTO attachments (message_id, filename, mime_type, data) VALUES (?, ?, ?, ?)",
+                        [(digest_id, filename, mime_type, data)
+                         for filename, data, mime_type in digest['attachments']]
+                    )
+                    included = [entry['id'] for entry in digest['entries']]
+                    conn.executemany(
+                        "UPDATE messages SET status = ?, digest_id = ? WHERE id = ?",
+                        [(STATUS_DIGESTED, digest_id, message_id) for message_id in included]
+                    )
+                    conn.executemany(
+                        "DELETE FROM attachments WHERE message_id = ?", [(message_id,) for message_id in included]
+                    )
+                    created += 1
+        if created:
+            metrics.incr("digests_built_total", created)
+        if keys:
+            self._wakeup.set()
+        return created
+
+    def status(self, message_ids):
+        """
+        メッセージごとの状態を返す
+        まとめて送ったものは、まとめたメールの状態（digest_id はそのメールの ID）を返す
+        """
+        message_ids = list(message_ids)
+        if not message_ids:
+            return []
+        placeholders = ", ".join("?" * len(message_ids))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT m.id, m.subject, m.recipients, m.digest_id,"
+                " COALESCE(d.status, m.status) AS status, COALESCE(d.attempts, m.attempts) AS attempts,"
+                " COALESCE(d.next_attempt_at, m.next_attempt_at) AS next_attempt_at,"
+                " COALESCE(d.last_error, m.last_error) AS last_error, COALESCE(d.sent_at, m.sent_at) AS sent_at"
+                " FROM messages m LEFT JOIN messages d ON d.id = m.digest_id"
+                f" WHERE m.id IN ({placeholders}) ORDER BY m.id",
+                message_ids
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _release_stale(self, conn, now):
+        """
+        取り出してから lease_timeout 秒を過ぎても送信中のメールを送信待ちに戻す
+        （送信途中でプロセスが終了した場合。他のプロセスが送信中の分はそのままにする）
+        """
+        cursor = conn.execute(
+            "UPDATE messages SET status = ?, claimed_at = NULL, claimed_by = NULL"
+            " WHERE status = ? AND (claimed_at IS NULL OR claimed_at < ?)",
+            (STATUS_PENDING, STATUS_SENDING, now - self.lease_timeout)
+        )
+        if cursor.rowcount > 0:
+            logger.warning("送信途中で止まったメール %d 件を送信待ちに戻しました", cursor.rowcount)
+            metrics.incr("outbox_released_total", cursor.rowcount)
+        return cursor.rowcount
+
+    def _claim_due(self, now):
+        """送信期限の来たメールを送信中にして取り出す（期限切れの送信中のメールは先に送信待ちに戻す）"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._release_stale(conn, now)
+            rows = conn.execute(
+                "SELECT id, recipients, subject, body, attempts FROM messages"
+                " WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (STATUS_PENDING, now, self.batch_size)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE messages SET status = ?, claimed_at = ?, claimed_by = ? WHERE id = ?",
+                [(STATUS_SENDING, now, self.worker_id, row['id']) for row in rows]
+            )
+        return [dict(row) for row in rows]
+
+    def _renew_claim(self, messages):
+        """送信中のメールの取り出し時刻を更新する（バッチの送信が長引いても他のプロセスに戻されないように）"""
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE messages SET claimed_at = ? WHERE id = ? AND status = ? AND claimed_by = ?",
+                [(time.time(), message['id'], STATUS_SENDING, self.worker_id) for message in messages]
+            )
+
+    def _attachments(self, message_id, conn=None):
+        if conn is None:
+            with self._connect() as conn:
+                return self._attachments(message_id, conn)
+        rows = conn.execute(
+            "SELECT filename, data, mime_type FROM attachments WHERE message_id = ? ORDER BY rowid",
+            (message_id,)
+        ).fetchall()
+        return [(row['filename'], row['data'], row['mime_type']) for row in rows]
+
+    def _mark_sent(self, message_id):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE messages SET status = ?, attempts = attempts + 1, sent_at = ?, last_error = NULL,"
+                " claimed_at = NULL, claimed_by = NULL WHERE id = ?",
+                (STATUS_SENT, time.time(), message_id)
+            )
+            # 送信済みの添付は不要なので削除
+            conn.execute("DELETE FROM attachments WHERE message_id = ?", (message_id,))
+
+    def _mark_retry(self, message, error, permanent=False):
+        attempts = message['attempts'] + 1
+        failed = permanent or attempts >= self.max_attempts
+        metrics.incr("emails_failed_total" if failed else "email_retries_total")
+        delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE messages SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,"
+                " claimed_at = NULL, claimed_by = NULL WHERE id = ?",
+                (STATUS_FAILED if failed else STATUS_PENDING, attempts, time.time() + delay,
+                 f"{type(error).__name__}: {error}", message['id'])
+            )
+
+    def _mark_digest_retry(self, conn, held, error, now):
+        """まとめられなかった検査を、送信と同じバックオフでまとめ送信待ちに戻す（上限回数で失敗にする）"""
+        updates = []
+        for row in held:
+            attempts = row['attempts'] + 1
+            failed = attempts >= self.max_attempts
+            metrics.incr("emails_failed_total" if failed else "digest_retries_total")
+            delay = min(self.backoff_base * (2 ** (attempts - 1)), self.backoff_max)
+            updates.append((STATUS_FAILED if failed else STATUS_HELD, attempts, now + delay,
+                            f"{type(error).__name__}: {error}", row['id']))
+        conn.executemany(
+            "UPDATE messages SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+            updates
+        )
+
+    # ---------- 送信 ----------
+
+    def _open_smtp(self):
+        settings = self.smtp_settings
+        factory = self.smtp_factory
+        if factory is None:
+            import smtplib
+            factory = smtplib.SMTP
+        server = factory(settings['server'], int(settings.get('port', 587)), timeout=self.smtp_timeout)
+        try:
+            if settings.get('starttls', True):
+                server.starttls()
+            if settings.get('password'):
+                server.login(settings['email'], settings['password'])
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def drain_once(self):
+        """
+        送信期限の来たメールを 1 回の SMTP 接続でまとめて送る
+        戻り値: 送信できた件数
+        """
+        messages = self._claim_due(time.time())
+        if not messages:
+            return 0
+
+        import smtplib
+
+        try:
+            with metrics.timed("smtp_connect"):
+                server = self._open_smtp()
+        except Exception as e:
+            metrics.incr("smtp_connect_errors_total")
+            for message in messages:
+                self._mark_retry(message, e)
+            return 0
+
+        sent = 0
+        renewed = time.monotonic()
+        try:
+            for index, message in enumerate(messages):
+                if time.monotonic() - renewed > self.lease_timeout / 2:
+                    self._renew_claim(messages[index:])
+                    renewed = time.monotonic()
+                try:
+                    msg = build_message(
+                        self.smtp_settings['email'],
+                        json.loads(message['recipients']),
+                        message['subject'],
+                        message['body'],
+                        self._attachments(message['id'])
+                    )
+                    with metrics.timed("smtp_send"):
+                        server.send_message(msg)
+                except smtplib.SMTPRecipientsRefused as e:
+                    self._mark_retry(message, e, permanent=True)
+                except smtplib.SMTPServerDisconnected as e:
+                    # 接続が切れたら残りは次回に回す
+                    for rest in messages[index:]:
+                        self._mark_retry(rest, e)
+                    break
+                except smtplib.SMTPException as e:
+                    self._mark_retry(message, e)
+                except OSError as e:
+                    for rest in messages[index:]:
+                        self._mark_retry(rest, e)
+                    break
+                except Exception as e:
+                    self._mark_retry(message, e)
+                else:
+                    self._mark_sent(message['id'])
+                    metrics.incr("emails_sent_total")
+                    sent += 1
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+        return sent
+
+    # ---------- バックグラウンドワーカー ----------
+
+    def start(self):
+        """バックグラウンドの送信ワーカーを起動する（起動済みなら何もしない）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # まとめ送信で失敗しても、通常の送信は続ける
+            try:
+                self.flush_digests()
+            except Exception:
+                logger.exception("まとめ送信の処理に失敗しました")
+                metrics.incr("outbox_errors_total", stage="digest")
+            try:
+                # 1 バッチ分送れたらすぐ次のバッチへ
+                if self.drain_once() >= self.batch_size:
+                    continue
+            except Exception:
+                logger.exception("メールの送信処理に失敗しました")
+                metrics.incr("outbox_errors_total", stage="send")
+            try:
+                wait = self._next_wait()
+            except Exception:
+                logger.exception("送信待ちのメールを確認できませんでした")
+                wait = self.poll_interval
+            self._wakeup.wait(wait)
+            self._wakeup.clear()
+
+    def _next_wait(self):
+        """次の送信期限（まとめ送信はまとめる時刻）までの待ち時間（最大 poll_interval 秒）"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM messages WHERE status IN (?, ?)",
+                (STATUS_PENDING, STATUS_HELD)
+            ).fetchone()
+        if row[0] is None:
+            return self.poll_interval
+        return max(0.1, min(self.poll_interval, row[0] - time.time()))
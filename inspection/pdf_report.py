@@ -0,0 +1,292 @@
+"""
+検査レポートの PDF 出力（reportlab）
+
+スマートフォンでも開けるよう、ヘッダー情報・検査結果の表・検査写真を A4 縦に配置する
+- 日本語は reportlab 組み込みの CID フォント（HeiseiKakuGo-W5）を使い、フォントファイルは埋め込まない
+- 写真は 1 枚ずつ縮小・JPEG 圧縮して埋め込み、描いたらすぐ手放す
+  （同時にメモリに載る元画像は 1 枚だけ）
+- ページは上から順に描いて showPage で確定していく
+"""
+
+from io import BytesIO
+
+from reportlab import rl_config
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfgen import canvas
+
+from . import metrics
+from .photos import make_jpeg
+
+FONT = "HeiseiKakuGo-W5"
+PAGE_WIDTH, PAGE_HEIGHT = A4
+MARGIN = 15 * mm
+
+# 表の列幅（No., カテゴリ, 検査項目, 判定）
+COLUMN_WIDTHS = (10 * mm, 28 * mm, None, 16 * mm)
+TABLE_FONT_SIZE = 8.5
+TABLE_LEADING = 11
+HEADER_FILL = colors.HexColor("#4472C4")
+FAIL_FILL = colors.HexColor("#FDE9E9")
+
+# 写真ページのレイアウト（列数・行数）と埋め込み画像の設定
+PHOTO_COLUMNS = 2
+PHOTO_ROWS = 3
+PHOTO_MAX_PX = 800
+PHOTO_QUALITY = 70
+
+# 画像・ページを ASCII85 で符号化しない（純 Python 実装で遅く、サイズも 25% 増える）
+rl_config.useA85 = 0
+
+_font_registered = False
+
+
+def _register_font():
+    global _font_registered
+    if not _font_registered:
+        pdfmetrics.registerFont(UnicodeCIDFont(FONT))
+        _font_registered = True
+
+def wrap_text(text, width, font_size, max_lines=None):
+    """文字単位で折り返す（日本語は単語の区切りが無いため）"""
+    lines = []
+    for paragraph in str(text).replace("\r", "").split("\n"):
+        line = ""
+        for char in paragraph:
+            if line and pdfmetrics.stringWidth(line + char, FONT, font_size) > width:
+                lines.append(line)
+                line = char
+            else:
+                line += char
+        lines.append(line)
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+        lines[-1] = lines[-1][:-1] + "…"
+    return lines
+
+def _effective_categories(manual_items):
+    """カテゴリ欄が空の項目は直前のカテゴリを使う"""
+    categories = []
+    current = ""
+    for item in manual_items:
+        if item['category']:
+            current = item['category'].replace("\n", "")
+        categories.append(current)
+    return categories
+
+
+class _PdfWriter:
+    """ページ送りとフッターを管理しながら上から順に描く"""
+
+    def __init__(self, output, title, footer):
+        self.canvas = canvas.Canvas(output, pagesize=A4, pageCompression=1)
+        self.canvas.setTitle(title)
+        self.footer = footer
+        self.page = 1
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def new_page(self):
+        self._draw_footer()
+        self.canvas.showPage()
+        self.page += 1
+        self.y = PAGE_HEIGHT - MARGIN
+
+    def ensure(self, height):
+        """残りの高さが足りなければ改ページする。改ページしたら True"""
+        if self.y - height < MARGIN + 8 * mm:
+            self.new_page()
+            return True
+        return False
+
+    def text(self, x, y, text, size, color=colors.black):
+        self.canvas.setFont(FONT, size)
+        self.canvas.setFillColor(color)
+        self.canvas.drawString(x, y, text)
+
+    def _draw_footer(self):
+        self.text(MARGIN, MARGIN - 2 * mm, self.footer, 7, colors.grey)
+        self.canvas.setFont(FONT, 7)
+        self.canvas.drawRightString(PAGE_WIDTH - MARGIN, MARGIN - 2 * mm, f"{self.page} ページ")
+
+    def finish(self):
+        self._draw_footer()
+        self.canvas.showPage()
+        self.canvas.save()
+
+
+def _draw_header(writer, fields, passed, failed, photo_count):
+    writer.text(MARGIN, writer.y - 16, "入荷検査結果報告書", 16)
+    writer.y -= 28
+
+    # 2 列 × 3 行の枠にヘッダー情報を配置
+    box_width = (PAGE_WIDTH - 2 * MARGIN) / 2
+    box_height = 8 * mm
+    label_width = 20 * mm
+    for index, (label, value) in enumerate(fields):
+        col, row = index % 2, index // 2
+        x = MARGIN + col * box_width
+        y = writer.y - (row + 1) * box_height
+        writer.canvas.setStrokeColor(colors.grey)
+        writer.canvas.setFillColor(colors.HexColor("#EEF2FA"))
+        writer.canvas.rect(x, y, label_width, box_height, stroke=1, fill=1)
+        writer.canvas.rect(x + label_width, y, box_width - label_width, box_height, stroke=1, fill=0)
+        writer.text(x + 2 * mm, y + 2.8 * mm, label, 8.5)
+        writer.text(x + label_width + 2 * mm, y + 2.8 * mm, str(value or "-"), 10)
+    writer.y -= (len(fields) + 1) // 2 * box_height + 7 * mm
+
+    summary = f"合格 {passed} 件　／　不合格 {failed} 件　／　写真 {photo_count} 枚"
+    writer.text(MARGIN, writer.y, summary, 10, colors.red if failed else colors.black)
+    writer.y -= 6 * mm
+
+def _column_positions():
+    fixed = sum(width for width in COLUMN_WIDTHS if width)
+    widths = [width or (PAGE_WIDTH - 2 * MARGIN - fixed) for width in COLUMN_WIDTHS]
+    positions = []
+    x = MARGIN
+    for width in widths:
+        positions.append((x, width))
+        x += width
+    return positions
+
+def _draw_table_header(writer, columns):
+    height = 6 * mm
+    writer.canvas.setFillColor(HEADER_FILL)
+    writer.canvas.rect(MARGIN, writer.y - height, PAGE_WIDTH - 2 * MARGIN, height, stroke=0, fill=1)
+    for (x, _), label in zip(columns, ("No.", "カテゴリ", "検査項目", "判定")):
+        writer.text(x + 1.5 * mm, writer.y - height + 2 * mm, label, 8.5, colors.white)
+    writer.y -= height
+
+def _draw_items(writer, manual_items, inspection_data):
+    columns = _column_positions()
+    categories = _effective_categories(manual_items)
+    _draw_table_header(writer, columns)
+
+    for number, (item, category) in enumerate(zip(manual_items, categories), 1):
+        description_lines = wrap_text(item['description'], columns[2][1] - 3 * mm, TABLE_FONT_SIZE)
+        category_lines = wrap_text(category, columns[1][1] - 3 * mm, TABLE_FONT_SIZE, max_lines=2)
+        height = max(len(description_lines), len(category_lines)) * TABLE_LEADING + 2 * mm
+
+        if writer.ensure(height):
+            _draw_table_header(writer, columns)
+
+        result = inspection_data.get(item['id'])
+        is_pass = None if result is None else result.get('pass', True)
+        top = writer.y
+        bottom = top - height
+
+        if is_pass is False:
+            writer.canvas.setFillColor(FAIL_FILL)
+            writer.canvas.rect(MARGIN, bottom, PAGE_WIDTH - 2 * MARGIN, height, stroke=0, fill=1)
+        writer.canvas.setStrokeColor(colors.lightgrey)
+        writer.canvas.line(MARGIN, bottom, PAGE_WIDTH - MARGIN, bottom)
+
+        first_line = top - 1 * mm - TABLE_FONT_SIZE
+        writer.text(columns[0][0] + 1.5 * mm, first_line, str(number), TABLE_FONT_SIZE)
+        for index, line in enumerate(category_lines):
+            writer.text(columns[1][0] + 1.5 * mm, first_line - index * TABLE_LEADING, line, TABLE_FONT_SIZE)
+        for index, line in enumerate(description_lines):
+            writer.text(columns[2][0] + 1.5 * mm, first_line - index * TABLE_LEADING, line, TABLE_FONT_SIZE)
+
+        if is_pass is None:
+            mark, color = "-", colors.grey
+        elif is_pass:
+            mark, color = "○ 可", colors.black
+        else:
+            mark, color = "× 否", colors.red
+        writer.text(columns[3][0] + 1.5 * mm, first_line, mark, 9, color)
+
+        writer.y = bottom
+
+def _draw_photos(writer, manual_items, photos):
+    numbered = [
+        (number, item, category)
+        for number, (item, category) in enumerate(zip(manual_items, _effective_categories(manual_items)), 1)
+        if photos.get(item['id'])
+    ]
+    if not numbered:
+        return
+
+    cell_width = (PAGE_WIDTH - 2 * MARGIN) / PHOTO_COLUMNS
+    usable_height = PAGE_HEIGHT - 2 * MARGIN - 8 * mm - 12 * mm
+    cell_height = usable_height / PHOTO_ROWS
+    caption_height = 2 * TABLE_LEADING + 2 * mm
+    per_page = PHOTO_COLUMNS * PHOTO_ROWS
+
+    for index, (number, item, category) in enumerate(numbered):
+        slot = index % per_page
+        if slot == 0:
+            writer.new_page()
+            writer.text(MARGIN, writer.y - 14, "検査写真", 14)
+            writer.y -= 12 * mm
+            grid_top = writer.y
+
+        col, row = slot % PHOTO_COLUMNS, slot // PHOTO_COLUMNS
+        x = MARGIN + col * cell_width
+        top = grid_top - row * cell_height
+
+        caption = wrap_text(f"No.{number} {category}　{item['description']}",
+                            cell_width - 4 * mm, TABLE_FONT_SIZE, max_lines=2)
+        for line_index, line in enumerate(caption):
+            writer.text(x + 2 * mm, top - TABLE_FONT_SIZE - line_index * TABLE_LEADING, line, TABLE_FONT_SIZE)
+
+        box_width = cell_width - 4 * mm
+        box_height = cell_height - caption_height - 3 * mm
+        box_bottom = top - caption_height - box_height
+        try:
+            # 縮小・圧縮した JPEG だけを埋め込み、元画像はここで手放す
+            with metrics.timed("pdf_photo"):
+                jpeg, width, height = make_jpeg(photos[item['id']], PHOTO_MAX_PX, PHOTO_QUALITY)
+            scale = min(box_width / width, box_height / height)
+            draw_width, draw_height = width * scale, height * scale
+            writer.canvas.drawImage(
+                ImageReader(BytesIO(jpeg)),
+                x + 2 * mm + (box_width - draw_width) / 2,
+                box_bottom + (box_height - draw_height) / 2,
+                draw_width, draw_height
+            )
+        except Exception:
+            writer.canvas.setStrokeColor(colors.lightgrey)
+            writer.canvas.rect(x + 2 * mm, box_bottom, box_width, box_height, stroke=1, fill=0)
+            writer.text(x + 4 * mm, box_bottom + box_height / 2, "写真読込エラー", 10, colors.red)
+
+@metrics.timed("create_pdf_report", memory=True)
+def create_pdf_report(inspection_data, photos, manual_items, writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date):
+    """
+    検査結果を PDF にまとめ、PDF の BytesIO を返す
+    引数は create_excel_report と同じ（photos: 項目ID → 写真のバイト列またはファイルパス）
+    """
+    _register_font()
+    photos = photos or {}
+
+    results = [inspection_data[item['id']].get('pass', True)
+               for item in manual_items if item['id'] in inspection_data]
+    passed = sum(1 for result in results if result)
+    failed = len(results) - passed
+    photo_count = sum(1 for item in manual_items if photos.get(item['id']))
+
+    output = BytesIO()
+    writer = _PdfWriter(
+        output,
+        title=f"入荷検査結果 {in_no} / {lot_no}",
+        footer=f"入荷検査フォーム　本体S/N: {inspector_id or '-'}　IN.NO: {in_no or '-'}　ロットNO: {lot_no or '-'}"
+    )
+    fields = [
+        ("IN.NO", in_no),
+        ("ロットNO", lot_no),
+        ("本体S/N", inspector_id),
+        ("検査日", str(inspection_date)),
+        ("作業者", writer_name),
+        ("確認者", reviewer_name),
+    ]
+    _draw_header(writer, fields, passed, failed, photo_count)
+    _draw_items(writer, manual_items, inspection_data)
+    _draw_photos(writer, manual_items, photos)
+    with metrics.timed("pdf_save"):
+        writer.finish()
+
+    output.seek(0)
+    return output
@@ -0,0 +1,202 @@
+"""
+写真の知覚ハッシュ（dHash）と、ほぼ同じ写真の検索
+
+同じ写真を複数の項目に使い回したり、前のロットの写真を流用したりしていないかを
+アップロード時に確認するため、写真ごとに 64 ビットの dHash を持たせる
+（縮小・再圧縮・少しの明るさの違いではほとんど変わらず、別の写真とは大きく違う値になる）
+
+検索はマルチインデックスハッシング：ハッシュを 16 ビットずつ 4 つの帯に分けて
+それぞれにインデックスを張る。ハミング距離が r 以下なら、少なくとも 1 つの帯は
+r // 4 ビット以下しか違わないので、各帯でその範囲の値だけをインデックスで引き、
+候補だけ距離を計算する（全件を走査しない）
+
+ハッシュは検査履歴データベースの photo_hashes 表（inspection.history）に写真のハッシュ（SHA-256）ごとに保存する
+既存の写真の登録:
+
+    python -m inspection.photo_index --db history.sqlite3 backfill --photos photos
+    python -m inspection.photo_index --db history.sqlite3 query photo.jpg --max-distance 8
+"""
+
+import argparse
+import itertools
+import sys
+import time
+from pathlib import Path
+
+HASH_BITS = 64
+BANDS = 4
+BAND_BITS = HASH_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+# これ以下の距離を「ほぼ同じ写真」とみなす
+DEFAULT_MAX_DISTANCE = 6
+
+# 真っ白・真っ黒などの単調な写真はハッシュがほぼ 0 になり、互いに一致してしまうので比べない
+MIN_EDGE_BITS = 4
+
+
+def dhash(img):
+    """
+    PIL の画像の dHash（64 ビットの整数）
+    9×8 の濃淡画像に縮小し、各行で左の画素が右より明るければ 1
+    """
+    from PIL import Image as PILImage
+
+    gray = img.convert("L").resize((9, 8), PILImage.Resampling.BILINEAR)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def dhash_file(source):
+    """写真（バイト列またはファイルパス）の dHash（JPEG は縮小しながらデコードする）"""
+    from PIL import ImageOps
+
+    from .photos import open_image
+
+    with open_image(source) as img:
+        img.draft("L", (64, 64))
+        return dhash(ImageOps.exif_transpose(img))
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def is_informative(value):
+    """比べる意味のあるハッシュか（単調な写真は除く）"""
+    return MIN_EDGE_BITS <= bin(value).count("1") <= HASH_BITS - MIN_EDGE_BITS
+
+def to_signed(value):
+    """SQLite の INTEGER（符号付き 64 ビット）に入る値に変換"""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+def from_signed(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+def bands(value):
+    """上位から 16 ビットずつの帯 [band0, band1, band2, band3]"""
+    return [(value >> (BAND_BITS * (BANDS - 1 - index))) & BAND_MASK for index in range(BANDS)]
+
+def band_variants(band, radius):
+    """帯の値からハミング距離 radius 以内の値をすべて列挙する"""
+    variants = [band]
+    for distance in range(1, radius + 1):
+        for positions in itertools.combinations(range(BAND_BITS), distance):
+            flipped = band
+            for position in positions:
+                flipped ^= 1 << position
+            variants.append(flipped)
+    return variants
+
+def hash_row(photo_ref, value):
+    """photo_hashes 表の 1 行 (photo_ref, dhash, band0..band3)"""
+    return (photo_ref, to_signed(value), *bands(value))
+
+def nearest(conn, value, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    photo_hashes 表から value との距離が max_distance 以下の写真を近い順に返す
+    戻り値: [(写真のハッシュ, 距離), ...]
+    """
+    radius = max_distance // BANDS
+    conditions = []
+    params = []
+    for index, band in enumerate(bands(value)):
+        variants = band_variants(band, radius)
+        conditions.append(f"band{index} IN ({', '.join('?' * len(variants))})")
+        params.extend(variants)
+    rows = conn.execute(
+        f"SELECT photo_ref, dhash FROM photo_hashes WHERE {' OR '.join(conditions)}", params
+    ).fetchall()
+
+    matches = []
+    for photo_ref, stored in rows:
+        distance = hamming(value, from_signed(stored))
+        if distance <= max_distance:
+            matches.append((photo_ref, distance))
+    matches.sort(key=lambda match: match[1])
+    return matches
+
+def duplicate_warnings(item_id, value, photo_hashes, descriptions, history=None, exclude_inspection=None,
+                       max_distance=DEFAULT_MAX_DISTANCE, limit=3):
+    """
+    写真が同じ検査の他の項目や過去の検査の写真とほぼ同じなら、警告文の一覧を返す
+    photo_hashes: この検査の {項目ID: dHash}（item_id 自身は比べない）
+    descriptions: {項目ID: 検査内容}（警告文に使う）
+    history: 過去の検査を探す InspectionHistory（None なら探さない）
+    exclude_inspection: 過去の検査から除く検査 ID（上書き中の同じ検査）
+    """
+    warnings = []
+    if not is_informative(value):
+        return warnings
+
+    for other_id, other in photo_hashes.items():
+        distance = hamming(value, other)
+        if other_id != item_id and distance <= max_distance:
+            warnings.append(f"この検査の「{descriptions.get(other_id, other_id)[:20]}」の写真とほぼ同じです（差 {distance}）")
+
+    if history is None:
+        return warnings
+    try:
+        for match in history.similar_photos(value, max_distance, exclude_inspection=exclude_inspection, limit=limit):
+            warnings.append(
+                f"過去の検査（ID {match['inspection_id']}・{match['inspection_date']}・"
+                f"S/N {match['serial'] or '-'}・ロット {match['lot_no'] or '-'}）の写真とほぼ同じです"
+                f"（差 {match['distance']}）"
+            )
+    except Exception as e:
+        warnings.append(f"類似写真を確認できませんでした: {e}")
+    return warnings
+
+
+def main(argv=None):
+    from .history import InspectionHistory
+    from .photo_store import PhotoStore
+
+    parser = argparse.ArgumentParser(description="写真の dHash の登録と、ほぼ同じ写真の検索")
+    parser.add_argument('--db', default="history.sqlite3", help="検査履歴データベース")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    backfill = sub.add_parser('backfill', help="検査履歴から参照されていてハッシュが未登録の写真を登録する")
+    backfill.add_argument('--photos', default="photos", help="写真ストアのディレクトリ")
+
+    query = sub.add_parser('query', help="写真ファイルとほぼ同じ写真を使った検査を表示する")
+    query.add_argument('photo', help="写真ファイル")
+    query.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE, help="ハミング距離の上限")
+    query.add_argument('--limit', type=int, default=20, help="表示する件数")
+    args = parser.parse_args(argv)
+
+    if not Path(args.db).exists():
+        print(f"検査履歴データベースが見つかりません: {args.db}", file=sys.stderr)
+        return 1
+    history = InspectionHistory(args.db)
+
+    if args.command == 'backfill':
+        store = PhotoStore(args.photos)
+        started = time.perf_counter()
+        rows = []
+        missing = 0
+        for photo_ref in history.photos_without_hash():
+            if not store.exists(photo_ref):
+                missing += 1
+                continue
+            try:
+                rows.append((photo_ref, dhash_file(store.path(photo_ref))))
+            except Exception as e:
+                print(f"⚠️ {photo_ref}: {e}", file=sys.stderr)
+        history.add_photo_hashes(rows)
+        print(f"{len(rows)} 枚を登録しました（ストアに無い写真 {missing} 枚）"
+              f"（{time.perf_counter() - started:.1f} 秒）")
+        return 0
+
+    value = dhash_file(args.photo)
+    print(f"dHash: {value:016x}")
+    for match in history.similar_photos(value, args.max_distance, limit=args.limit):
+        print(f"距離 {match['distance']:>2}  ID {match['inspection_id']}  {match['inspection_date']}  "
+              f"S/N {match['serial']}  ロット {match['lot_no']}  {match['description'] or match['item_id']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
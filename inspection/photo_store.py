@@ -0,0 +1,225 @@
+"""
+写真のコンテンツアドレス型ストア
+
+写真は SHA-256 をキーにして PHOTO_DIR/<先頭2文字>/<ハッシュ> に 1 回だけ保存し、
+セッションにはハッシュ（参照）だけを持たせる。同じ写真は重複して保存されない
+
+最終利用時刻（ファイルの mtime）で LRU 管理し、容量上限を超えたら古い順に削除する
+参照されなくなったファイルは gc コマンドで削除する
+検査履歴（inspection.history）と下書き（inspection.drafts）から参照されている写真は削除しない
+
+    python -m inspection.photo_store stats
+    python -m inspection.photo_store gc --max-age-days 7 --history history.sqlite3 --drafts drafts.sqlite3
+    python -m inspection.photo_store evict --max-mb 2048 --history history.sqlite3 --drafts drafts.sqlite3
+"""
+
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_ROOT = "photos"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+TMP_SUFFIX = ".tmp"
+
+
+class PhotoStore:
+    """
+    ハッシュをキーにした写真ストア
+    max_bytes を超えたら最終利用が古いものから削除する
+    protected: 削除してはいけないハッシュの集合を返す関数（検査履歴から参照中の写真など）
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES, protected=None):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.protected = protected
+        self._lock = threading.Lock()
+        self._usage = None
+
+    # ---------- 基本操作 ----------
+
+    def path(self, digest):
+        """ハッシュに対応するファイルパス"""
+        return self.root / digest[:2] / digest
+
+    def exists(self, digest):
+        return self.path(digest).is_file()
+
+    def put(self, data):
+        """写真を保存してハッシュを返す（保存済みなら最終利用時刻だけ更新）"""
+        digest = hashlib.sha256(data).hexdigest()
+        target = self.path(digest)
+        if target.is_file():
+            self.touch(digest)
+            return digest
+
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # 一時ファイルに書いてからリネーム（書き込み途中のファイルを見せない）
+        fd, tmp_path = tempfile.mkstemp(dir=target.parent, suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if self._usage is not None:
+                self._usage += len(data)
+            over_limit = self._usage is None or self._usage > self.max_bytes
+        if over_limit and self.max_bytes:
+            keep = {digest}
+            if self.protected is not None:
+                keep |= set(self.protected())
+            self.evict(self.max_bytes, keep=keep)
+        return digest
+
+    def get(self, digest):
+        """写真のバイト列を返す"""
+        data = self.path(digest).read_bytes()
+        self.touch(digest)
+        return data
+
+    def touch(self, *digests):
+        """最終利用時刻を更新する（LRU 用）"""
+        for digest in digests:
+            try:
+                os.utime(self.path(digest))
+            except OSError:
+                pass
+
+    # ---------- 容量管理 ----------
+
+    def _blobs(self):
+        """保存済みファイルの一覧 [(ハッシュ, パス, サイズ, mtime)]"""
+        blobs = []
+        for sub in self.root.iterdir():
+            if not sub.is_dir() or len(sub.name) != 2:
+                continue
+            for entry in os.scandir(sub):
+                if not entry.is_file() or entry.name.endswith(TMP_SUFFIX):
+                    continue
+                stat = entry.stat()
+                blobs.append((entry.name, Path(entry.path), stat.st_size, stat.st_mtime))
+        return blobs
+
+    def stats(self):
+        """保存件数と合計サイズ"""
+        blobs = self._blobs()
+        total = sum(blob[2] for blob in blobs)
+        with self._lock:
+            self._usage = total
+        return {'count': len(blobs), 'bytes': total}
+
+    def evict(self, max_bytes, keep=()):
+        """合計サイズが max_bytes 以下になるまで、最終利用が古い順に削除する"""
+        blobs = sorted(self._blobs(), key=lambda blob: blob[3])
+        total = sum(blob[2] for blob in blobs)
+        removed = []
+        for digest, path, size, mtime in blobs:
+            if total <= max_bytes:
+                break
+            if digest in keep:
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed.append(digest)
+        with self._lock:
+            self._usage = total
+        return removed
+
+    def gc(self, referenced=(), max_age=7 * 24 * 3600, dry_run=False):
+        """
+        参照されていない写真を削除する
+        referenced に含まれず、max_age 秒以上使われていないファイルを孤立とみなす
+        書き込み途中で残った一時ファイルも削除する
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - max_age
+        removed = []
+        for digest, path, size, mtime in self._blobs():
+            if digest in referenced or mtime > cutoff:
+                continue
+            if not dry_run:
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+            removed.append(digest)
+
+        for tmp_path in self.root.glob(f"*/*{TMP_SUFFIX}"):
+            try:
+                if tmp_path.stat().st_mtime <= cutoff and not dry_run:
+                    tmp_path.unlink()
+            except OSError:
+                pass
+
+        if not dry_run:
+            for sub in self.root.iterdir():
+                if sub.is_dir() and len(sub.name) == 2 and not any(sub.iterdir()):
+                    sub.rmdir()
+            with self._lock:
+                self._usage = None
+        return removed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="写真ストアの管理")
+    parser.add_argument('--root', default=DEFAULT_ROOT, help="写真ストアのディレクトリ")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help="保存件数と合計サイズを表示")
+
+    gc_parser = commands.add_parser('gc', help="参照されていない写真を削除")
+    gc_parser.add_argument('--max-age-days', type=float, default=7.0,
+                           help="この日数以上使われていない写真を孤立とみなす")
+    gc_parser.add_argument('--dry-run', action='store_true', help="削除せずに対象だけ表示")
+    gc_parser.add_argument('--history', default=None,
+                           help="検査履歴データベース（参照中の写真は削除しない）")
+    gc_parser.add_argument('--drafts', default=None,
+                           help="下書きデータベース（参照中の写真は削除しない）")
+
+    evict_parser = commands.add_parser('evict', help="容量上限まで古い写真を削除")
+    evict_parser.add_argument('--max-mb', type=float, required=True)
+    evict_parser.add_argument('--history', default=None,
+                              help="検査履歴データベース（参照中の写真は削除しない）")
+    evict_parser.add_argument('--drafts', default=None,
+                              help="下書きデータベース（参照中の写真は削除しない）")
+
+    args = parser.parse_args(argv)
+    store = PhotoStore(args.root, max_bytes=None)
+    # 画面と同じく、検査履歴と下書きの両方から参照されている写真を残す
+    referenced = set()
+    if getattr(args, 'history', None):
+        from .history import InspectionHistory
+        referenced |= InspectionHistory(args.history).referenced_photos()
+    if getattr(args, 'drafts', None):
+        from .drafts import DraftJournal
+        referenced |= DraftJournal(args.drafts).referenced_photos()
+
+    if args.command == 'stats':
+        stats = store.stats()
+        print(f"{stats['count']} 件 / {stats['bytes'] / 1024 ** 2:.1f} MB")
+    elif args.command == 'gc':
+        removed = store.gc(referenced, max_age=args.max_age_days * 24 * 3600, dry_run=args.dry_run)
+        action = "削除対象" if args.dry_run else "削除"
+        print(f"{action}: {len(removed)} 件")
+    elif args.command == 'evict':
+        removed = store.evict(int(args.max_mb * 1024 ** 2), keep=referenced)
+        print(f"削除: {len(removed)} 件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+写真の加工処理
+
+- アップロード時の取り込み（向き補正 → 縮小 → 再圧縮 + プレビュー作成）
+- 検査写真シート用のサムネイル作成（デコード → 縮小 → PNG 再エンコード）を
+  スレッドプールで並列に行う。PIL はデコード・縮小・エンコード中に GIL を
+  解放するため、スレッドで十分に並列化できる
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from . import metrics
+from .photo_index import dhash
+
+THUMBNAIL_WIDTH = 150
+THUMBNAIL_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+# アップロード時の取り込み設定（既定値）
+INGEST_MAX_PX = 1600
+INGEST_QUALITY = 85
+INGEST_FORMAT = "JPEG"
+PREVIEW_WIDTH = 200
+PREVIEW_QUALITY = 70
+
+
+def _encode(img, fmt, quality):
+    """JPEG / WebP に再エンコードする（JPEG は透過を白背景で合成）"""
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    if fmt == "JPEG" and has_alpha:
+        rgba = img.convert("RGBA")
+        img = PILImage.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    elif img.mode not in ("RGB", "RGBA") or (fmt == "JPEG" and img.mode != "RGB"):
+        img = img.convert("RGBA" if has_alpha else "RGB")
+    buffer = BytesIO()
+    img.save(buffer, format=fmt, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+@metrics.timed("photo_ingest")
+def ingest_photo(data, max_px=INGEST_MAX_PX, quality=INGEST_QUALITY, fmt=INGEST_FORMAT,
+                 preview_width=PREVIEW_WIDTH):
+    """
+    アップロードされた写真を 1 回だけ加工し、保存用とプレビュー用のバイト列を返す
+    EXIF の向きを反映し、長辺 max_px 以下に縮小して再圧縮する
+    戻り値: {'data': 保存用, 'preview': プレビュー用, 'width': 幅, 'height': 高さ, 'dhash': 知覚ハッシュ}
+    """
+    img = PILImage.open(BytesIO(data))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_px, max_px))
+    stored = _encode(img, fmt, quality)
+
+    preview = img.copy()
+    if preview.width > preview_width:
+        preview = preview.resize((preview_width, max(1, int(preview.height * preview_width / preview.width))))
+    preview_data = _encode(preview, fmt, PREVIEW_QUALITY)
+
+    return {
+        'data': stored,
+        'preview': preview_data,
+        'width': img.width,
+        'height': img.height,
+        'dhash': dhash(img),
+    }
+
+def open_image(source):
+    """バイト列またはファイルパスから画像を開く"""
+    if isinstance(source, (bytes, bytearray)):
+        return PILImage.open(BytesIO(source))
+    return PILImage.open(source)
+
+def make_thumbnail(source, max_width=THUMBNAIL_WIDTH):
+    """
+    写真（バイト列またはファイルパス）を幅 max_width に縮小した PNG を作る
+    戻り値: (PNG バイト列, 縮小後の高さ)
+    """
+    with open_image(source) as img:
+        ratio = max_width / img.width
+        new_height = int(img.height * ratio)
+        img = img.resize((max_width, new_height))
+
+    img_buffer = BytesIO()
+    img.save(img_buffer, format='PNG')
+    return img_buffer.getvalue(), new_height
+
+def make_jpeg(source, max_px, quality=PREVIEW_QUALITY):
+    """
+    写真（バイト列またはファイルパス）を長辺 max_px 以下の JPEG にする（PDF 埋め込み用）
+    戻り値: (JPEG バイト列, 幅, 高さ)
+    """
+    with open_image(source) as img:
+        # JPEG は縮小しながらデコードする（大きな写真を全画素展開しない）
+        img.draft("RGB", (max_px, max_px))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_px, max_px))
+        return _encode(img, "JPEG", quality), img.width, img.height
+
+def _safe_thumbnail(args):
+    source, max_width = args
+    try:
+        return make_thumbnail(source, max_width)
+    except Exception:
+        return None
+
+def make_thumbnails(photos, max_width=THUMBNAIL_WIDTH, max_workers=THUMBNAIL_WORKERS):
+    """
+    複数の写真（バイト列またはファイルパス）を並列にサムネイル化し、入力と同じ順番で返す
+    ファイルは各ワーカーがディスクから直接読み込む。読み込めなかった写真は None になる
+    """
+    jobs = [(source, max_width) for source in photos]
+    if len(jobs) <= 1 or max_workers <= 1:
+        return [_safe_thumbnail(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as executor:
+        return list(executor.map(_safe_thumbnail, jobs))
@@ -0,0 +1,342 @@
+"""
+検査マニュアルの解析とレポート作成
+
+Streamlit に依存しないため、画面（inspection_form_app.py）と
+一括生成コマンド（inspection.batch）の両方から使う
+"""
+
+import hashlib
+import json
+import os
+import threading
+from io import BytesIO
+
+import openpyxl
+from openpyxl.drawing.image import Image as XLImage
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import column_index_from_string
+
+from . import metrics
+from .excel_cells import build_merged_index, resolve_checkbox_cell, resolve_header_cell
+from .photos import make_thumbnails
+from .template_pool import WorkbookTemplate
+
+MANUAL_FILE = "manual.xlsx"
+
+# レポートのヘッダー欄（マニュアル上のラベル）
+HEADER_LABELS = ["IN.no", "OR.no", "本体S/N", "ロットNo", "入荷日", "検査日"]
+
+# マニュアルの検査項目の位置（行・列の範囲は両端を含む。列は "A" などの列名か 1 始まりの番号）
+DEFAULT_LAYOUT = {
+    'item_rows': (11, 45),
+    'skip_rows': (40, 41),
+    'category_column': "A",
+    'description_column': "D",
+    'checkbox_columns': ("U", "Y"),
+}
+
+
+def _column_index(column):
+    if isinstance(column, int):
+        index = column
+    else:
+        index = column_index_from_string(str(column).strip().upper())
+    if index < 1:
+        raise ValueError(f"列の指定が不正です: {column!r}")
+    return index
+
+def normalize_layout(layout=None):
+    """
+    レイアウトの指定を既定値で補い、行・列を番号にそろえる
+    戻り値はそのままキャッシュのキーに使える（値はすべて数値かタプル）
+    """
+    layout = dict(DEFAULT_LAYOUT, **(layout or {}))
+    unknown = set(layout) - set(DEFAULT_LAYOUT)
+    if unknown:
+        raise ValueError(f"未対応のレイアウト項目です: {', '.join(sorted(unknown))}")
+
+    first_row, last_row = (int(row) for row in layout['item_rows'])
+    first_col, last_col = (_column_index(col) for col in layout['checkbox_columns'])
+    if not 1 <= first_row <= last_row:
+        raise ValueError(f"item_rows が不正です: {layout['item_rows']!r}")
+    if first_col > last_col:
+        raise ValueError(f"checkbox_columns が不正です: {layout['checkbox_columns']!r}")
+    return {
+        'item_rows': (first_row, last_row),
+        'skip_rows': tuple(sorted({int(row) for row in layout['skip_rows']})),
+        'category_column': _column_index(layout['category_column']),
+        'description_column': _column_index(layout['description_column']),
+        'checkbox_columns': (first_col, last_col),
+    }
+
+def _layout_key(layout):
+    return tuple(sorted(layout.items()))
+
+def compile_report_plan(ws, items, checkbox_columns=(21, 25)):
+    """
+    レポート書き込み先のセル座標を事前に解決する（マニュアルのバージョンごとに 1 回）
+    checkbox_columns: 「□可　□否」を探す列の範囲（両端を含む）
+    """
+    merged_index = build_merged_index(ws)
+
+    headers = {}
+    for label in HEADER_LABELS:
+        target = resolve_header_cell(ws, label, (1, 10), merged_index)
+        if target is not None:
+            headers[label] = target
+
+    checkboxes = {}
+    for item in items:
+        target = resolve_checkbox_cell(
+            ws, item['excel_row'], (checkbox_columns[0], checkbox_columns[1] + 1), merged_index
+        )
+        if target is not None:
+            checkboxes[item['id']] = target
+
+    return {'headers': headers, 'checkboxes': checkboxes}
+
+class ManualTemplateCache:
+    """
+    マニュアル解析結果のプロセス共通キャッシュ
+    (ファイル, レイアウト) ごとに 1 件保持し、ファイルの mtime とハッシュで差し替えを検出して破棄する
+    複数のマニュアルを切り替えて使っても、それぞれ 1 回しか解析しない
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, parser, layout=None):
+        """
+        キャッシュ済みの解析結果を返す（無ければ parser(data, layout) で解析）
+        version はファイル内容のハッシュ（既定以外のレイアウトではレイアウトも含めたハッシュ）
+        """
+        layout = normalize_layout(layout)
+        key = (path, _layout_key(layout))
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['stamp'] == stamp:
+                self.hits += 1
+                return entry['template']
+
+            # mtime が変わっても内容が同じなら再解析しない
+            with open(path, 'rb') as f:
+                data = f.read()
+            digest = hashlib.sha256(data).hexdigest()
+            if entry is not None and entry['hash'] == digest:
+                entry['stamp'] = stamp
+                self.hits += 1
+                return entry['template']
+
+            template = parser(data, layout)
+            if layout == normalize_layout():
+                template['version'] = digest
+            else:
+                template['version'] = hashlib.sha256(
+                    (digest + json.dumps(layout, sort_keys=True)).encode()
+                ).hexdigest()
+            self._entries[key] = {'stamp': stamp, 'hash': digest, 'template': template}
+            self.misses += 1
+            return template
+
+    def stats(self):
+        """ヒット数・ミス数を返す"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries)}
+
+_manual_cache = ManualTemplateCache()
+
+def get_manual_cache():
+    """プロセス内の全セッションで共有するテンプレートキャッシュ"""
+    return _manual_cache
+
+@metrics.timed("parse_manual")
+def parse_manual(data, layout=None):
+    """
+    マニュアル Excel のバイト列から検査項目と行マッピングを抽出
+    layout: 検査項目の位置（省略時は DEFAULT_LAYOUT）
+    """
+    layout = normalize_layout(layout)
+    first_row, last_row = layout['item_rows']
+    wb = openpyxl.load_workbook(BytesIO(data))
+    # 書き込み前の状態をレポート用の複製元として保持
+    workbook = WorkbookTemplate(data, wb)
+    ws = wb.worksheets[0]
+
+    items = []
+    for row_idx, row in enumerate(ws.iter_rows(min_row=first_row, max_row=last_row, values_only=False), 1):
+        actual_row = first_row + row_idx - 1
+        
+        if actual_row in layout['skip_rows']:
+            continue
+
+        category_value = _cell_value(row, layout['category_column'])
+        description_value = _cell_value(row, layout['description_column'])
+        
+        row_content = ""
+        for cell in row:
+            if cell.value is not None:
+                row_content += str(cell.value).strip() 
+
+        EXCLUDE_KEYWORDS = ["作製部署", "作成部署", "作成者", "作製者", "制定日", "改訂日", "版数", "承認"]
+        
+        cleaned_row_content = (
+            row_content
+            .replace(" ", "")
+            .replace("　", "")
+            .replace("：", "")
+            .replace(":", "")
+        )
+
+        is_excluded = False
+        for keyword in EXCLUDE_KEYWORDS:
+            if keyword in cleaned_row_content:
+                is_excluded = True
+                break
+
+        if is_excluded:
+            continue
+        
+        if category_value or description_value:
+            category = category_value or ""
+            description = description_value or ""
+            
+            if str(description).strip():
+                items.append({
+                    'id': f"item_{row_idx}",
+                    'category': str(category).strip(),
+                    'description': str(description).strip(),
+                    'row': row_idx,
+                    'excel_row': actual_row
+                })
+
+    return {
+        'items': items,
+        'row_map': {item['id']: item['excel_row'] for item in items},
+        'plan': compile_report_plan(ws, items, layout['checkbox_columns']),
+        'workbook': workbook,
+        'layout': layout,
+    }
+
+def _cell_value(row, column):
+    """iter_rows の 1 行から column 列目（1 始まり）の値を返す（シートの範囲外なら None）"""
+    return row[column - 1].value if column <= len(row) else None
+
+def load_manual_template(path=MANUAL_FILE, layout=None):
+    """解析・コンパイル済みのマニュアルテンプレートを取得"""
+    return get_manual_cache().get(path, parse_manual, layout)
+
+@metrics.timed("create_excel_report", memory=True)
+def create_excel_report(inspection_data, photos, manual_items, writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date, manual_path=MANUAL_FILE, layout=None):
+    """
+    元のマニュアルフォーマットに検査結果を書き込み、xlsx の BytesIO を返す
+    写真は別シートに配置（photos: 項目ID → 写真のバイト列またはファイルパス）
+    layout: マニュアルの検査項目の位置（省略時は DEFAULT_LAYOUT）
+    """
+    # コンパイル済みの書き込み先と、元のマニュアルのメモリ内コピーを取得
+    template = load_manual_template(manual_path, layout)
+    plan = template['plan']
+    with metrics.timed("template_clone"):
+        wb = template['workbook'].new_workbook()
+    ws = wb.worksheets[0]
+
+    # ========== ヘッダー情報を書き込み（解決済みの座標へ）==========
+    header_values = [
+        ("IN.no", in_no),
+        ("OR.no", ""),
+        ("本体S/N", inspector_id),
+        ("ロットNo", lot_no),
+        ("入荷日", str(inspection_date)),
+        ("検査日", str(inspection_date)),
+    ]
+    for label, value in header_values:
+        target = plan['headers'].get(label)
+        if target is not None:
+            ws.cell(row=target[0], column=target[1]).value = value
+
+    # ========== 検査結果を書き込み ==========
+    for item in manual_items:
+        item_id = item['id']
+        target = plan['checkboxes'].get(item_id)
+
+        if item_id in inspection_data and target is not None:
+            is_pass = inspection_data[item_id].get('pass', True)
+
+            actual_cell = ws.cell(row=target[0], column=target[1])
+            cell_value = str(actual_cell.value)
+            if is_pass:
+                actual_cell.value = cell_value.replace('□可', '☑可')
+            else:
+                actual_cell.value = cell_value.replace('□否', '☑否')
+
+    # ========== 写真シートを作成 ==========
+    if photos:
+        ws_photo = wb.create_sheet(title="検査写真")
+
+        # ヘッダー
+        ws_photo['A1'] = "検査写真一覧"
+        ws_photo['A1'].font = Font(bold=True, size=16)
+        ws_photo.merge_cells('A1:D1')
+
+        ws_photo['A3'] = "No."
+        ws_photo['B3'] = "カテゴリ"
+        ws_photo['C3'] = "検査項目"
+        ws_photo['D3'] = "写真"
+
+        for cell in ['A3', 'B3', 'C3', 'D3']:
+            ws_photo[cell].font = Font(bold=True)
+            ws_photo[cell].fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+            ws_photo[cell].font = Font(bold=True, color="FFFFFF")
+
+        ws_photo.column_dimensions['A'].width = 6
+        ws_photo.column_dimensions['B'].width = 15
+        ws_photo.column_dimensions['C'].width = 40
+        ws_photo.column_dimensions['D'].width = 30
+
+        # サムネイル作成は並列に行い、結果はマニュアルの項目順に受け取る
+        photo_items = [
+            item for item in manual_items
+            if item['id'] in photos and photos[item['id']]
+        ]
+        with metrics.timed("thumbnails"):
+            thumbnails = make_thumbnails(photos[item['id']] for item in photo_items)
+
+        row = 4
+        photo_count = 0
+
+        for item, thumbnail in zip(photo_items, thumbnails):
+            photo_count += 1
+
+            ws_photo[f'A{row}'] = photo_count
+            ws_photo[f'B{row}'] = item['category']
+            ws_photo[f'C{row}'] = item['description'][:50]
+
+            try:
+                if thumbnail is None:
+                    raise ValueError("thumbnail failed")
+                png_data, new_height = thumbnail
+
+                xl_img = XLImage(BytesIO(png_data))
+                ws_photo.add_image(xl_img, f'D{row}')
+
+                ws_photo.row_dimensions[row].height = max(new_height * 0.75, 100)
+
+            except Exception as img_error:
+                ws_photo[f'D{row}'] = f"写真読込エラー"
+
+            row += 1
+
+        if photo_count == 0:
+            ws_photo['A4'] = "写真はありません"
+
+    # メモリに保存
+    output = BytesIO()
+    with metrics.timed("wb_save"):
+        wb.save(output)
+    output.seek(0)
+
+    return output
@@ -0,0 +1,35 @@
+"""
+テンプレートワークブックのメモリ内複製
+
+レポートのたびに manual.xlsx を読み直す（zip 展開 + XML 解析）代わりに、
+解析済みのワークブックを pickle したプロトタイプを保持し、
+レポートごとに独立したコピーを復元して使う
+"""
+
+import pickle
+from io import BytesIO
+
+import openpyxl
+
+
+class WorkbookTemplate:
+    """
+    元のバイト列と解析済みプロトタイプを保持し、書き換え可能なコピーを作る
+    コピー同士はオブジェクトを共有しないため、他のレポートに値が混ざらない
+    """
+
+    def __init__(self, data, workbook=None):
+        self.data = data
+        if workbook is None:
+            workbook = openpyxl.load_workbook(BytesIO(data))
+        try:
+            self._prototype = pickle.dumps(workbook, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            # pickle できない要素を含む場合は毎回バイト列から読み込む
+            self._prototype = None
+
+    def new_workbook(self):
+        """未記入のワークブックを新しく作る"""
+        if self._prototype is not None:
+            return pickle.loads(self._prototype)
+        return openpyxl.load_workbook(BytesIO(self.data))
@@ -0,0 +1,23 @@
+"""
+文字列の正規化
+
+入力欄の値やメールアドレスに混じる全角英数字・記号を半角にそろえる
+（マスターのメールアドレス列は masters.normalize_email_series でまとめて変換する）
+"""
+
+import unicodedata
+
+
+def normalize_text(text):
+    """全角英数字・記号を半角に変換"""
+    if text is None:
+        return ""
+    return unicodedata.normalize('NFKC', str(text))
+
+def normalize_email(email):
+    """メールアドレスの全角文字を半角に変換"""
+    if email is None:
+        return ""
+    normalized = unicodedata.normalize('NFKC', str(email))
+    normalized = normalized.strip().replace(" ", "").replace("　", "")
+    return normalized
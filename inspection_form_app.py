@@ -13,34 +13,80 @@
 
 import streamlit as st
 import pandas as pd
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.drawing.image import Image as XLImage
-from openpyxl.utils import get_column_letter
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
-import os
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email.mime.text import MIMEText
-from email import encoders
-from email.header import Header
 from pathlib import Path
-from PIL import Image as PILImage
-from io import BytesIO
-import unicodedata
-import copy
-import re
+import time
+
+from inspection import report, metrics
+from inspection.text import normalize_text, normalize_email
+from inspection.mail import smtp_settings, report_email, report_summary
+from inspection.photo_store import PhotoStore
+from inspection.photo_index import duplicate_warnings
+from inspection.outbox import Outbox, XLSX_MIME, STATUS_LABELS
+from inspection.masters import load_master, save_config_if_changed
+from inspection.manuals import ManualRegistry, group_items
+from inspection.history import InspectionHistory
+from inspection.drafts import DraftJournal, KIND_RESULT, KIND_PHOTO, KIND_HEADER, header_changes, restore_inputs
+from inspection.jobs import JobPool, build_report_files, ingest_photo_job, report_request, STATUS_LABELS as JOB_STATUS_LABELS
 
 # ========== 【 設定・定数 】==========
 MANUAL_FILE = "manual.xlsx"
+# 部品種別ごとのマニュアル（*.xlsx と同名の記述子 *.json。MANUAL_FILE は常に先頭に並ぶ）
+MANUAL_DIR = "manuals"
 MASTER_FILE = "inspector_master.xlsx"
 PHOTO_DIR = "photos"
+PHOTO_STORE_MAX_BYTES = 2 * 1024 ** 3
 CONFIG_FILE = "app_config.json"
+OUTBOX_DB = "outbox.sqlite3"
+HISTORY_DB = "history.sqlite3"
+DRAFTS_DB = "drafts.sqlite3"
+
+# 計測値の出力先（Prometheus textfile collector 用・1 行 1 JSON のログ）と書き出し間隔（秒）
+METRICS_FILE = "metrics.prom"
+METRICS_LOG = "metrics.jsonl"
+METRICS_EXPORT_INTERVAL = 15
+
+# まとめ送信：同じ送信先の検査をまとめる間隔（分）・1 通の上限（MB）・まとめ方（"zip" / "workbook"）
+DIGEST_WINDOW_MINUTES = 30
+DIGEST_MAX_MB = 15
+DIGEST_MODE = "zip"
+
+# レポート作成・写真の取り込みを行うワーカー（"process" / "thread"）の数と、完了を待つ最大秒数
+JOB_WORKERS = 4
+JOB_WORKER_KIND = "process"
+REPORT_TIMEOUT = 300
+PHOTO_TIMEOUT = 60
+
+# 下書きの保存期間（日）と、スナップショットにまとめるまでの差分の件数
+DRAFT_MAX_AGE_DAYS = 7
+DRAFT_COMPACT_EVERY = 200
+
+# 履歴検索で 1 回に表示する最大件数
+HISTORY_PAGE_SIZE = 100
+
+# 不合格率分析でロット別に表示する件数
+DASHBOARD_TOP_LOTS = 20
+
+# アップロード写真の取り込み設定（長辺の最大ピクセル数・圧縮品質・形式）
+PHOTO_MAX_PX = 1600
+PHOTO_QUALITY = 85
+PHOTO_FORMAT = "JPEG"
+
+# 写真の知覚ハッシュ（dHash）の差がこれ以下なら「ほぼ同じ写真」として警告する（64 ビット中）
+PHOTO_DUPLICATE_DISTANCE = 6
+
+# レポートの出力形式（Excel はマニュアルの書式、PDF はスマートフォン向け）
+REPORT_FORMATS = ["Excel", "PDF", "Excel + PDF"]
+
+# 検査入力タブで 1 ページに表示する項目数
+ITEMS_PER_PAGE = 10
 
 Path(PHOTO_DIR).mkdir(parents=True, exist_ok=True)
 
+# 再実行 1 回分の所要時間（ページ末尾で記録）
+rerun_started = time.perf_counter()
+
 # ========== 【 セッション状態の初期化 】==========
 if 'inspection_data' not in st.session_state:
     st.session_state.inspection_data = {}
@@ -48,295 +94,236 @@ if 'selected_emails' not in st.session_state:
     st.session_state.selected_emails = []
 if 'uploaded_photos' not in st.session_state:
     st.session_state.uploaded_photos = {}
-if 'photo_bytes' not in st.session_state:
-    st.session_state.photo_bytes = {}
-if 'excel_data' not in st.session_state:
-    st.session_state.excel_data = None
-
-# ========== 【 ユーティリティ関数 】==========
-
-def normalize_text(text):
-    """全角英数字・記号を半角に変換"""
-    if text is None:
-        return ""
-    return unicodedata.normalize('NFKC', str(text))
-
-def normalize_email(email):
-    """メールアドレスの全角文字を半角に変換"""
-    if email is None:
-        return ""
-    normalized = unicodedata.normalize('NFKC', str(email))
-    normalized = normalized.strip().replace(" ", "").replace("　", "")
-    return normalized
-
-def safe_write_cell(ws, cell_address, value):
-    """
-    結合セルを考慮して安全にセルに書き込む
-    """
-    try:
-        cell = ws[cell_address]
-        # 結合セルの場合、左上のセルを探す
-        for merged_range in ws.merged_cells.ranges:
-            if cell.coordinate in merged_range:
-                # 結合範囲の左上セルを取得
-                min_col, min_row, max_col, max_row = merged_range.bounds
-                top_left_cell = ws.cell(row=min_row, column=min_col)
-                top_left_cell.value = value
-                return True
-        # 結合セルでない場合、直接書き込み
-        cell.value = value
-        return True
-    except Exception as e:
-        # エラーが発生しても続行
-        return False
-
-def find_and_write_header(ws, search_text, value, search_range=(1, 10)):
-    """
-    ヘッダーテキストを検索し、その右のセルに値を書き込む
-    """
-    for row in range(search_range[0], search_range[1] + 1):
-        for col in range(1, 20):
-            try:
-                cell = ws.cell(row=row, column=col)
-                if cell.value and search_text in str(cell.value):
-                    # 右隣のセルに書き込み
-                    for next_col in range(col + 1, col + 5):
-                        try:
-                            next_cell = ws.cell(row=row, column=next_col)
-                            # 結合セルかチェック
-                            is_merged = False
-                            for merged_range in ws.merged_cells.ranges:
-                                if next_cell.coordinate in merged_range:
-                                    min_col, min_row, max_col, max_row = merged_range.bounds
-                                    ws.cell(row=min_row, column=min_col).value = value
-                                    is_merged = True
-                                    return True
-                            if not is_merged:
-                                next_cell.value = value
-                                return True
-                        except:
-                            continue
-            except:
-                continue
-    return False
+if 'photo_refs' not in st.session_state:
+    st.session_state.photo_refs = {}
+if 'photo_previews' not in st.session_state:
+    st.session_state.photo_previews = {}
+if 'photo_file_ids' not in st.session_state:
+    st.session_state.photo_file_ids = {}
+if 'photo_hashes' not in st.session_state:
+    st.session_state.photo_hashes = {}
+if 'photo_warnings' not in st.session_state:
+    st.session_state.photo_warnings = {}
+if 'photo_errors' not in st.session_state:
+    st.session_state.photo_errors = {}
+if 'report_files' not in st.session_state:
+    st.session_state.report_files = []
+if 'report_job' not in st.session_state:
+    st.session_state.report_job = None
+if 'outbox_ids' not in st.session_state:
+    st.session_state.outbox_ids = []
+if 'history_entry' not in st.session_state:
+    st.session_state.history_entry = None
+if 'draft_id' not in st.session_state:
+    st.session_state.draft_id = None
+if 'draft_header' not in st.session_state:
+    st.session_state.draft_header = {}
+if 'inspection_date' not in st.session_state:
+    st.session_state.inspection_date = datetime.now().date()
 
 # ========== 【 関数定義 】==========
 
-def load_manual():
-    """入荷検査マニュアル Excel を読み込み、検査項目を抽出"""
-    try:
-        wb = openpyxl.load_workbook(MANUAL_FILE)
-        ws = wb.worksheets[0]
-        
-        items = []
-        for row_idx, row in enumerate(ws.iter_rows(min_row=11, max_row=45, values_only=False), 1):
-            
-            if row_idx in [30, 31]:
-                continue
+@st.cache_resource
+def setup_metrics():
+    """計測値の JSON ログ出力を設定する（プロセスで 1 回）"""
+    if METRICS_LOG:
+        metrics.configure_json_log(METRICS_LOG)
+    return True
 
-            category_cell = row[0]
-            description_cell = row[3]
-            
-            row_content = ""
-            for cell in row:
-                if cell.value is not None:
-                    row_content += str(cell.value).strip() 
-
-            EXCLUDE_KEYWORDS = ["作製部署", "作成部署", "作成者", "作製者", "制定日", "改訂日", "版数", "承認"]
-            
-            cleaned_row_content = (
-                row_content
-                .replace(" ", "")
-                .replace("　", "")
-                .replace("：", "")
-                .replace(":", "")
-            )
+@st.cache_resource
+def get_manual_registry():
+    """全セッションで共有するマニュアルの一覧"""
+    return ManualRegistry(MANUAL_DIR, default_path=MANUAL_FILE)
 
-            is_excluded = False
-            for keyword in EXCLUDE_KEYWORDS:
-                if keyword in cleaned_row_content:
-                    is_excluded = True
-                    break
+def current_manual():
+    """選択中のマニュアル（未登録なら None）"""
+    try:
+        return get_manual_registry().get(st.session_state.get('manual_key'))
+    except KeyError:
+        return None
 
-            if is_excluded:
-                continue
-            
-            if category_cell.value or description_cell.value:
-                category = category_cell.value or ""
-                description = description_cell.value or ""
-                
-                if str(description).strip():
-                    actual_row = row_idx + 10
-                    items.append({
-                        'id': f"item_{row_idx}",
-                        'category': str(category).strip(),
-                        'description': str(description).strip(),
-                        'row': row_idx,
-                        'excel_row': actual_row
-                    })
-        
-        return items
+@metrics.timed("load_manual")
+def load_manual():
+    """選択中の入荷検査マニュアル Excel を読み込み、検査項目を抽出（キャッシュ経由）"""
+    try:
+        manual = current_manual()
+        if manual is None:
+            return []
+        return get_manual_registry().load(manual['key'])['items']
 
     except Exception as e:
         st.error(f"マニュアル読込エラー: {e}")
         return []
         
+@metrics.timed("load_masters")
 def load_masters():
-    """検査者マスター Excel を読み込み"""
+    """検査者マスター Excel を読み込み（更新されたときだけ読み直す共有キャッシュ）"""
     try:
-        df = pd.read_excel(MASTER_FILE, sheet_name="検査者一覧")
-        if 'メールアドレス' in df.columns:
-            df['メールアドレス'] = df['メールアドレス'].apply(normalize_email)
-        return df
+        return load_master(MASTER_FILE)
     except Exception as e:
         st.error(f"❌ マスター読込エラー: {e}")
         return pd.DataFrame()
 
 def save_config(emails):
-    """メール送信先を保存"""
+    """メール送信先を保存（内容が変わったときだけ書き込む）"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump({'selected_emails': emails}, f, ensure_ascii=False)
+        save_config_if_changed(CONFIG_FILE, {'selected_emails': list(emails)})
     except Exception as e:
         st.warning(f"⚠️ 設定保存エラー: {e}")
 
-def create_excel_report(inspection_data, photo_bytes, manual_items, writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date):
+@st.cache_resource
+def get_history():
+    """
+    全セッションで共有する検査履歴データベース
+    マニュアルのキーが記録されていない古い検査には、版が一致する登録済みのマニュアルのキーを記録する
+    """
+    history = InspectionHistory(HISTORY_DB)
+    # 以前はアップロード時に登録していたため、保存されなかった写真のハッシュが残っていることがある
+    history.prune_photo_hashes()
+    versions = history.versions_without_manual_key()
+    if versions:
+        registry = get_manual_registry()
+        for manual in registry.entries():
+            try:
+                version = registry.load(manual['key'])['version']
+            except Exception:
+                continue
+            if version in versions:
+                history.assign_manual_key(version, manual['key'])
+    return history
+
+@st.cache_resource
+def get_drafts():
+    """全セッションで共有する下書きジャーナル（起動時に古い下書きを削除）"""
+    drafts = DraftJournal(DRAFTS_DB, compact_every=DRAFT_COMPACT_EVERY)
+    drafts.purge(DRAFT_MAX_AGE_DAYS * 24 * 3600)
+    return drafts
+
+@st.cache_resource
+def get_photo_store():
+    """全セッションで共有する写真ストア（検査履歴・下書きから参照中の写真は容量超過でも削除しない）"""
+    return PhotoStore(
+        PHOTO_DIR,
+        max_bytes=PHOTO_STORE_MAX_BYTES,
+        protected=lambda: get_history().referenced_photos() | get_drafts().referenced_photos()
+    )
+
+def photo_paths(photo_refs):
+    """写真の参照（ハッシュ）をストア上のファイルパスに変換"""
+    store = get_photo_store()
+    store.touch(*photo_refs.values())
+    return {item_id: store.path(ref) for item_id, ref in photo_refs.items()}
+
+@st.cache_resource
+def get_job_pool():
+    """全セッションで共有するワーカープール（レポート作成・写真の取り込み）"""
+    return JobPool(max_workers=JOB_WORKERS, kind=JOB_WORKER_KIND)
+
+def submit_report_job(report_format, manual_items, writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date):
+    """
+    レポート作成（Excel はマニュアルのフォーマットに書き込み、PDF は A4 にまとめる）をワーカーに投入する
+    ジョブ ID はセッションに保存し、collect_report_job() で結果を受け取る
     """
-    元のマニュアルフォーマットに検査結果を書き込み
-    写真は別シートに配置
+    request = report_request(
+        report_format, st.session_state.inspection_data, photo_paths(st.session_state.photo_refs),
+        manual_items, current_manual(), writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date
+    )
+    job = get_job_pool().submit(build_report_files, request, label="report")
+    st.session_state.report_job = (job.id, (writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date))
+
+def collect_report_job(manual_items):
+    """
+    投入済みのレポート作成ジョブの完了を待ち、履歴に保存してセッションに結果を残す
+    待っている間は GIL を手放すので、他のセッションは止まらない
+    戻り値: 作成したファイル [(ファイル名, バイト列, MIME タイプ), ...]（まだ終わっていない・失敗は []）
     """
+    job_id, header = st.session_state.report_job
+    pool = get_job_pool()
+    job = pool.get(job_id)
+    if job is None:
+        st.session_state.report_job = None
+        st.warning("⚠️ レポート作成ジョブが見つかりません。もう一度生成してください")
+        return []
+    
     try:
-        # 元のマニュアルを読み込み
-        wb = openpyxl.load_workbook(MANUAL_FILE)
-        ws = wb.worksheets[0]
-        
-        # ========== ヘッダー情報を書き込み（検索して書き込み）==========
-        find_and_write_header(ws, "IN.no", in_no, (1, 10))
-        find_and_write_header(ws, "IN.no", in_no, (1, 10))
-        find_and_write_header(ws, "OR.no", "", (1, 10))
-        find_and_write_header(ws, "本体S/N", inspector_id, (1, 10))
-        find_and_write_header(ws, "ロットNo", lot_no, (1, 10))
-        find_and_write_header(ws, "入荷日", str(inspection_date), (1, 10))
-        find_and_write_header(ws, "検査日", str(inspection_date), (1, 10))
-        
-        # ========== 検査結果を書き込み ==========
-        for item in manual_items:
-            item_id = item['id']
-            excel_row = item['excel_row']
-            
-            if item_id in inspection_data:
-                is_pass = inspection_data[item_id].get('pass', True)
-                
-                # V〜Y列（22〜25列）をチェックして「□可　□否」を探す
-                for col in range(21, 26):
-                    try:
-                        cell = ws.cell(row=excel_row, column=col)
-                        
-                        # 結合セルの場合、左上セルを取得
-                        actual_cell = cell
-                        for merged_range in ws.merged_cells.ranges:
-                            if cell.coordinate in merged_range:
-                                min_col, min_row, max_col, max_row = merged_range.bounds
-                                actual_cell = ws.cell(row=min_row, column=min_col)
-                                break
-                        
-                        if actual_cell.value:
-                            cell_value = str(actual_cell.value)
-                            if '□可' in cell_value or '□否' in cell_value:
-                                if is_pass:
-                                    new_value = cell_value.replace('□可', '☑可')
-                                else:
-                                    new_value = cell_value.replace('□否', '☑否')
-                                actual_cell.value = new_value
-                                break
-                    except Exception as cell_error:
-                        continue
-        
-        # ========== 写真シートを作成 ==========
-        if photo_bytes:
-            ws_photo = wb.create_sheet(title="検査写真")
-            
-            # ヘッダー
-            ws_photo['A1'] = "検査写真一覧"
-            ws_photo['A1'].font = Font(bold=True, size=16)
-            ws_photo.merge_cells('A1:D1')
-            
-            ws_photo['A3'] = "No."
-            ws_photo['B3'] = "カテゴリ"
-            ws_photo['C3'] = "検査項目"
-            ws_photo['D3'] = "写真"
-            
-            for cell in ['A3', 'B3', 'C3', 'D3']:
-                ws_photo[cell].font = Font(bold=True)
-                ws_photo[cell].fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-                ws_photo[cell].font = Font(bold=True, color="FFFFFF")
-            
-            ws_photo.column_dimensions['A'].width = 6
-            ws_photo.column_dimensions['B'].width = 15
-            ws_photo.column_dimensions['C'].width = 40
-            ws_photo.column_dimensions['D'].width = 30
-            
-            row = 4
-            photo_count = 0
-            
-            for idx, item in enumerate(manual_items):
-                item_id = item['id']
-                
-                if item_id in photo_bytes and photo_bytes[item_id]:
-                    photo_count += 1
-                    
-                    ws_photo[f'A{row}'] = photo_count
-                    ws_photo[f'B{row}'] = item['category']
-                    ws_photo[f'C{row}'] = item['description'][:50]
-                    
-                    try:
-                        img_data = BytesIO(photo_bytes[item_id])
-                        img = PILImage.open(img_data)
-                        
-                        max_width = 150
-                        ratio = max_width / img.width
-                        new_height = int(img.height * ratio)
-                        img = img.resize((max_width, new_height))
-                        
-                        img_buffer = BytesIO()
-                        img.save(img_buffer, format='PNG')
-                        img_buffer.seek(0)
-                        
-                        xl_img = XLImage(img_buffer)
-                        ws_photo.add_image(xl_img, f'D{row}')
-                        
-                        ws_photo.row_dimensions[row].height = max(new_height * 0.75, 100)
-                        
-                    except Exception as img_error:
-                        ws_photo[f'D{row}'] = f"写真読込エラー"
-                    
-                    row += 1
-            
-            if photo_count == 0:
-                ws_photo['A4'] = "写真はありません"
-        
-        # メモリに保存
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-        
-        return output
-        
+        with st.spinner(f"📊 レポートを作成中...（{JOB_STATUS_LABELS[job.status]}）"):
+            report_files, errors = job.result(timeout=REPORT_TIMEOUT)
+    except TimeoutError:
+        st.info("⏳ レポートを作成中です。しばらくしてから画面を更新してください")
+        return []
     except Exception as e:
-        st.error(f"❌ Excel 作成エラー: {e}")
         import traceback
-        st.error(traceback.format_exc())
+        report_files, errors = [], [("レポート", str(e), traceback.format_exc())]
+    st.session_state.report_job = None
+    pool.forget(job_id)
+    
+    for fmt, message, detail in errors:
+        st.error(f"❌ {fmt} 作成エラー: {message}")
+        st.error(detail)
+    if report_files:
+        save_history(manual_items, *header)
+        st.session_state.report_files = report_files
+    return report_files
+
+def save_history(manual_items, writer_name, reviewer_name, inspector_id, lot_no, in_no, inspection_date):
+    """
+    レポートを生成した検査を履歴に保存する
+    同じセッションで S/N・IN.NO・ロットNO が同じまま再生成した場合は上書きする
+    """
+    key = (inspector_id, in_no, lot_no)
+    previous = st.session_state.history_entry
+    try:
+        with metrics.timed("history_save"):
+            inspection_id = get_history().save_inspection(
+                {
+                    'serial': normalize_text(inspector_id).strip(),
+                    'in_no': normalize_text(in_no).strip(),
+                    'lot_no': normalize_text(lot_no).strip(),
+                    'writer': writer_name,
+                    'reviewer': reviewer_name,
+                    'inspection_date': inspection_date,
+                },
+                {item_id: data['pass'] for item_id, data in st.session_state.inspection_data.items()},
+                st.session_state.photo_refs,
+                manual_items,
+                get_manual_registry().load(st.session_state.manual_key)['version'],
+                inspection_id=previous[1] if previous and previous[0] == key else None,
+                manual_key=st.session_state.manual_key,
+                photo_hashes=st.session_state.photo_hashes
+            )
+        st.session_state.history_entry = (key, inspection_id)
+        return inspection_id
+    except Exception as e:
+        st.warning(f"⚠️ 履歴保存エラー: {e}")
         return None
 
-def send_email_smtp(recipient_emails, subject, body, excel_data, filename):
-    """SMTP 経由でメール送信（Excel 添付）"""
+def load_smtp_settings():
+    """Streamlit secrets から SMTP 設定を取得（未設定なら None）"""
+    return smtp_settings(st.secrets)
+
+@st.cache_resource
+def get_outbox():
+    """全セッションで共有するメール送信キュー（バックグラウンドで送信）"""
+    outbox = Outbox(
+        OUTBOX_DB, load_smtp_settings(),
+        digest_window=DIGEST_WINDOW_MINUTES * 60,
+        digest_max_bytes=DIGEST_MAX_MB * 1024 ** 2,
+        digest_mode=DIGEST_MODE
+    )
+    outbox.start()
+    return outbox
+
+def send_email_smtp(recipient_emails, subject, body, attachments, summary=None):
+    """
+    メール（レポート添付）を送信キューに登録する
+    attachments: [(ファイル名, バイト列, MIME タイプ), ...]
+    summary を渡すとまとめ送信に登録する（同じ送信先の検査と 1 通にまとめる）
+    実際の SMTP 送信はバックグラウンドで行う。戻り値: メッセージ ID（失敗時は None）
+    """
     try:
-        smtp_server = st.secrets.get("SMTP_SERVER")
-        smtp_port = st.secrets.get("SMTP_PORT", "587")
-        smtp_email = st.secrets.get("SMTP_EMAIL")
-        smtp_password = st.secrets.get("SMTP_PASSWORD")
+        settings = load_smtp_settings()
         
-        if not all([smtp_server, smtp_email, smtp_password]):
+        if settings is None:
             st.error("""
             ❌ SMTP 設定が見つかりません。
             
@@ -346,51 +333,245 @@ def send_email_smtp(recipient_emails, subject, body, excel_data, filename):
             - SMTP_EMAIL
             - SMTP_PASSWORD
             """)
-            return False
+            return None
         
-        smtp_email = normalize_email(smtp_email)
         recipient_emails = [normalize_email(e) for e in recipient_emails]
         
-        msg = MIMEMultipart()
-        msg['From'] = smtp_email
-        msg['To'] = ', '.join(recipient_emails)
-        msg['Subject'] = Header(subject, 'utf-8')
-        
-        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        outbox = get_outbox()
+        outbox.smtp_settings = settings
+        if summary is not None:
+            return outbox.enqueue_digest(recipient_emails, subject, body, attachments, summary)
+        return outbox.enqueue(recipient_emails, subject, body, attachments)
+    
+    except Exception as e:
+        st.error(f"❌ メール送信エラー: {type(e).__name__}: {e}")
+        return None
+
+@st.fragment(run_every=5)
+def show_outbox_status():
+    """このセッションで登録したメールの送信状況（5 秒ごとに更新）"""
+    rows = get_outbox().status(st.session_state.outbox_ids)
+    status_df = pd.DataFrame([{
+        'ID': row['id'],
+        '件名': row['subject'],
+        '状態': STATUS_LABELS.get(row['status'], row['status']),
+        'まとめ': f"#{row['digest_id']}" if row['digest_id'] else "",
+        '試行回数': row['attempts'],
+        'エラー': row['last_error'] or "",
+    } for row in rows])
+    st.caption("📬 送信状況")
+    st.dataframe(status_df, use_container_width=True, hide_index=True)
+
+def record_draft(kind, key, value):
+    """
+    入力の変更を下書きに 1 件追記する
+    最初の変更で下書きを作り、URL に下書き ID を付ける（再接続時に復元するため）
+    """
+    try:
+        drafts = get_drafts()
+        if st.session_state.draft_id is None:
+            st.session_state.draft_id = drafts.create(st.session_state.draft_header)
+            st.query_params["draft"] = st.session_state.draft_id
+        with metrics.timed("draft_append"):
+            drafts.append(st.session_state.draft_id, kind, key, value)
+    except Exception as e:
+        st.warning(f"⚠️ 下書き保存エラー: {e}")
+
+def restore_draft(draft_id):
+    """下書きから入力内容をセッションに復元する。戻り値: 復元できたら True"""
+    state = get_drafts().load(draft_id)
+    if state is None:
+        return False
+    
+    restored = restore_inputs(
+        state, get_photo_store(),
+        manual_keys=[m['key'] for m in get_manual_registry().entries()],
+        names=load_masters().get('氏名', pd.Series(dtype=object)).tolist()
+    )
+    
+    st.session_state.draft_id = draft_id
+    for item_id, passed in restored['results'].items():
+        st.session_state.inspection_data[item_id] = {'pass': passed}
+    for item_id, photo in restored['photos'].items():
+        st.session_state.photo_refs[item_id] = photo['ref']
+        st.session_state.uploaded_photos[item_id] = photo['name']
+        st.session_state.photo_previews[item_id] = photo['preview']
+        st.session_state.photo_hashes[item_id] = photo['dhash']
+    for key, value in restored['fields'].items():
+        st.session_state[key] = value
+    st.session_state.draft_header = restored['header']
+    return True
+
+def open_draft(draft_id):
+    """セッションを空にして、指定の下書き（None なら新しい検査）で始め直す"""
+    if draft_id is None and st.session_state.draft_id and st.session_state.history_entry:
+        # レポートを生成済みの下書きは履歴に残っているので削除する
+        get_drafts().discard(st.session_state.draft_id)
+    st.session_state.clear()
+    if draft_id is None:
+        st.query_params.pop("draft", None)
+    else:
+        st.query_params["draft"] = draft_id
+    st.rerun()
+
+def switch_manual():
+    """
+    マニュアル（部品種別）を切り替えたら、判定・写真を空にして別の検査として始める
+    検査情報はそのまま引き継ぎ、それまでの下書きは一覧から再開できるように残す
+    """
+    for key in ("inspection_data", "photo_refs", "photo_previews", "uploaded_photos", "photo_file_ids",
+                "photo_hashes", "photo_warnings", "photo_errors"):
+        st.session_state[key] = {}
+    st.session_state.report_files = []
+    st.session_state.report_job = None
+    st.session_state.history_entry = None
+    st.session_state.draft_id = None
+    st.query_params.pop("draft", None)
+    for key in list(st.session_state):
+        if key.startswith(("result_", "photo_item_", "item_page_")) or key == "item_group":
+            del st.session_state[key]
+
+def show_metrics_panel():
+    """計測値の管理画面（URL に ?admin=1 を付けたときだけ表示）"""
+    with st.expander("🛠️ 計測（管理者向け）"):
+        tracing = st.toggle("tracemalloc でメモリを詳しく計測（処理が遅くなります）", key="metrics_tracemalloc")
+        metrics.set_memory_tracing(tracing)
         
-        part = MIMEBase('application', 'vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        excel_data.seek(0)
-        part.set_payload(excel_data.read())
-        encoders.encode_base64(part)
+        snapshot = metrics.snapshot()
+        st.caption(f"RSS: {snapshot['rss_bytes'] / 1024 ** 2:.1f} MB　"
+                   f"集計開始: {datetime.fromtimestamp(snapshot['started_at']):%Y-%m-%d %H:%M:%S}")
+        pool = get_job_pool().stats()
+        st.caption(f"ワーカー: {pool['kind']} × {pool['workers']}　" + "　".join(
+            f"{label}: {pool[status]}" for status, label in JOB_STATUS_LABELS.items()
+        ))
+        if snapshot['timers']:
+            st.dataframe(pd.DataFrame([{
+                '段階': timer['stage'] + "".join(f" {k}={v}" for k, v in timer['labels'].items()),
+                '回数': timer['count'],
+                '平均(ms)': round(timer['avg_ms'], 1),
+                '最大(ms)': round(timer['max_ms'], 1),
+                '直近(ms)': round(timer['last_ms'], 1),
+            } for timer in snapshot['timers']]), use_container_width=True, hide_index=True)
+        if snapshot['counters']:
+            st.dataframe(pd.DataFrame([{
+                'カウンター': counter['name'],
+                '値': counter['value'],
+            } for counter in snapshot['counters']]), use_container_width=True, hide_index=True)
+        if snapshot['memory']:
+            st.dataframe(pd.DataFrame([{
+                '段階': stage,
+                **{kind: f"{value / 1024 ** 2:.1f} MB" for kind, value in values.items()},
+            } for stage, values in snapshot['memory'].items()]), use_container_width=True, hide_index=True)
         
-        part.add_header(
-            'Content-Disposition',
-            'attachment',
-            filename=filename
+        st.download_button("📥 Prometheus 形式", metrics.render_prometheus(), file_name="metrics.prom",
+                           mime="text/plain")
+        st.download_button("📥 JSON", json.dumps(snapshot, ensure_ascii=False, indent=2),
+                           file_name="metrics.json", mime="application/json")
+        if st.button("🗑️ 計測値をリセット"):
+            metrics.reset()
+
+def photo_duplicate_warnings(item_id, value):
+    """
+    アップロードした写真が、この検査の他の項目や過去の検査の写真とほぼ同じなら警告文を返す
+    写真の知覚ハッシュは検査を履歴に保存するときに登録する（差し替えた・保存しなかった写真は比較対象にしない）
+    """
+    previous = st.session_state.history_entry
+    return duplicate_warnings(
+        item_id, value, st.session_state.photo_hashes,
+        {item['id']: item['description'] for item in load_manual()},
+        history=get_history(),
+        exclude_inspection=previous[1] if previous else None,
+        max_distance=PHOTO_DUPLICATE_DISTANCE
+    )
+
+@st.fragment
+def render_item(item, number):
+    """検査項目 1 件分の入力欄（操作するとこの項目だけが再実行される）"""
+    item_id = item['id']
+    st.markdown(f"### No. {number}: {item['category']}")
+    st.write(f"📝 {item['description']}")
+    
+    col_check, col_photo = st.columns([2, 3])
+    
+    with col_check:
+        current = st.session_state.inspection_data.get(item_id, {}).get('pass', True)
+        result = st.radio(
+            f"判定_{item_id}",
+            ["可", "否"],
+            index=0 if current else 1,
+            horizontal=True,
+            label_visibility="collapsed",
+            key=f"result_{item_id}"
+        )
+        st.session_state.inspection_data[item_id] = {
+            'description': item['description'],
+            'pass': result == "可",
+            'category': item['category']
+        }
+        if (result == "可") != current:
+            record_draft(KIND_RESULT, item_id, result == "可")
+    
+    with col_photo:
+        photo = st.file_uploader(
+            f"写真アップロード_{item_id}",
+            type=['jpg', 'jpeg', 'png'],
+            label_visibility="collapsed",
+            key=f"photo_{item_id}"
         )
-        msg.attach(part)
         
-        with smtplib.SMTP(smtp_server, int(smtp_port)) as server:
-            server.starttls()
-            server.login(smtp_email, smtp_password)
-            server.send_message(msg)
+        if photo:
+            # 取り込み（向き補正・縮小・再圧縮）はアップロードごとに 1 回だけ
+            # 失敗したファイルは、別のファイルがアップロードされるまで取り込み直さない
+            failed = st.session_state.photo_errors.get(item_id)
+            if (st.session_state.photo_file_ids.get(item_id) != photo.file_id
+                    and (failed is None or failed[0] != photo.file_id)):
+                try:
+                    ingested = get_job_pool().run(
+                        ingest_photo_job,
+                        photo.getvalue(), PHOTO_MAX_PX, PHOTO_QUALITY, PHOTO_FORMAT,
+                        label="photo_ingest",
+                        timeout=PHOTO_TIMEOUT
+                    )
+                    st.session_state.photo_refs[item_id] = get_photo_store().put(ingested['data'])
+                    st.session_state.photo_previews[item_id] = ingested['preview']
+                    st.session_state.photo_warnings[item_id] = photo_duplicate_warnings(item_id, ingested['dhash'])
+                    st.session_state.photo_hashes[item_id] = ingested['dhash']
+                    st.session_state.uploaded_photos[item_id] = photo.name
+                    st.session_state.photo_file_ids[item_id] = photo.file_id
+                    st.session_state.photo_errors.pop(item_id, None)
+                    record_draft(KIND_PHOTO, item_id, {
+                        'ref': st.session_state.photo_refs[item_id],
+                        'name': photo.name
+                    })
+                except Exception as e:
+                    st.session_state.photo_errors[item_id] = (
+                        photo.file_id, f"{photo.name}: {type(e).__name__}: {e}"
+                    )
+            failed = st.session_state.photo_errors.get(item_id)
+            if failed is not None and failed[0] == photo.file_id:
+                st.error(f"❌ 写真読込エラー：{failed[1]}")
         
-        return True
+        # ページを切り替えてアップローダーが空になっても、保存済みの写真は表示する
+        if item_id in st.session_state.photo_refs:
+            st.success(f"✅ 写真保存：{st.session_state.uploaded_photos.get(item_id, '')}")
+            st.image(st.session_state.photo_previews[item_id], width=200)
+            for message in st.session_state.photo_warnings.get(item_id, ()):
+                st.warning(f"⚠️ {message}")
     
-    except smtplib.SMTPAuthenticationError:
-        st.error("❌ メール認証エラー：パスワード/トークンが間違っています")
-        return False
-    except smtplib.SMTPException as e:
-        st.error(f"❌ SMTP エラー: {e}")
-        return False
-    except Exception as e:
-        st.error(f"❌ メール送信エラー: {type(e).__name__}: {e}")
-        return False
+    st.divider()
 
 # ========== 【 UI・ページレイアウト 】==========
 
 st.set_page_config(page_title="入荷検査フォーム", layout="wide")
 st.title("🔍 入荷検査フォーム")
+setup_metrics()
+
+# 接続が切れて新しいセッションになっても、URL の下書き ID から入力内容を復元する
+if st.session_state.draft_id is None and "draft" in st.query_params:
+    if restore_draft(st.query_params["draft"]):
+        st.toast("📝 保存されていた下書きから入力内容を復元しました")
+    else:
+        st.query_params.pop("draft", None)
 
 # ========== 【 サイドバー 】==========
 with st.sidebar:
@@ -421,10 +602,65 @@ with st.sidebar:
         selected_emails = []
     
     st.subheader("📋 検査情報")
-    inspector_id = st.text_input("本体S/N", placeholder="例: SN12345")
-    in_no = st.text_input("IN.NO", placeholder="例: IN001")
-    lot_no = st.text_input("ロットNO", placeholder="例: LOT001")
-    inspection_date = st.date_input("検査日", value=datetime.now())
+    manuals = {m['key']: m['name'] for m in get_manual_registry().entries()}
+    if st.session_state.get('manual_key') not in manuals:
+        st.session_state.manual_key = next(iter(manuals), None)
+    if len(manuals) > 1:
+        st.selectbox(
+            "マニュアル（部品種別）",
+            list(manuals),
+            format_func=manuals.get,
+            key="manual_key",
+            on_change=switch_manual
+        )
+    for error in get_manual_registry().errors:
+        st.warning(f"⚠️ マニュアル記述子エラー: {error}")
+    inspector_id = st.text_input("本体S/N", placeholder="例: SN12345", key="inspector_id")
+    in_no = st.text_input("IN.NO", placeholder="例: IN001", key="in_no")
+    lot_no = st.text_input("ロットNO", placeholder="例: LOT001", key="lot_no")
+    inspection_date = st.date_input("検査日", key="inspection_date")
+    
+    # 検査情報は変わった欄だけ下書きに記録する（初回表示の値は基準として覚えるだけ）
+    header_values = {
+        'manual': st.session_state.manual_key,
+        'writer': writer_name,
+        'reviewer': reviewer_name,
+        'inspector_id': inspector_id,
+        'in_no': in_no,
+        'lot_no': lot_no,
+        'inspection_date': inspection_date.isoformat() if inspection_date else None,
+    }
+    for key, value in header_changes(st.session_state.draft_header, header_values):
+        record_draft(KIND_HEADER, key, value)
+    
+    st.subheader("📝 下書き")
+    if st.session_state.draft_id:
+        st.caption(f"入力内容は自動保存されています（下書き ID: {st.session_state.draft_id[:8]}）")
+    else:
+        st.caption("入力を始めると自動保存されます")
+    saved_drafts = [d for d in get_drafts().recent() if d['draft_id'] != st.session_state.draft_id]
+    if saved_drafts:
+        draft_labels = {
+            d['draft_id']: f"{d['label'] or '（検査情報なし）'}　{datetime.fromtimestamp(d['updated_at']):%m/%d %H:%M}"
+            for d in saved_drafts
+        }
+        resume_id = st.selectbox(
+            "保存された下書き",
+            list(draft_labels),
+            format_func=draft_labels.get,
+            key="resume_draft_id"
+        )
+        if st.button("↩️ この下書きを再開", use_container_width=True):
+            open_draft(resume_id)
+    if st.session_state.draft_id and st.button("🆕 新しい検査を開始", use_container_width=True):
+        open_draft(None)
+
+    cache_stats = report.get_manual_cache().stats()
+    st.caption(f"テンプレートキャッシュ: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']}"
+               f" / {cache_stats['entries']} 件")
+    
+    if st.query_params.get("admin") == "1":
+        show_metrics_panel()
 
 # ========== 【 メインコンテンツ 】==========
 manual_items = load_manual()
@@ -434,58 +670,56 @@ if not manual_items:
 else:
     st.info(f"✅ {len(manual_items)}件の検査項目を読み込みました")
     
-    tabs = st.tabs(["検査入力", "確認・送信"])
+    # 未表示の項目も既定値（可）で集計・出力されるように初期化（下書きから復元した項目は判定を残す）
+    # 並び順はマニュアルの項目順にそろえる
+    for item in manual_items:
+        entry = st.session_state.inspection_data.pop(item['id'], {'pass': True})
+        entry.setdefault('description', item['description'])
+        entry.setdefault('category', item['category'])
+        st.session_state.inspection_data[item['id']] = entry
+    
+    tabs = st.tabs(["検査入力", "確認・送信", "履歴検索", "不合格率分析"])
     
     # ========== 【 TAB 1：検査入力 】==========
     with tabs[0]:
         st.subheader("検査項目入力")
         st.caption("各項目について「可」または「否」を選択してください")
         
-        for idx, item in enumerate(manual_items):
+        # 表示するのは選択したカテゴリ・ページの項目だけ（各項目はフラグメントで個別に再実行）
+        item_groups = group_items(manual_items)
+        col_group, col_page = st.columns([3, 1])
+        with col_group:
+            group_name = st.selectbox(
+                "カテゴリ",
+                ["すべて"] + list(item_groups),
+                format_func=lambda name: name.replace("\n", ""),
+                key="item_group"
+            )
+        entries = (
+            [(number, item) for number, item in enumerate(manual_items, 1)]
+            if group_name == "すべて" else item_groups[group_name]
+        )
+        page_count = max(1, -(-len(entries) // ITEMS_PER_PAGE))
+        with col_page:
+            page = st.selectbox(
+                "ページ",
+                list(range(1, page_count + 1)),
+                format_func=lambda p: f"{p} / {page_count}",
+                key=f"item_page_{group_name}"
+            )
+        
+        for number, item in entries[(page - 1) * ITEMS_PER_PAGE:page * ITEMS_PER_PAGE]:
             with st.container():
-                st.markdown(f"### No. {idx+1}: {item['category']}")
-                st.write(f"📝 {item['description']}")
-                
-                col_check, col_photo = st.columns([2, 3])
-                
-                with col_check:
-                    result = st.radio(
-                        f"判定_{item['id']}",
-                        ["可", "否"],
-                        horizontal=True,
-                        label_visibility="collapsed",
-                        key=f"result_{item['id']}"
-                    )
-                    st.session_state.inspection_data[item['id']] = {
-                        'description': item['description'],
-                        'pass': result == "可",
-                        'category': item['category']
-                    }
-                
-                with col_photo:
-                    photo = st.file_uploader(
-                        f"写真アップロード_{item['id']}",
-                        type=['jpg', 'jpeg', 'png'],
-                        label_visibility="collapsed",
-                        key=f"photo_{item['id']}"
-                    )
-                    
-                    if photo:
-                        photo_data = photo.getvalue()
-                        st.session_state.photo_bytes[item['id']] = photo_data
-                        st.session_state.uploaded_photos[item['id']] = photo.name
-                        st.success(f"✅ 写真保存：{photo.name}")
-                        
-                        img = PILImage.open(BytesIO(photo_data))
-                        st.image(img, width=200)
-                
-                st.divider()
+                render_item(item, number)
     
     # ========== 【 TAB 2：確認・送信 】==========
     with tabs[1]:
         st.subheader("検査結果確認・送信")
         st.caption("①Excel を確認 → ②メール送信 の流れで進めてください")
         
+        # 検査入力は項目単位で再実行されるため、集計は操作時点のものを表示する
+        st.button("🔄 最新の入力内容で再集計", key="refresh_summary")
+        
         if st.session_state.inspection_data:
             col1, col2, col3, col4 = st.columns(4)
             
@@ -498,7 +732,7 @@ else:
                 st.metric("不合格項目", failed)
             
             with col3:
-                photos = len(st.session_state.photo_bytes)
+                photos = len(st.session_state.photo_refs)
                 st.metric("写真添付数", photos)
             
             with col4:
@@ -514,7 +748,7 @@ else:
                     'カテゴリ': data['category'],
                     '検査項目': data['description'][:50],
                     '判定': "✅ 可" if data['pass'] else "❌ 否",
-                    '写真': "📷 あり" if item_id in st.session_state.photo_bytes else "なし"
+                    '写真': "📷 あり" if item_id in st.session_state.photo_refs else "なし"
                 })
             
             result_table = pd.DataFrame(result_df)
@@ -522,93 +756,249 @@ else:
             
             st.divider()
             
-            # ========== 【 ステップ 1：Excel 生成・ダウンロード 】==========
-            st.subheader("💾 ステップ 1️⃣：Excel 生成・確認")
-            st.caption("元のマニュアルフォーマットに結果を書き込み、写真は別シートに配置します")
+            # ========== 【 ステップ 1：レポート生成・ダウンロード 】==========
+            st.subheader("💾 ステップ 1️⃣：レポート生成・確認")
+            st.caption("Excel は元のマニュアルフォーマットに結果を書き込み、写真は別シートに配置します。"
+                       "PDF はスマートフォンでも見やすい一覧と写真のページにまとめます")
+            
+            report_format = st.radio("出力形式", REPORT_FORMATS, horizontal=True, key="report_format")
             
-            if st.button("📊 Excel を生成・ダウンロード", use_container_width=True):
+            if st.button("📊 レポートを生成・ダウンロード", use_container_width=True):
                 if writer_name and reviewer_name:
-                    excel_data = create_excel_report(
-                        st.session_state.inspection_data,
-                        st.session_state.photo_bytes,
-                        manual_items,
-                        writer_name, reviewer_name, inspector_id,
-                        lot_no, in_no, inspection_date
+                    submit_report_job(
+                        report_format, manual_items, writer_name, reviewer_name,
+                        inspector_id, lot_no, in_no, inspection_date
                     )
-                    if excel_data:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        filename = f"inspection_{timestamp}.xlsx"
-                        st.session_state.excel_data = excel_data
-                        st.session_state.excel_filename = filename
-                        
+                else:
+                    st.error("❌ 作業者名と確認者名を選択してください")
+            
+            # 作成はワーカーで行う（画面を操作して再実行されても、同じジョブの完了を待つ）
+            if st.session_state.report_job:
+                report_files = collect_report_job(manual_items)
+                if report_files:
+                    for filename, data, mime in report_files:
                         st.download_button(
-                            label="📥 Excel をダウンロード",
-                            data=excel_data,
+                            label=f"📥 {filename} をダウンロード（{len(data) / 1024:.0f} KB）",
+                            data=data,
                             file_name=filename,
-                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                            mime=mime,
+                            key=f"download_{filename}"
                         )
-                        st.success(f"✅ Excel 生成完了：{filename}")
+                    st.success(f"✅ レポート生成完了：{', '.join(f[0] for f in report_files)}")
+                    if any(mime == XLSX_MIME for _, _, mime in report_files):
                         st.info("📋 シート1: 検査結果（元のフォーマット）\n📷 シート2: 検査写真")
-                else:
-                    st.error("❌ 作業者名と確認者名を選択してください")
             
             st.divider()
             
             # ========== 【 ステップ 2：メール送信 】==========
             st.subheader("📧 ステップ 2️⃣：メール送信")
             
-            if selected_emails and st.session_state.excel_data:
+            if selected_emails and st.session_state.report_files:
                 st.info(f"📬 送信先： {len(selected_emails)}件 選択済み")
+                digest = st.checkbox(
+                    f"まとめて送信（同じ送信先の検査を {DIGEST_WINDOW_MINUTES} 分ごとに 1 通にまとめる）",
+                    key="send_digest"
+                )
                 
                 if st.button("📮 検査結果をメール送信", use_container_width=True, key="send_email_btn"):
-                    with st.spinner("📧 メール送信中..."):
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        filename = f"inspection_{timestamp}.xlsx"
-                        
-                        subject = f"Inspection Result - {in_no} / {lot_no}"
-                        body = f"""
-入荷検査が完了しました。
-
-【検査情報】
-本体S/N: {inspector_id}
-IN.NO: {in_no}
-ロットNO: {lot_no}
-作業者: {writer_name}
-確認者: {reviewer_name}
-検査日: {inspection_date}
-
-【結果】
-合格項目: {passed}件
-不合格項目: {failed}件
-
-詳細は添付の Excel ファイルをご確認ください。
-- シート1: 検査結果（元のフォーマット）
-- シート2: 検査写真
-
----
-入荷検査フォーム v3.4
-"""
-                        
-                        st.session_state.excel_data.seek(0)
+                    with st.spinner("📧 送信キューに登録中..."):
+                        subject, body = report_email(
+                            inspector_id, in_no, lot_no, writer_name, reviewer_name, inspection_date,
+                            passed, failed, st.session_state.report_files
+                        )
+                        summary = report_summary(
+                            inspector_id, in_no, lot_no, writer_name, reviewer_name, inspection_date,
+                            st.session_state.inspection_data
+                        ) if digest else None
                         
-                        success = send_email_smtp(
+                        message_id = send_email_smtp(
                             selected_emails,
                             subject,
                             body,
-                            st.session_state.excel_data,
-                            filename
+                            st.session_state.report_files,
+                            summary
                         )
                         
-                        if success:
-                            st.success(f"✅ メール送信完了！")
+                        if message_id is not None:
+                            st.session_state.outbox_ids.append(message_id)
+                            if digest:
+                                st.success(f"✅ まとめ送信に登録しました（{DIGEST_WINDOW_MINUTES} 分以内にまとめて送信します）")
+                            else:
+                                st.success("✅ 送信キューに登録しました（バックグラウンドで送信します）")
+                
+                if digest and st.button("📨 まとめ送信待ちを今すぐ送信", use_container_width=True, key="flush_digest_btn"):
+                    created = get_outbox().flush_digests(force=True)
+                    st.success(f"✅ まとめ送信待ちを送信キューに移しました（まとめたメール {created} 通）")
+                
+                if st.session_state.outbox_ids:
+                    show_outbox_status()
             
             elif not selected_emails:
                 st.info("📧 メール送信をご希望の場合は、サイドバーで送信先を選択してください")
-            elif not st.session_state.excel_data:
-                st.info("📊 先に「Excel を生成・ダウンロード」を実行してください")
+            elif not st.session_state.report_files:
+                st.info("📊 先に「レポートを生成・ダウンロード」を実行してください")
         
         else:
             st.info("ℹ️ 検査項目に回答してから「確認・送信」タブをご覧ください")
+    
+    # ========== 【 TAB 3：履歴検索 】==========
+    with tabs[2]:
+        st.subheader("検査履歴検索")
+        st.caption("レポートを生成した検査を検索します（条件は前方一致）")
+        
+        col_sn, col_in, col_lot = st.columns(3)
+        with col_sn:
+            search_serial = st.text_input("本体S/N", key="history_serial")
+        with col_in:
+            search_in_no = st.text_input("IN.NO", key="history_in_no")
+        with col_lot:
+            search_lot_no = st.text_input("ロットNO", key="history_lot_no")
+        
+        col_from, col_to = st.columns(2)
+        with col_from:
+            search_from = st.date_input("検査日（から）", value=None, key="history_from")
+        with col_to:
+            search_to = st.date_input("検査日（まで）", value=None, key="history_to")
+        
+        history_rows = get_history().search(
+            serial=normalize_text(search_serial).strip(),
+            in_no=normalize_text(search_in_no).strip(),
+            lot_no=normalize_text(search_lot_no).strip(),
+            date_from=search_from,
+            date_to=search_to,
+            prefix=True,
+            limit=HISTORY_PAGE_SIZE
+        )
+        
+        if history_rows:
+            if len(history_rows) == HISTORY_PAGE_SIZE:
+                st.caption(f"新しい順に {HISTORY_PAGE_SIZE} 件まで表示しています。条件を絞り込んでください")
+            history_df = pd.DataFrame([{
+                'ID': row['id'],
+                '検査日': row['inspection_date'],
+                '本体S/N': row['serial'],
+                'IN.NO': row['in_no'],
+                'ロットNO': row['lot_no'],
+                '作業者': row['writer'],
+                '確認者': row['reviewer'],
+                '不合格項目': row['failed_count'],
+                '写真': row['photo_count'],
+            } for row in history_rows])
+            st.dataframe(history_df, use_container_width=True, hide_index=True)
+            
+            detail_id = st.selectbox(
+                "詳細を表示する検査",
+                [row['id'] for row in history_rows],
+                format_func=lambda i: next(
+                    f"ID {r['id']}：{r['inspection_date']} {r['serial']} / {r['in_no']} / {r['lot_no']}"
+                    for r in history_rows if r['id'] == i
+                ),
+                key="history_detail"
+            )
+            detail = get_history().get(detail_id)
+            if detail:
+                st.dataframe(pd.DataFrame([{
+                    'カテゴリ': row['category'] or "",
+                    '検査項目': (row['description'] or row['item_id'])[:50],
+                    '判定': "✅ 可" if row['passed'] else "❌ 否",
+                    '写真': "📷 あり" if row['photo_ref'] else "なし",
+                } for row in detail['items']]), use_container_width=True, hide_index=True)
+        else:
+            st.info("ℹ️ 該当する検査履歴がありません")
+    
+    # ========== 【 TAB 4：不合格率分析 】==========
+    with tabs[3]:
+        st.subheader("不合格率分析")
+        st.caption("保存済みの検査履歴を月単位で集計した結果です（集計表から読むため全件の走査はしません）")
+        
+        col_from, col_to = st.columns(2)
+        with col_from:
+            dashboard_from = st.date_input(
+                "集計期間（から）",
+                value=(datetime.now() - timedelta(days=365)).replace(day=1),
+                key="dashboard_from"
+            )
+        with col_to:
+            dashboard_to = st.date_input("集計期間（まで）", value=datetime.now(), key="dashboard_to")
+        
+        history = get_history()
+        monthly = history.failure_rates('month', dashboard_from, dashboard_to)
+        
+        if monthly:
+            total_inspections = sum(row['inspections'] for row in monthly)
+            failed_inspections = sum(row['failed_inspections'] for row in monthly)
+            total_items = sum(row['total'] for row in monthly)
+            failed_items = sum(row['failed'] for row in monthly)
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("検査件数", total_inspections)
+            with col2:
+                st.metric("不合格のあった検査", f"{failed_inspections}（{failed_inspections / total_inspections:.1%}）")
+            with col3:
+                st.metric("項目不合格率", f"{failed_items / total_items:.2%}")
+            
+            st.markdown("#### 📈 月別 不合格率（%）")
+            st.line_chart(pd.DataFrame({
+                '項目不合格率': [row['rate'] * 100 for row in monthly],
+                '不合格のあった検査の割合': [row['failed_inspections'] / row['inspections'] * 100 for row in monthly],
+            }, index=[row['month'] for row in monthly]))
+            
+            # 項目 ID はマニュアルごとの行の位置なので、項目別・カテゴリ別はマニュアルを分けて集計する
+            manual_options = [None] + list(manuals)
+            dashboard_manual = st.selectbox(
+                "マニュアル（項目別・カテゴリ別）",
+                manual_options,
+                index=manual_options.index(st.session_state.manual_key)
+                if st.session_state.manual_key in manual_options else 0,
+                format_func=lambda key: "（すべて・マニュアル別）" if key is None else manuals[key],
+                key="dashboard_manual"
+            )
+            # 履歴にだけ残っているマニュアルはキーのまま表示する
+            manual_names = {**manuals, "": "（記録なし）"}
+            
+            st.markdown("#### 🗂️ カテゴリ別 不合格率（%）")
+            by_category = history.failure_rates('category', dashboard_from, dashboard_to, manual_key=dashboard_manual)
+            if by_category:
+                st.bar_chart(pd.DataFrame(
+                    {'不合格率': [row['rate'] * 100 for row in by_category]},
+                    index=[
+                        (row['category'] or "（未分類）") if dashboard_manual is not None
+                        else f"{manual_names.get(row['manual_key'], row['manual_key'])} / {row['category'] or '（未分類）'}"
+                        for row in by_category
+                    ]
+                ))
+            else:
+                st.info("ℹ️ このマニュアルの検査履歴は集計期間内にありません")
+            
+            st.markdown("#### 📝 項目別 不合格率")
+            # 検査内容は各行のマニュアルの版から取る（今開いているマニュアルの項目名は使わない）
+            st.dataframe(pd.DataFrame([{
+                'マニュアル': manual_names.get(row['manual_key'], row['manual_key']),
+                'カテゴリ': row['category'],
+                '検査項目': (row['description'] or row['item_id'])[:50],
+                '件数': row['total'],
+                '不合格': row['failed'],
+                '不合格率': f"{row['rate']:.1%}",
+            } for row in history.failure_rates('item', dashboard_from, dashboard_to, manual_key=dashboard_manual)]),
+                use_container_width=True, hide_index=True)
+            
+            st.markdown(f"#### 📦 ロット別 不合格率（上位 {DASHBOARD_TOP_LOTS} 件）")
+            st.dataframe(pd.DataFrame([{
+                'ロットNO': row['lot_no'] or "（未入力）",
+                '検査件数': row['inspections'],
+                '不合格のあった検査': row['failed_inspections'],
+                '項目不合格率': f"{row['rate']:.1%}",
+            } for row in history.failure_rates('lot', dashboard_from, dashboard_to, limit=DASHBOARD_TOP_LOTS)]),
+                use_container_width=True, hide_index=True)
+        else:
+            st.info("ℹ️ 集計期間内の検査履歴がありません")
 
 st.divider()
 st.caption("入荷検査フォーム v3.4 | 結合セル対応版")
+
+metrics.observe("rerun", time.perf_counter() - rerun_started)
+try:
+    metrics.export_if_due(METRICS_FILE, METRICS_EXPORT_INTERVAL)
+except OSError:
+    pass
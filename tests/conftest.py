@@ -0,0 +1,8 @@
+"""
+テスト共通の設定（リポジトリ直下の inspection パッケージを読み込めるようにする）
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,71 @@
+"""
+下書き（inspection.drafts）のテスト
+"""
+
+from datetime import date
+from io import BytesIO
+
+from inspection.drafts import KIND_HEADER, KIND_PHOTO, KIND_RESULT, DraftJournal, header_changes, restore_inputs
+from inspection.photo_store import PhotoStore
+
+
+def jpeg(color):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (320, 240), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_create_records_header_before_first_change(tmp_path):
+    drafts = DraftJournal(tmp_path / "drafts.sqlite3")
+    draft_id = drafts.create({'inspector_id': "SN-1", 'lot_no': "LOT-1"})
+    drafts.append(draft_id, KIND_RESULT, "item_11", False)
+
+    state = drafts.load(draft_id)
+    assert state['header'] == {'inspector_id': "SN-1", 'lot_no': "LOT-1"}
+    assert state['results'] == {"item_11": False}
+    assert drafts.recent()[0]['label']
+
+
+def test_header_changes_skips_first_values_and_reports_changes():
+    known = {}
+    assert header_changes(known, {'in_no': "IN-1", 'lot_no': ""}) == []
+    assert known == {'in_no': "IN-1", 'lot_no': ""}
+
+    assert header_changes(known, {'in_no': "IN-1", 'lot_no': "LOT-2"}) == [('lot_no', "LOT-2")]
+    assert known['lot_no'] == "LOT-2"
+
+
+def test_restore_inputs_keeps_only_known_values(tmp_path):
+    store = PhotoStore(tmp_path / "photos", max_bytes=None)
+    kept = store.put(jpeg("red"))
+    drafts = DraftJournal(tmp_path / "drafts.sqlite3")
+    draft_id = drafts.create()
+    for kind, key, value in [
+        (KIND_RESULT, "item_11", False),
+        (KIND_PHOTO, "item_11", {'ref': kept, 'name': "kept.jpg"}),
+        (KIND_PHOTO, "item_12", {'ref': "0" * 64, 'name': "missing.jpg"}),
+        (KIND_HEADER, 'manual', "power_unit"),
+        (KIND_HEADER, 'writer', "退職者"),
+        (KIND_HEADER, 'reviewer', "確認 太郎"),
+        (KIND_HEADER, 'lot_no', "LOT-1"),
+        (KIND_HEADER, 'inspection_date', "2026-01-31"),
+    ]:
+        drafts.append(draft_id, kind, key, value)
+
+    restored = restore_inputs(drafts.load(draft_id), store, manual_keys=["power_unit"], names=["確認 太郎"])
+
+    assert restored['results'] == {"item_11": False}
+    assert list(restored['photos']) == ["item_11"]
+    photo = restored['photos']["item_11"]
+    assert photo['ref'] == kept and photo['name'] == "kept.jpg"
+    assert photo['preview'][:2] == b"\xff\xd8"
+    assert isinstance(photo['dhash'], int)
+    assert restored['fields'] == {
+        'manual_key': "power_unit",
+        'reviewer': "確認 太郎",
+        'lot_no': "LOT-1",
+        'inspection_date': date(2026, 1, 31),
+    }
+    assert restored['header']['writer'] == "退職者"
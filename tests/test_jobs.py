@@ -0,0 +1,20 @@
+"""
+ワーカープール（inspection.jobs）のテスト
+"""
+
+from inspection.jobs import report_request
+
+
+def test_report_request_selects_formats_and_manual():
+    manual = {'key': "power_unit", 'path': "manuals/power_unit.xlsx", 'layout': {'item_rows': [11, 45]}}
+    request = report_request(
+        "Excel + PDF", {"item_11": {'pass': True}}, {"item_11": "photos/ab/abcd"}, [], manual,
+        "作業 花子", "確認 太郎", "SN-1", "LOT-1", "IN-1", "2026-01-31"
+    )
+
+    assert request['formats'] == ["Excel", "PDF"]
+    assert request['manual_path'] == "manuals/power_unit.xlsx"
+    assert request['layout'] == {'item_rows': [11, 45]}
+    assert request['serial'] == "SN-1" and request['in_no'] == "IN-1"
+    assert len(request['timestamp']) == len("20260131_120000")
+    assert report_request("PDF", {}, {}, [], manual, "", "", "", "", "", None)['formats'] == ["PDF"]
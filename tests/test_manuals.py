@@ -0,0 +1,18 @@
+"""
+マニュアルの登録簿（inspection.manuals）のテスト
+"""
+
+from inspection.manuals import group_items
+
+
+def test_group_items_continues_previous_category():
+    items = [
+        {'id': "item_11", 'category': "外観"},
+        {'id': "item_12", 'category': ""},
+        {'id': "item_13", 'category': "動作"},
+    ]
+    groups = group_items([{'id': "item_10", 'category': ""}] + items)
+
+    assert list(groups) == ["その他", "外観", "動作"]
+    assert [(number, item['id']) for number, item in groups["外観"]] == [(2, "item_11"), (3, "item_12")]
+    assert groups["動作"][0][0] == 4
@@ -0,0 +1,108 @@
+"""
+メール送信キュー（inspection.outbox）のテスト
+"""
+
+import sqlite3
+import time
+
+from inspection.outbox import STATUS_PENDING, STATUS_SENDING, STATUS_SENT, Outbox
+
+SETTINGS = {'server': "localhost", 'port': 25, 'email': "sender@example.com", 'password': "", 'starttls': False}
+
+
+class FakeSMTP:
+    """送ったメールの件名を記録する偽の SMTP"""
+
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def send_message(self, msg):
+        FakeSMTP.sent.append(str(msg['Subject']))
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def make_outbox(path, **kwargs):
+    return Outbox(path, SETTINGS, smtp_factory=FakeSMTP, **kwargs)
+
+
+def row(path, message_id):
+    conn = sqlite3.connect(path)
+    try:
+        conn.row_factory = sqlite3.Row
+        return dict(conn.execute("SELECT * FROM messages WHERE id = ?", (message_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def test_claimed_message_is_not_sent_again_by_another_outbox(tmp_path):
+    FakeSMTP.sent = []
+    path = tmp_path / "outbox.sqlite3"
+    first = make_outbox(path)
+    message_id = first.enqueue(["qa@example.com"], "点検結果", "本文")
+
+    # 1 つ目のインスタンスが取り出して送信中にする
+    claimed = first._claim_due(time.time())
+    assert [message['id'] for message in claimed] == [message_id]
+    claim = row(path, message_id)
+    assert claim['status'] == STATUS_SENDING
+    assert claim['claimed_by'] == first.worker_id
+    assert claim['claimed_at'] is not None
+
+    # 2 つ目のインスタンス（別の画面・再起動したプロセス）は起動しても送信中のメールに触れない
+    second = make_outbox(path)
+    assert row(path, message_id)['status'] == STATUS_SENDING
+    assert second.drain_once() == 0
+    assert FakeSMTP.sent == []
+
+    # 1 つ目が送り終えても 2 つ目が送り直すことはない
+    first._mark_sent(message_id)
+    assert second.drain_once() == 0
+    assert FakeSMTP.sent == []
+    assert row(path, message_id)['status'] == STATUS_SENT
+
+
+def test_stale_claim_is_released_after_lease_timeout(tmp_path):
+    FakeSMTP.sent = []
+    path = tmp_path / "outbox.sqlite3"
+    first = make_outbox(path, lease_timeout=60.0)
+    message_id = first.enqueue(["qa@example.com"], "点検結果", "本文")
+    first._claim_due(time.time())
+
+    # 取り出したプロセスが送信途中で止まり、lease_timeout を過ぎた
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE messages SET claimed_at = ? WHERE id = ?", (time.time() - 120, message_id))
+    conn.close()
+
+    second = make_outbox(path, lease_timeout=60.0)
+    released = row(path, message_id)
+    assert released['status'] == STATUS_PENDING
+    assert released['claimed_by'] is None
+    assert second.drain_once() == 1
+    assert FakeSMTP.sent == ["点検結果"]
+    assert row(path, message_id)['status'] == STATUS_SENT
+
+
+def test_worker_loop_releases_stale_claims(tmp_path):
+    FakeSMTP.sent = []
+    path = tmp_path / "outbox.sqlite3"
+    outbox = make_outbox(path, lease_timeout=60.0)
+    message_id = outbox.enqueue(["qa@example.com"], "点検結果", "本文")
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute(
+            "UPDATE messages SET status = ?, claimed_at = ?, claimed_by = ? WHERE id = ?",
+            (STATUS_SENDING, time.time() - 120, "other-worker", message_id)
+        )
+    conn.close()
+
+    # 起動済みのインスタンスでも、送信のたびに期限切れの送信中のメールを戻して送る
+    assert outbox.drain_once() == 1
+    assert FakeSMTP.sent == ["点検結果"]
@@ -0,0 +1,45 @@
+"""
+写真の知覚ハッシュ（inspection.photo_index）のテスト
+"""
+
+from inspection.photo_index import duplicate_warnings
+
+PHOTO = 0x0F0F_3C3C_5A5A_A5A5
+DESCRIPTIONS = {"item_11": "外観に傷が無いこと", "item_12": "ラベルの貼付位置"}
+
+
+class FakeHistory:
+    def __init__(self, matches=(), error=None):
+        self.matches = list(matches)
+        self.error = error
+        self.calls = []
+
+    def similar_photos(self, value, max_distance, exclude_inspection=None, limit=10):
+        self.calls.append((value, max_distance, exclude_inspection, limit))
+        if self.error:
+            raise self.error
+        return self.matches
+
+
+def test_warns_about_same_photo_on_another_item():
+    warnings = duplicate_warnings("item_12", PHOTO ^ 0b11, {"item_11": PHOTO, "item_12": PHOTO}, DESCRIPTIONS)
+    assert warnings == ["この検査の「外観に傷が無いこと」の写真とほぼ同じです（差 2）"]
+
+
+def test_ignores_distant_and_uninformative_photos():
+    assert duplicate_warnings("item_12", PHOTO, {"item_11": ~PHOTO & (2 ** 64 - 1)}, DESCRIPTIONS) == []
+    history = FakeHistory()
+    assert duplicate_warnings("item_12", 0, {"item_11": 0}, DESCRIPTIONS, history=history) == []
+    assert history.calls == []
+
+
+def test_reports_past_inspections_and_history_errors():
+    history = FakeHistory([{'inspection_id': 7, 'inspection_date': "2026-01-31", 'serial': "SN-1",
+                            'lot_no': "", 'distance': 1}])
+    warnings = duplicate_warnings("item_12", PHOTO, {}, DESCRIPTIONS, history=history, exclude_inspection=3,
+                                  max_distance=6)
+    assert warnings == ["過去の検査（ID 7・2026-01-31・S/N SN-1・ロット -）の写真とほぼ同じです（差 1）"]
+    assert history.calls == [(PHOTO, 6, 3, 3)]
+
+    warnings = duplicate_warnings("item_12", PHOTO, {}, DESCRIPTIONS, history=FakeHistory(error=OSError("locked")))
+    assert warnings == ["類似写真を確認できませんでした: locked"]
@@ -0,0 +1,47 @@
+"""
+写真ストア（inspection.photo_store）のテスト
+"""
+
+import os
+import time
+
+from inspection.drafts import KIND_PHOTO, DraftJournal
+from inspection.history import InspectionHistory
+from inspection.photo_store import PhotoStore, main
+
+MANUAL_ITEMS = [
+    {'id': "item_11", 'category': "外観", 'description': "傷が無いこと", 'excel_row': 11},
+    {'id': "item_12", 'category': "", 'description': "汚れが無いこと", 'excel_row': 12},
+]
+
+
+def put_old(store, data, age):
+    """写真を保存し、最終利用時刻を age 秒前にする"""
+    digest = store.put(data)
+    old = time.time() - age
+    os.utime(store.path(digest), (old, old))
+    return digest
+
+
+def test_gc_keeps_photos_referenced_from_history_and_drafts(tmp_path):
+    store = PhotoStore(tmp_path / "photos", max_bytes=None)
+    age = 30 * 24 * 3600
+    in_history = put_old(store, b"history photo", age)
+    in_draft = put_old(store, b"draft photo", age)
+    orphan = put_old(store, b"orphan photo", age)
+
+    history = InspectionHistory(tmp_path / "history.sqlite3")
+    history.save_inspection(
+        {'serial': "SN-1", 'inspection_date': "2026-01-31"},
+        {"item_11": True, "item_12": True}, {"item_11": in_history}, MANUAL_ITEMS, "v1"
+    )
+    drafts = DraftJournal(tmp_path / "drafts.sqlite3")
+    draft_id = drafts.create()
+    drafts.append(draft_id, KIND_PHOTO, "item_12", {'ref': in_draft, 'name': "draft.jpg"})
+
+    main(["--root", str(tmp_path / "photos"), "gc",
+          "--history", str(tmp_path / "history.sqlite3"), "--drafts", str(tmp_path / "drafts.sqlite3")])
+
+    assert store.exists(in_history)
+    assert store.exists(in_draft)
+    assert not store.exists(orphan)